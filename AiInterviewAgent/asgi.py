@@ -13,6 +13,7 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from interview_manager import routing as client_media_routing
+from AiInterviewAgent.lifespan import lifespan_app
 
 if os.name == 'nt':
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
@@ -24,4 +25,5 @@ application = ProtocolTypeRouter({
             client_media_routing.websocket_urlpatterns  # 使用自定义的路由
         )
     ),
+    "lifespan": lifespan_app,
 })
\ No newline at end of file
@@ -0,0 +1,36 @@
+# AiInterviewAgent/lifespan.py
+"""
+ASGI lifespan 处理：服务启动时预生成首问池（需开启 INTERVIEW_FIRST_QUESTION_POOL_WARMUP），服务关闭时等待后台评估完成并释放进程级共享资源
+"""
+import logging
+
+from django.conf import settings
+
+from evaluation_system.http_client import close_client_session
+
+logger = logging.getLogger(__name__)
+
+
+async def lifespan_app(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if getattr(settings, "INTERVIEW_FIRST_QUESTION_POOL_WARMUP", False):
+                try:
+                    from interview_manager.question_pool import warm_up_first_question_pools
+                    await warm_up_first_question_pools()
+                except Exception as e:
+                    logger.error(f"首问池预生成启动失败: {str(e)}", exc_info=True)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            try:
+                from interview_manager.evaluation_jobs import evaluation_scheduler
+                await evaluation_scheduler.drain(timeout=getattr(settings, "INTERVIEW_EVALUATION_DRAIN_TIMEOUT", 30))
+            except Exception as e:
+                logger.error(f"等待后台评估任务失败: {str(e)}", exc_info=True)
+            try:
+                await close_client_session()
+            except Exception as e:
+                logger.error(f"关闭共享资源失败: {str(e)}", exc_info=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -218,10 +218,56 @@ CHANNEL_LAYERS = {
     },
 }
 
+# 面试WebSocket会话接收队列（背压）配置
+INTERVIEW_TURN_QUEUE_SIZE = int(os.getenv('INTERVIEW_TURN_QUEUE_SIZE', '4'))  # 回答队列（音频/文本）最大排队数
+INTERVIEW_MEDIA_QUEUE_SIZE = int(os.getenv('INTERVIEW_MEDIA_QUEUE_SIZE', '16'))  # 媒体队列（视频/图片）最大排队数
+INTERVIEW_MEDIA_QUEUE_WORKERS = int(os.getenv('INTERVIEW_MEDIA_QUEUE_WORKERS', '2'))  # 媒体队列工作协程数
+INTERVIEW_STREAM_QUESTION_TEXT = os.getenv('INTERVIEW_STREAM_QUESTION_TEXT', 'True').lower() == 'true'  # 问题文本逐段推送
+INTERVIEW_STREAM_TTS = os.getenv('INTERVIEW_STREAM_TTS', 'True').lower() == 'true'  # 问题语音边合成边推送
+INTERVIEW_TTS_PIPELINE = os.getenv('INTERVIEW_TTS_PIPELINE', 'True').lower() == 'true'  # 按句流水线：边生成问题文本边合成语音
+INTERVIEW_TTS_PIPELINE_CONCURRENCY = int(os.getenv('INTERVIEW_TTS_PIPELINE_CONCURRENCY', '3'))  # 同时合成的句子数
+INTERVIEW_FIRST_QUESTION_POOL_SIZE = int(os.getenv('INTERVIEW_FIRST_QUESTION_POOL_SIZE', '3'))  # 每个场景预生成的首问数量，0表示关闭
+INTERVIEW_FIRST_QUESTION_POOL_WARMUP = os.getenv('INTERVIEW_FIRST_QUESTION_POOL_WARMUP', 'False').lower() == 'true'  # 服务启动时预生成首问（每个工作进程都会调用大模型和语音合成，默认关闭）
+INTERVIEW_PREPARED_QUESTION_TTL = int(os.getenv('INTERVIEW_PREPARED_QUESTION_TTL', '600'))  # 创建会话时提前准备的首问保留时间(单位:s)
+INTERVIEW_TURN_STATE_TTL = int(os.getenv('INTERVIEW_TURN_STATE_TTL', '21600'))  # 会话轮次状态（重连回放用）缓存时间(单位:s)
+INTERVIEW_QUESTION_IN_FLIGHT_TTL = int(os.getenv('INTERVIEW_QUESTION_IN_FLIGHT_TTL', '300'))  # 正在生成问题标记的缓存时间(单位:s)，进程异常退出时标记随之过期
+INTERVIEW_COMBINED_TURN = os.getenv('INTERVIEW_COMBINED_TURN', 'True').lower() == 'true'  # 评估回答和生成下一个问题合并为一次大模型调用
+INTERVIEW_DEFERRED_EVALUATION = os.getenv('INTERVIEW_DEFERRED_EVALUATION', 'True').lower() == 'true'  # 回答评估在后台执行，不阻塞下一个问题
+INTERVIEW_EVALUATION_CONCURRENCY = int(os.getenv('INTERVIEW_EVALUATION_CONCURRENCY', '4'))  # 同时执行的后台评估数
+INTERVIEW_EVALUATION_RETRIES = int(os.getenv('INTERVIEW_EVALUATION_RETRIES', '2'))  # 后台评估失败重试次数
+INTERVIEW_EVALUATION_DRAIN_TIMEOUT = int(os.getenv('INTERVIEW_EVALUATION_DRAIN_TIMEOUT', '30'))  # 服务关闭时等待后台评估完成的最长时间(单位:s)
+INTERVIEW_CONTEXT_TOKEN_BUDGET = int(os.getenv('INTERVIEW_CONTEXT_TOKEN_BUDGET', '1500'))  # 传给大模型的历史对话token预算（本地估算）
+INTERVIEW_CONTEXT_SUMMARY_LIMIT = int(os.getenv('INTERVIEW_CONTEXT_SUMMARY_LIMIT', '200'))  # 较早轮次压缩摘要的字数上限
+INTERVIEW_PLAN_ENABLED = os.getenv('INTERVIEW_PLAN_ENABLED', 'True').lower() == 'true'  # 第一个问题提出后一次生成后续问题规划
+INTERVIEW_PLAN_SIZE = int(os.getenv('INTERVIEW_PLAN_SIZE', '6'))  # 规划的问题数量
+INTERVIEW_FOLLOW_UP_MIN_CHARS = int(os.getenv('INTERVIEW_FOLLOW_UP_MIN_CHARS', '15'))  # 回答短于该字数时实时生成追问
+INTERVIEW_SPECULATION_ENABLED = os.getenv('INTERVIEW_SPECULATION_ENABLED', 'False').lower() == 'true'  # 候选人作答期间推测生成下一个问题
+INTERVIEW_SPECULATION_MAX_PER_SESSION = int(os.getenv('INTERVIEW_SPECULATION_MAX_PER_SESSION', '5'))  # 每个会话最多推测次数（成本上限）
+INTERVIEW_SPECULATION_MAX_IN_FLIGHT = int(os.getenv('INTERVIEW_SPECULATION_MAX_IN_FLIGHT', '4'))  # 全进程同时进行的推测数上限
+INTERVIEW_VIDEO_SAMPLE_INTERVAL = float(os.getenv('INTERVIEW_VIDEO_SAMPLE_INTERVAL', '10'))  # 视频按媒体时间戳抽帧的间隔(单位:s)，首尾帧总会被选中
+INTERVIEW_VIDEO_SAMPLE_MODE = os.getenv('INTERVIEW_VIDEO_SAMPLE_MODE', 'auto')  # 抽帧方式：grab（逐帧grab，只转换选中帧）/ seek（按时间戳定位）/ auto
+INTERVIEW_VIDEO_STREAMING = os.getenv('INTERVIEW_VIDEO_STREAMING', 'True').lower() == 'true'  # 视频片段在内存中按会话增量解码（关闭时每个片段单独落盘分析）
+INTERVIEW_VIDEO_BUFFER_BYTES = int(os.getenv('INTERVIEW_VIDEO_BUFFER_BYTES', str(8 * 1024 * 1024)))  # 每个会话未解码视频片段的字节数上限，超出时回复繁忙
+INTERVIEW_VIDEO_FRAME_QUEUE_SIZE = int(os.getenv('INTERVIEW_VIDEO_FRAME_QUEUE_SIZE', '4'))  # 每个会话等待表情分析的帧数上限，超出时丢弃新帧
+INTERVIEW_VIDEO_DECODE_THREADS = int(os.getenv('INTERVIEW_VIDEO_DECODE_THREADS', '8'))  # 进程内同时解码视频的线程数上限，等待片段的空闲会话不占用名额，名额不足时片段在缓冲中等待
+INTERVIEW_FACE_CACHE_THRESHOLD = int(os.getenv('INTERVIEW_FACE_CACHE_THRESHOLD', '4'))  # 帧感知哈希（64位）汉明距离不超过该值时复用表情分析结果，-1表示关闭
+INTERVIEW_FACE_CACHE_MAX_AGE = int(os.getenv('INTERVIEW_FACE_CACHE_MAX_AGE', '60'))  # 复用表情分析结果的有效期(单位:s)
+
 FFMPEG_PATH = r"D:\ffmpeg-7.0.2-essentials_build\bin\ffmpeg.exe"
 os.environ["PATH"] += os.pathsep + os.path.dirname(FFMPEG_PATH)
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # 项目根目录下的 media 文件夹
 MEDIA_URL = '/media/'
+
+# 语音合成缓存（内存LRU + MEDIA_ROOT下的磁盘共享存储）
+TTS_CACHE_ENABLED = os.getenv('TTS_CACHE_ENABLED', 'True').lower() == 'true'
+TTS_CACHE_DIR = os.path.join(MEDIA_ROOT, 'tts_cache')
+TTS_CACHE_MEMORY_MB = int(os.getenv('TTS_CACHE_MEMORY_MB', '32'))  # 内存缓存上限
+TTS_CACHE_DISK_MB = int(os.getenv('TTS_CACHE_DISK_MB', '512'))  # 磁盘缓存上限
+
+# 大模型响应缓存（仅对显式启用缓存的调用生效），共享后端为Django缓存
+SPARK_CACHE_ENABLED = os.getenv('SPARK_CACHE_ENABLED', 'True').lower() == 'true'
+SPARK_CACHE_TTL = int(os.getenv('SPARK_CACHE_TTL', '3600'))  # 缓存有效期(单位:s)
+SPARK_CACHE_MAX_ENTRIES = int(os.getenv('SPARK_CACHE_MAX_ENTRIES', '1024'))  # 进程内缓存条目上限
 print(os.name)
 
 # 测试
@@ -14,6 +14,10 @@ from wsgiref.handlers import format_date_time
 import aiohttp
 from dotenv import load_dotenv
 
+from evaluation_system.http_client import get_client_session, close_client_session
+from evaluation_system.limits import get_limiter, RateLimitExceeded
+from evaluation_system.tts_cache import TTSCache, get_tts_cache
+
 # 加载环境变量
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -23,6 +27,13 @@ STATUS_FIRST_FRAME = 0  # 第一帧的标识
 STATUS_CONTINUE_FRAME = 1  # 中间帧标识
 STATUS_LAST_FRAME = 2  # 最后一帧的标识
 
+# WebSocket超时：两帧之间最长等待时间、关闭握手等待时间(单位:s)
+WS_TIMEOUT = aiohttp.ClientWSTimeout(ws_receive=60, ws_close=10)
+
+# 业务参数(business)，更多个性化参数可在官网查看  mp3格式
+# 同时作为语音缓存键的一部分，修改发音人/语速/格式后旧缓存自然失效
+TTS_BUSINESS_ARGS = {"aue": "lame", "auf": "audio/L16;rate=16000", "vcn": "x4_yezi", "tte": "utf8", "sfl": 1, "speed": 50}
+
 
 class AudioGenerateParam:
     """WebSocket参数类，用于语音合成"""
@@ -35,8 +46,8 @@ class AudioGenerateParam:
 
         # 公共参数(common)
         self.CommonArgs = {"app_id": self.APPID}
-        # 业务参数(business)，更多个性化参数可在官网查看  mp3格式
-        self.BusinessArgs = {"aue": "lame", "auf": "audio/L16;rate=16000", "vcn": "x4_yezi", "tte": "utf8","sfl":1,"speed":50}
+        # 业务参数(business)
+        self.BusinessArgs = dict(TTS_BUSINESS_ARGS)
         self.Data = {"status": 2, "text": str(base64.b64encode(self.Text.encode('utf-8')), "UTF8")}
 
     def create_url(self):
@@ -86,59 +97,123 @@ def get_credentials():
     return appid, api_key, api_secret
 
 
-async def synthesize(text):
+class SynthesisError(Exception):
+    """语音合成接口返回错误"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+def audio_cache_key(text):
+    """文本在语音缓存中的键"""
+    return TTSCache.make_key(text, TTS_BUSINESS_ARGS)
+
+
+async def get_cached_audio(cache_keys):
+    """按顺序取出多段缓存音频并拼接（MP3帧可直接拼接），任一段未命中返回None"""
+    cache = get_tts_cache()
+    if cache is None or not cache_keys:
+        return None
+    parts = []
+    for cache_key in cache_keys:
+        audio = await cache.aget(cache_key)
+        if audio is None:
+            return None
+        parts.append(audio)
+    return b"".join(parts)
+
+
+async def synthesize_stream(text, use_cache=True):
     """
-    语音合成主函数
+    流式语音合成，按接口返回顺序逐段产出MP3音频字节
     text: 待合成的文本
+    use_cache: 是否使用语音缓存，命中时一次性产出完整音频，未命中时合成完成后写入缓存
+    接口返回错误时抛出 SynthesisError
     """
+    cache = get_tts_cache() if use_cache else None
+    if cache is None:
+        async for chunk in _synthesize_upstream(text):
+            yield chunk
+        return
+
+    cache_key = audio_cache_key(text)
+    audio = await cache.aget(cache_key)
+    if audio is not None:
+        logger.debug(f"语音缓存命中: {text[:20]}")
+        yield audio
+        return
+
+    chunks = []
+    async for chunk in _synthesize_upstream(text):
+        chunks.append(chunk)
+        yield chunk
+    await cache.aput(cache_key, b"".join(chunks))
+
+
+async def _synthesize_upstream(text):
+    """调用讯飞语音合成接口"""
     appid, api_key, api_secret = get_credentials()
     ws_param = AudioGenerateParam(appid, api_key, api_secret, text)
     ws_url = ws_param.create_url()
+
+    async with get_limiter("tts").acquire():
+        session = await get_client_session()
+        async with session.ws_connect(ws_url, timeout=WS_TIMEOUT) as ws:
+            d = {
+                "common": ws_param.CommonArgs,
+                "business": ws_param.BusinessArgs,
+                "data": ws_param.Data
+            }
+            await ws.send_json(d)
+
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    data = json.loads(msg.data)
+                    logger.debug(f"收到消息: {data}")
+
+                    code = data.get("code")
+                    if code != 0:
+                        err_msg = data.get("message", "未知错误")
+                        logger.error(f"合成错误: {err_msg}, code: {code}")
+                        raise SynthesisError(f"合成错误: {err_msg}", code)
+
+                    if "data" in data:
+                        audio = data["data"]["audio"]
+                        if audio:
+                            yield base64.b64decode(audio)
+
+                        status = data["data"]["status"]
+                        if status == STATUS_LAST_FRAME:
+                            return
+                elif msg.type == aiohttp.WSMsgType.ERROR:
+                    raise SynthesisError(f"合成连接出错: {ws.exception()}")
+
+            # 连接关闭时 async for 直接结束，未收到最后一帧说明音频不完整，不能当作成功结果缓存
+            raise SynthesisError("合成连接在返回最后一帧前关闭")
+
+
+async def synthesize(text):
+    """
+    语音合成主函数
+    text: 待合成的文本
+    """
     session_id = f"sid-{int(time.time() * 1000)}"
 
     try:
-        async with aiohttp.ClientSession() as session:
-            # 设置超时
-            timeout = aiohttp.ClientTimeout(total=60)
-            async with session.ws_connect(ws_url, timeout=timeout) as ws:
-                d = {
-                    "common": ws_param.CommonArgs,
-                    "business": ws_param.BusinessArgs,
-                    "data": ws_param.Data
-                }
-                await ws.send_json(d)
-
-                audio_data = b""
-                async for msg in ws:
-                    if msg.type == aiohttp.WSMsgType.TEXT:
-                        data = json.loads(msg.data)
-                        logger.debug(f"收到消息: {data}")
-
-                        code = data.get("code")
-                        if code != 0:
-                            err_msg = data.get("message", "未知错误")
-                            logger.error(f"合成错误: {err_msg}, code: {code}")
-                            return {
-                                "error": f"合成错误: {err_msg}",
-                                "code": code,
-                                "success": False
-                            }
-
-                        if "data" in data:
-                            audio = data["data"]["audio"]
-                            audio = base64.b64decode(audio)
-                            audio_data += audio
-
-                            status = data["data"]["status"]
-                            if status == 2:
-                                break
-                logger.info("AI语音合成成功")
-                return {
-                    "audio_data": audio_data,
-                    "session_id": session_id,
-                    "success": True
-                }
+        chunks = [chunk async for chunk in synthesize_stream(text)]
+        logger.info("AI语音合成成功")
+        return {
+            "audio_data": b"".join(chunks),
+            "session_id": session_id,
+            "success": True
+        }
 
+    except SynthesisError as e:
+        return {"error": str(e), "code": e.code, "success": False}
+    except RateLimitExceeded as e:
+        logger.warning(f"语音合成被限流: {e}")
+        return {"error": str(e), "success": False, "rate_limited": True}
     except aiohttp.ClientError as e:
         logger.error(f"网络错误: {e}")
         return {"error": f"网络错误: {e}", "success": False}
@@ -159,6 +234,7 @@ async def synthesis_test():
         print("音频已保存为 synthesized_audio.mp3")
     else:
         print(f"错误: {result.get('error', '未知错误')}")
+    await close_client_session()
 
 
 if __name__ == "__main__":
@@ -6,7 +6,9 @@ import json
 import logging
 import math
 import os
+import sys
 import time
+from collections import namedtuple
 from datetime import datetime
 from urllib.parse import urlencode
 from time import mktime
@@ -15,6 +17,9 @@ from wsgiref.handlers import format_date_time
 import aiohttp
 from dotenv import load_dotenv
 
+from evaluation_system.http_client import get_client_session, close_client_session
+from evaluation_system.limits import get_limiter, RateLimitExceeded
+
 # 加载环境变量
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -24,6 +29,18 @@ STATUS_FIRST_FRAME = 0  # 第一帧的标识
 STATUS_CONTINUE_FRAME = 1  # 中间帧标识
 STATUS_LAST_FRAME = 2  # 最后一帧的标识
 
+# 发送节奏策略：每帧字节数 + 帧间隔(单位:s)，16kHz 16位单声道PCM每秒32000字节
+Pacing = namedtuple("Pacing", ["frame_size", "interval"])
+PACING_STRATEGIES = {
+    "realtime": Pacing(1280, 0.04),  # 官方推荐的实时节奏，1倍速
+    "accelerated": Pacing(8000, 0.04),  # 原有节奏，约6倍速
+    "burst": Pacing(16000, 0),  # 已录制完的回答，大帧连续发送
+}
+DEFAULT_PACING = os.getenv("XF_ASR_PACING", "accelerated")
+
+# WebSocket超时：两帧之间最长等待时间、关闭握手等待时间(单位:s)
+WS_TIMEOUT = aiohttp.ClientWSTimeout(ws_receive=60, ws_close=10)
+
 
 class WsParam:
     """WebSocket参数类，参考示例代码重构"""
@@ -92,109 +109,236 @@ def get_credentials():
     return appid, api_key, api_secret
 
 
-async def recognize(audio_data, lang="zh_cn", pd="iat"):
+def _build_frame(ws_param, status, buf):
+    """构造发送给iat接口的音频帧，第一帧附带公共参数和业务参数"""
+    frame = {
+        "data": {
+            "status": status,
+            "format": "audio/L16;rate=16000",
+            "audio": base64.b64encode(buf).decode(),
+            "encoding": "raw"
+        }
+    }
+    if status == STATUS_FIRST_FRAME:
+        frame["common"] = ws_param.CommonArgs
+        frame["business"] = ws_param.BusinessArgs
+    return frame
+
+
+async def _read_results(ws, session_id):
+    """读取iat返回的识别结果，直到收到最终结果或连接关闭"""
+    final_result = ""
+    async for msg in ws:
+        if msg.type == aiohttp.WSMsgType.TEXT:
+            data = json.loads(msg.data)
+            logger.debug(f"收到消息: {data}")
+
+            code = data.get("code")
+            if code != 0:
+                err_msg = data.get("message", "未知错误")
+                logger.error(f"识别错误: {err_msg}, code: {code}")
+                return {
+                    "error": f"识别错误: {err_msg}",
+                    "code": code,
+                    "success": False
+                }
+
+            if "data" in data and "result" in data["data"]:
+                ws_data = data["data"]["result"]["ws"]
+                for item in ws_data:
+                    for w in item["cw"]:
+                        final_result += w["w"]
+                logger.info("AI语音识别成功")
+
+            if data.get("data", {}).get("status") == STATUS_LAST_FRAME:
+                break
+        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+            break
+
+    return {
+        "text": final_result,
+        "session_id": session_id,
+        "success": True
+    }
+
+
+class RecognitionSession:
     """
-    实时语音识别主函数
-    audio_data: 16kHz 16位单声道PCM音频数据
+    增量语音识别会话
+    候选人说话过程中即可通过 feed() 推送PCM片段，音频会被立即转发到iat接口，
+    finish() 发送结束帧并返回最终识别结果，因此识别耗时不再叠加在整段说话时长之后。
+
+    iat会在静音超时(vad_eos)或达到单次音频时长上限时提前结束会话，此时自动建立新的iat会话继续识别剩余音频，
+    各段识别结果按顺序拼接；超过 MAX_SEGMENTS 段或后续分段出错时，返回已识别的部分并标记 truncated。
+    限流器只约束建立连接（频率），不占用整个说话过程，同时说话的候选人数量不受并发名额限制。
+
+    用法: session.open() -> session.feed(chunk) * N -> await session.finish()
     """
-    appid, api_key, api_secret = get_credentials()
-    ws_param = WsParam(appid, api_key, api_secret, audio_data)
-    ws_url = ws_param.create_url()
-    session_id = f"sid-{int(time.time() * 1000)}"
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            # 设置超时
-            timeout = aiohttp.ClientTimeout(total=60)
-            async with session.ws_connect(ws_url, timeout=timeout) as ws:
-                frameSize = 8000  # 每一帧的音频大小
-                intervel = 0.04  # 发送音频间隔(单位:s)
-                status = STATUS_FIRST_FRAME  # 音频的状态信息
-
-                pos = 0
-                while True:
-                    buf = audio_data[pos:pos + frameSize]
-                    pos += frameSize
-
-                    if not buf:
-                        status = STATUS_LAST_FRAME
-
-                    if status == STATUS_FIRST_FRAME:
-                        d = {
-                            "common": ws_param.CommonArgs,
-                            "business": ws_param.BusinessArgs,
-                            "data": {
-                                "status": 0,
-                                "format": "audio/L16;rate=16000",
-                                "audio": base64.b64encode(buf).decode(),
-                                "encoding": "raw"
-                            }
-                        }
-                        await ws.send_json(d)
-                        status = STATUS_CONTINUE_FRAME
-                    elif status == STATUS_CONTINUE_FRAME:
-                        d = {
-                            "data": {
-                                "status": 1,
-                                "format": "audio/L16;rate=16000",
-                                "audio": base64.b64encode(buf).decode(),
-                                "encoding": "raw"
-                            }
-                        }
-                        await ws.send_json(d)
-                    elif status == STATUS_LAST_FRAME:
-                        d = {
-                            "data": {
-                                "status": 2,
-                                "format": "audio/L16;rate=16000",
-                                "audio": base64.b64encode(buf).decode(),
-                                "encoding": "raw"
-                            }
-                        }
-                        await ws.send_json(d)
-                        await asyncio.sleep(1)
-                        break
-
-                    await asyncio.sleep(intervel)
-
-                # 接收识别结果
-                final_result = ""
-                async for msg in ws:
-                    if msg.type == aiohttp.WSMsgType.TEXT:
-                        data = json.loads(msg.data)
-                        logger.debug(f"收到消息: {data}")
-
-                        code = data.get("code")
-                        if code != 0:
-                            err_msg = data.get("message", "未知错误")
-                            logger.error(f"识别错误: {err_msg}, code: {code}")
-                            return {
-                                "error": f"识别错误: {err_msg}",
-                                "code": code,
-                                "success": False
-                            }
-
-                        if "data" in data and "result" in data["data"]:
-                            ws_data = data["data"]["result"]["ws"]
-                            for item in ws_data:
-                                for w in item["cw"]:
-                                    final_result += w["w"]
-                            logger.info("AI语音识别成功")
-                    elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
-                        break
 
-                return {
-                    "text": final_result,
-                    "session_id": session_id,
-                    "success": True
-                }
+    MAX_SEGMENTS = 10
+
+    def __init__(self, lang="zh_cn", pd="iat", frame_size=8000, interval=0):
+        self.lang = lang
+        self.pd = pd
+        self.frame_size = frame_size
+        self.interval = interval  # 帧间隔，流式输入时音频本身按实时到达，无需额外等待
+        self.session_id = f"sid-{int(time.time() * 1000)}"
+        self.audio_bytes = 0  # 已接收的PCM字节数
+        self._chunks = asyncio.Queue()
+        self._task = None
+
+    def open(self):
+        """在后台启动识别任务，不等待连接完成即可开始feed"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def feed(self, chunk):
+        """推送一段16kHz 16位单声道PCM音频"""
+        if self._task is None:
+            self.open()
+        if chunk:
+            self.audio_bytes += len(chunk)
+            self._chunks.put_nowait(chunk)
+
+    async def finish(self, timeout=30):
+        """结束音频输入，等待并返回最终识别结果"""
+        if self._task is None:
+            self.open()
+        self._chunks.put_nowait(None)
+        try:
+            return await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.error("等待语音识别结果超时")
+            return {"error": "等待语音识别结果超时", "success": False}
+
+    async def abort(self):
+        """放弃本次识别"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _run(self):
+        appid, api_key, api_secret = get_credentials()
+        ws_param = WsParam(appid, api_key, api_secret, None)
+
+        texts = []
+        truncated = False
+        pending, ended = b"", False  # 待发送的音频、客户端是否已结束输入
+        try:
+            for segment in range(self.MAX_SEGMENTS):
+                result, pending, ended = await self._run_segment(ws_param, pending, ended)
+                if result is None:
+                    break  # 没有更多音频
+                if not result["success"]:
+                    if not texts:
+                        return result
+                    logger.warning(f"第{segment + 1}段语音识别失败，返回已识别的部分: {result.get('error')}")
+                    truncated = True
+                    break
+                texts.append(result["text"])
+                if ended and not pending:
+                    break
+                logger.info(f"iat会话提前结束（静音超时或时长上限），已识别{len(texts)}段，继续识别剩余音频")
+            else:
+                logger.warning(f"语音识别超过{self.MAX_SEGMENTS}段，剩余音频未识别")
+                truncated = True
+
+        except RateLimitExceeded as e:
+            logger.warning(f"语音识别被限流: {e}")
+            return {"error": str(e), "success": False, "rate_limited": True}
+        except aiohttp.ClientError as e:
+            logger.error(f"网络错误: {e}")
+            return {"error": f"网络错误: {e}", "success": False}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"未知错误: {e}")
+            return {"error": f"未知错误: {e}", "success": False}
+
+        if not texts:
+            return {"error": "没有接收到音频数据", "success": False}
+        return {
+            "text": "".join(texts),
+            "session_id": self.session_id,
+            "segments": len(texts),
+            "truncated": truncated,
+            "success": True
+        }
 
-    except aiohttp.ClientError as e:
-        logger.error(f"网络错误: {e}")
-        return {"error": f"网络错误: {e}", "success": False}
-    except Exception as e:
-        logger.error(f"未知错误: {e}")
-        return {"error": f"未知错误: {e}", "success": False}
+    async def _run_segment(self, ws_param, pending, ended):
+        """
+        用一个iat会话识别音频，直到客户端结束输入或上游提前结束
+        返回 (识别结果, 未发送的音频, 客户端是否已结束输入)，没有音频可发送时识别结果为None
+        """
+        if not pending and not ended:
+            chunk = await self._chunks.get()
+            if chunk is None:
+                ended = True
+            else:
+                pending = chunk
+        if not pending:
+            return None, pending, ended
+
+        session = await get_client_session()
+        async with get_limiter("iat").acquire():
+            ws = await session.ws_connect(ws_param.create_url(), timeout=WS_TIMEOUT)
+
+        async with ws:
+            reader = asyncio.create_task(_read_results(ws, self.session_id))
+            status = STATUS_FIRST_FRAME
+            # 用偏移量遍历当前音频块，避免每发送一帧都复制剩余数据
+            view, offset = memoryview(pending), 0
+            try:
+                while True:
+                    if offset >= len(view):
+                        if ended:
+                            break
+                        chunk = await self._chunks.get()
+                        if chunk is None:
+                            ended = True
+                            break
+                        view, offset = memoryview(chunk), 0
+                    if reader.done():
+                        break  # 上游已结束本次会话，剩余音频交给下一个会话
+                    try:
+                        await ws.send_json(_build_frame(ws_param, status, view[offset:offset + self.frame_size]))
+                    except (ConnectionError, aiohttp.ClientError):
+                        if ws.closed or reader.done():
+                            break  # 上游关闭连接，这一帧留给下一个会话重新发送
+                        raise
+                    offset += self.frame_size
+                    status = STATUS_CONTINUE_FRAME
+                    if self.interval:
+                        await asyncio.sleep(self.interval)
+
+                pending = bytes(view[offset:])
+                if not reader.done():
+                    await ws.send_json(_build_frame(ws_param, STATUS_LAST_FRAME, b""))
+                return await reader, pending, ended
+            finally:
+                if not reader.done():
+                    reader.cancel()
+
+
+async def recognize(audio_data, lang="zh_cn", pd="iat", pacing=None):
+    """
+    语音识别主函数（整段音频）
+    audio_data: 16kHz 16位单声道PCM音频数据
+    pacing: 发送节奏策略(realtime/accelerated/burst)，默认读取环境变量XF_ASR_PACING
+    识别结果与音频发送同时读取，最后一帧发出后即可拿到结果，无需固定等待
+    """
+    pacing = pacing or DEFAULT_PACING
+    if pacing not in PACING_STRATEGIES:
+        logger.warning(f"未知的发送节奏策略: {pacing}，使用accelerated")
+        pacing = "accelerated"
+    frame_size, interval = PACING_STRATEGIES[pacing]
+
+    session = RecognitionSession(lang, pd, frame_size=frame_size, interval=interval)
+    session.feed(audio_data)
+    return await session.finish(timeout=None)
 
 
 async def generate_test_audio(duration=5.0):
@@ -202,13 +346,9 @@ async def generate_test_audio(duration=5.0):
     import struct
     sample_rate = 16000
     num_samples = int(sample_rate * duration)
-    audio_data = b""
-    for i in range(num_samples):
-        # 生成440Hz正弦波（测试用）
-        t = i / sample_rate
-        value = int(16384 * math.sin(2 * math.pi * 440 * t))
-        audio_data += struct.pack("h", value)
-    return audio_data
+    # 生成440Hz正弦波（测试用）
+    samples = [int(16384 * math.sin(2 * math.pi * 440 * i / sample_rate)) for i in range(num_samples)]
+    return struct.pack(f"<{num_samples}h", *samples)
 
 
 async def recognition():
@@ -221,6 +361,22 @@ async def recognition():
         print(f"文本: {result['text']}")
     else:
         print(f"错误: {result.get('error', '未知错误')}")
+    await close_client_session()
+
+
+async def benchmark(durations=(5, 15, 30, 60)):
+    """对比不同发送节奏下，各回答时长的端到端识别耗时"""
+    print(f"{'时长(s)':>8} | " + " | ".join(f"{name:>12}" for name in PACING_STRATEGIES))
+    for duration in durations:
+        audio_data = await generate_test_audio(duration)
+        costs = []
+        for name in PACING_STRATEGIES:
+            start = time.perf_counter()
+            result = await recognize(audio_data, pacing=name)
+            cost = time.perf_counter() - start
+            costs.append(f"{cost:>11.2f}s" if result["success"] else f"{'失败':>11}")
+        print(f"{duration:>8} | " + " | ".join(costs))
+    await close_client_session()
 
 
 if __name__ == "__main__":
@@ -228,4 +384,7 @@ if __name__ == "__main__":
         level=logging.INFO,
         format="%(asctime)s - %(levelname)s - %(message)s"
     )
-    asyncio.run(recognition())
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        asyncio.run(benchmark())
+    else:
+        asyncio.run(recognition())
\ No newline at end of file
@@ -1,12 +1,24 @@
 # 移除未使用的导入语句
 # from django.conf import settings
-from sparkai.llm.llm import ChatSparkLLM, ChunkPrintHandler
-from sparkai.core.messages import ChatMessage
-
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
 import os
+from datetime import datetime
+from time import mktime
+from urllib.parse import urlencode, urlparse
+from wsgiref.handlers import format_date_time
+
+import aiohttp
 from dotenv import load_dotenv
 import logging
 
+from evaluation_system.http_client import get_client_session, close_client_session
+from evaluation_system.limits import get_limiter, RateLimitExceeded
+from evaluation_system.llm_cache import get_llm_cache
+
 # 加载.env文件中的环境变量
 load_dotenv()
 
@@ -14,9 +26,23 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 响应状态标识
+STATUS_LAST_FRAME = 2  # 最后一帧的标识
+
+# WebSocket超时：两帧之间最长等待时间、关闭握手等待时间(单位:s)
+WS_TIMEOUT = aiohttp.ClientWSTimeout(ws_receive=60, ws_close=10)
+
+
+class SparkAPIError(Exception):
+    """星火接口返回错误"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
 
 class SparkAIEngine:
-    """星火认知大模型调用引擎（基于Spark Pro版本）"""
+    """星火认知大模型调用引擎（基于Spark Pro版本，aiohttp WebSocket异步实现）"""
 
     def __init__(self):
         """初始化配置，从环境变量读取密钥信息"""
@@ -34,77 +60,169 @@ class SparkAIEngine:
         # 固定配置（Spark Pro版本）
         self.spark_url = "wss://spark-api.xf-yun.com/v3.1/chat"
         self.domain = "generalv3"  # 与v3.1/chat地址匹配的domain
+        self.temperature = 0.5
+        self.max_tokens = 4096
+
+    def _create_url(self):
+        """生成鉴权URL"""
+        parsed = urlparse(self.spark_url)
+
+        # 生成RFC1123格式的时间戳
+        now = datetime.now()
+        date = format_date_time(mktime(now.timetuple()))
+
+        # 拼接字符串
+        signature_origin = "host: " + parsed.netloc + "\n"
+        signature_origin += "date: " + date + "\n"
+        signature_origin += "GET " + parsed.path + " HTTP/1.1"
+
+        # 进行hmac-sha256进行加密
+        signature_sha = hmac.new(
+            self.api_secret.encode('utf-8'),
+            signature_origin.encode('utf-8'),
+            digestmod=hashlib.sha256
+        ).digest()
+        signature_sha = base64.b64encode(signature_sha).decode(encoding='utf-8')
+
+        authorization_origin = f'api_key="{self.api_key}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha}"'
+        authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode(encoding='utf-8')
+
+        # 将请求的鉴权参数组合为字典
+        v = {
+            "authorization": authorization,
+            "date": date,
+            "host": parsed.netloc
+        }
+
+        # 拼接鉴权参数，生成url
+        return self.spark_url + '?' + urlencode(v)
+
+    @staticmethod
+    def _build_messages(user_query: str, history: list = None) -> list:
+        """
+        构建消息列表，history格式为[{"role": "user/assistant", "content": "xxx"}, ...]
+        接口要求user和assistant交替出现，历史以user消息结尾时（如候选人的回答）把本次输入并入该消息
+        """
+        messages = [
+            {"role": item["role"], "content": item["content"]}
+            for item in (history or [])
+        ]
+        if messages and messages[-1]["role"] == "user":
+            messages[-1]["content"] = f"{messages[-1]['content']}\n\n{user_query}"
+        else:
+            messages.append({"role": "user", "content": user_query})
+        return messages
+
+    def _build_request(self, user_query: str, history: list = None) -> dict:
+        """构建对话请求"""
+        messages = self._build_messages(user_query, history)
+
+        return {
+            "header": {"app_id": self.app_id, "uid": "interview"},
+            "parameter": {
+                "chat": {
+                    "domain": self.domain,
+                    "temperature": self.temperature,
+                    "max_tokens": self.max_tokens
+                }
+            },
+            "payload": {"message": {"text": messages}}
+        }
+
+    async def _achat(self, user_query: str, history: list = None):
+        """
+        发送对话请求，逐个返回响应帧的payload
+        接口返回错误时抛出 SparkAPIError
+        """
+        async with get_limiter("spark_chat").acquire():
+            session = await get_client_session()
+            async with session.ws_connect(self._create_url(), timeout=WS_TIMEOUT) as ws:
+                await ws.send_json(self._build_request(user_query, history))
+
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        data = json.loads(msg.data)
+                        header = data.get("header", {})
+
+                        code = header.get("code")
+                        if code != 0:
+                            err_msg = header.get("message", "未知错误")
+                            logger.error(f"星火接口错误: {err_msg}, code: {code}")
+                            raise SparkAPIError(f"星火接口错误: {err_msg}", code)
+
+                        yield data.get("payload", {})
+
+                        if header.get("status") == STATUS_LAST_FRAME:
+                            return
+                    elif msg.type == aiohttp.WSMsgType.ERROR:
+                        raise SparkAPIError(f"星火连接出错: {ws.exception()}")
+
+                # 连接关闭时 async for 直接结束，未收到最后一帧说明响应不完整
+                raise SparkAPIError("星火连接在返回最后一帧前关闭")
+
+    async def astream(self, user_query: str, history: list = None):
+        """
+        异步流式响应，逐个返回响应片段，出错时抛出异常
+
+        参数:
+            user_query: 当前用户输入
+            history: 历史对话列表
+        """
+        async for payload in self._achat(user_query, history):
+            for item in payload.get("choices", {}).get("text", []):
+                if item.get("content"):
+                    yield item["content"]
 
-        # 初始化大模型客户端
-        self.client = self._init_client()
-
-    def _init_client(self) -> ChatSparkLLM:
-        """初始化星火大模型客户端"""
-        return ChatSparkLLM(
-            spark_api_url=self.spark_url,
-            spark_app_id=self.app_id,
-            spark_api_key=self.api_key,
-            spark_api_secret=self.api_secret,
-            spark_llm_domain=self.domain,
-            streaming=False  # 非流式返回模式
-        )
-
-    def generate_response(self, user_query: str, history: list = None) -> dict:
+    async def agenerate(self, user_query: str, history: list = None, use_cache: bool = False) -> dict:
         """
-        生成模型响应
+        异步生成模型响应
 
         参数:
             user_query: 当前用户输入
             history: 历史对话列表，格式为[{"role": "user/assistant", "content": "xxx"}, ...]
+            use_cache: 是否使用响应缓存（仅用于结果可复用的确定性提示词），命中时不调用接口
 
         返回:
             包含响应内容和token消耗的字典
         """
-        try:
-            # 构建对话消息列表
-            messages = []
-
-            # 处理历史对话
-            if history:
-                for item in history:
-                    messages.append(
-                        ChatMessage(
-                            role=item["role"],
-                            content=item["content"]
-                        )
-                    )
-
-            # 添加当前查询
-            messages.append(
-                ChatMessage(
-                    role="user",
-                    content=user_query
-                )
+        cache = get_llm_cache() if use_cache else None
+        if cache is not None:
+            return await cache.get_or_call(
+                self._build_messages(user_query, history),
+                self.domain,
+                lambda: self._agenerate(user_query, history)
             )
+        return await self._agenerate(user_query, history)
 
-            # 添加回调处理器以获取流式输出
-            handler = ChunkPrintHandler()
-            response = self.client.generate([messages], callbacks=[handler])
+    async def _agenerate(self, user_query: str, history: list = None) -> dict:
+        try:
+            parts = []
+            token_usage = {}
+            async for payload in self._achat(user_query, history):
+                for item in payload.get("choices", {}).get("text", []):
+                    parts.append(item.get("content", ""))
+                token_usage = payload.get("usage", {}).get("text", token_usage)
 
             # 检查响应是否有效
-            if not response.generations or not response.generations[0] or not response.generations[0][0]:
+            content = "".join(parts)
+            if not content:
                 error_msg = "生成的响应内容为空"
                 logger.error(error_msg)
                 return {"success": False, "error": error_msg}
 
-            # 解析响应结果
-            token_usage = response.llm_output.get("token_usage", {})
-            result = {
+            return {
                 "success": True,
-                "content": response.generations[0][0].message.content,
+                "content": content,
                 "usage": {
                     "prompt_tokens": token_usage.get('prompt_tokens', 0),
                     "completion_tokens": token_usage.get('completion_tokens', 0),
                     "total_tokens": token_usage.get('total_tokens', 0)
                 }
             }
-            return result
 
+        except RateLimitExceeded as e:
+            logger.warning(f"生成响应被限流: {str(e)}")
+            return {"success": False, "error": str(e), "rate_limited": True}
         except Exception as e:
             # 记录详细错误信息
             logger.exception("生成响应时发生错误")
@@ -113,9 +231,29 @@ class SparkAIEngine:
                 "error": f"系统错误: {str(e)}"
             }
 
+    def generate_response(self, user_query: str, history: list = None, use_cache: bool = False) -> dict:
+        """
+        生成模型响应（同步接口，供非异步代码调用，不能在事件循环中使用）
+
+        参数:
+            user_query: 当前用户输入
+            history: 历史对话列表，格式为[{"role": "user/assistant", "content": "xxx"}, ...]
+            use_cache: 是否使用响应缓存
+
+        返回:
+            包含响应内容和token消耗的字典
+        """
+        async def run():
+            try:
+                return await self.agenerate(user_query, history, use_cache=use_cache)
+            finally:
+                await close_client_session()
+
+        return asyncio.run(run())
+
     def generate_stream_response(self, user_query: str, history: list = None):
         """
-        生成流式响应（用于实时返回）
+        生成流式响应（同步接口，用于实时返回）
 
         参数:
             user_query: 当前用户输入
@@ -124,31 +262,18 @@ class SparkAIEngine:
         返回:
             生成器对象，逐个返回响应片段
         """
+        loop = asyncio.new_event_loop()
+        stream = self.astream(user_query, history)
         try:
-            messages = []
-            if history:
-                for item in history:
-                    messages.append(
-                        ChatMessage(role=item["role"], content=item["content"])
-                    )
-            messages.append(ChatMessage(role="user", content=user_query))
-
-            # 启用流式模式
-            stream_client = ChatSparkLLM(
-                spark_api_url=self.spark_url,
-                spark_app_id=self.app_id,
-                spark_api_key=self.api_key,
-                spark_api_secret=self.api_secret,
-                spark_llm_domain=self.domain,
-                streaming=True
-            )
-
             # 流式返回
             yielded = False
-            for chunk in stream_client._stream(messages):
-                if chunk.message.content:
-                    yield chunk.message.content
-                    yielded = True
+            while True:
+                try:
+                    content = loop.run_until_complete(stream.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield content
+                yielded = True
 
             # 如果没有产生任何内容，返回错误
             if not yielded:
@@ -157,6 +282,10 @@ class SparkAIEngine:
         except Exception as e:
             logger.exception("生成流式响应时发生错误")
             yield f"错误: {str(e)}"
+        finally:
+            loop.run_until_complete(stream.aclose())
+            loop.run_until_complete(close_client_session())
+            loop.close()
 
 
 # 初始化引擎实例（全局单例）
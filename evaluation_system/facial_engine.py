@@ -1,7 +1,10 @@
 """
 人脸表情分析引擎模块
 封装讯飞人脸特征分析表情WebAPI接口
+服务内使用异步接口（aanalyze_*、analyze_frames），请求走共享的 aiohttp 客户端（keep-alive、超时）；
+同步接口保留给脚本和独立调用。
 """
+import asyncio
 import json
 import cv2
 import numpy as np
@@ -13,12 +16,52 @@ import logging
 from typing import Dict, Union
 from pathlib import Path
 import os
+import threading
+
+import aiohttp
 from dotenv import load_dotenv
 
+from evaluation_system.http_client import get_client_session
+from evaluation_system.limits import get_limiter, RateLimitExceeded
+
 # 加载环境变量
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+MAX_IMAGE_BYTES = 800 * 1024  # 表情分析接口的图片大小上限
+REQUEST_TIMEOUT = float(os.getenv("XF_FACE_TIMEOUT", "10"))  # 单次表情分析请求超时(单位:s)
+BATCH_CONCURRENCY = int(os.getenv("XF_FACE_BATCH_CONCURRENCY", "4"))  # 批量分析时同时进行的请求数
+
+
+def is_complete_jpeg(data: bytes) -> bool:
+    """只检查JPEG的起止标记（不解码），用于判断能否直接上传"""
+    return data[:3] == b"\xff\xd8\xff" and data.rstrip(b"\x00")[-2:] == b"\xff\xd9"
+
+
+def encode_image(frame: np.ndarray, max_bytes: int = MAX_IMAGE_BYTES) -> bytes:
+    """将BGR图像编码为JPEG，超过大小上限时按比例缩小后重新编码"""
+    while True:
+        ok, buffer = cv2.imencode('.jpg', frame)
+        if not ok:
+            raise ValueError("图片编码失败")
+        if buffer.size <= max_bytes or min(frame.shape[:2]) <= 64:
+            return buffer.tobytes()
+        scale = (max_bytes / buffer.size) ** 0.5 * 0.9
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def prepare_image(data: bytes, max_bytes: int = MAX_IMAGE_BYTES) -> Union[bytes, None]:
+    """
+    准备上传的图片：符合大小上限的完整JPEG原样返回（不解码、不重新编码），
+    其他格式或超出上限时解码后重新编码，无法解码时返回None
+    """
+    if len(data) <= max_bytes and is_complete_jpeg(data):
+        return data
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None
+    return encode_image(frame, max_bytes)
+
 
 class FacialExpressionAnalyzer:
     """人脸表情分析引擎"""
@@ -88,7 +131,8 @@ class FacialExpressionAnalyzer:
         """
         try:
             headers = self._generate_headers(image_name, image_url)
-            response = requests.post(self.URL, headers=headers)
+            with get_limiter("face").acquire_sync():
+                response = requests.post(self.URL, headers=headers, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
 
             result = response.json()
@@ -127,14 +171,15 @@ class FacialExpressionAnalyzer:
                 raise FileNotFoundError(f"文件不存在: {file_path}")
 
             # 检查文件大小(不超过800KB)
-            if file_path.stat().st_size > 800 * 1024:
+            if file_path.stat().st_size > MAX_IMAGE_BYTES:
                 raise ValueError("图片大小超过800KB限制")
 
             with open(file_path, 'rb') as f:
                 image_data = f.read()
 
             headers = self._generate_headers(file_path.name)
-            response = requests.post(self.URL, headers=headers, data=image_data)
+            with get_limiter("face").acquire_sync():
+                response = requests.post(self.URL, headers=headers, data=image_data, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
 
             result = response.json()
@@ -175,9 +220,37 @@ class FacialExpressionAnalyzer:
         """
         try:
             # 将OpenCV帧(BRG格式)转换为JPEG字节流
-            _, buffer = cv2.imencode('.jpg', frame)
-            image_bytes = buffer.tobytes()
+            image_bytes = encode_image(frame)
+        except Exception as e:
+            logger.error(f"表情分析失败: {e}")
+            return {
+                "success": False,
+                "error": f"表情分析失败: {str(e)}"
+            }
+        return self._analyze_bytes(image_bytes)
 
+    def analyze_image(self, image_data: bytes) -> Dict[str, Union[str, dict]]:
+        """
+        分析客户端上传的图片中的人脸表情
+        已经是大小符合要求的完整JPEG时直接上传原始字节，否则解码后缩放、重新编码
+        :param image_data: 图片字节流
+        :return: 分析结果字典
+        """
+        try:
+            image_bytes = prepare_image(image_data)
+        except Exception as e:
+            logger.error(f"表情分析失败: {e}")
+            image_bytes = None
+        if image_bytes is None:
+            return {
+                "success": False,
+                "error": "无法读取图片数据"
+            }
+        return self._analyze_bytes(image_bytes)
+
+    def _analyze_bytes(self, image_bytes: bytes) -> Dict[str, Union[str, dict]]:
+        """上传JPEG字节流进行表情分析"""
+        try:
             # 生成随机文件名
             image_name = f"frame_{int(time.time() * 1000)}.jpg"
 
@@ -185,7 +258,8 @@ class FacialExpressionAnalyzer:
             headers = self._generate_headers(image_name)
 
             # 发送请求
-            response = requests.post(self.URL, headers=headers, data=image_bytes)
+            with get_limiter("face").acquire_sync():
+                response = requests.post(self.URL, headers=headers, data=image_bytes, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
 
             result = response.json()
@@ -213,6 +287,101 @@ class FacialExpressionAnalyzer:
                 "error": f"表情分析失败: {str(e)}"
             }
 
+    async def aanalyze_frame(self, frame: np.ndarray) -> Dict[str, Union[str, dict]]:
+        """异步分析视频帧中的人脸表情（JPEG编码在线程中执行）"""
+        try:
+            image_bytes = await asyncio.to_thread(encode_image, frame)
+        except Exception as e:
+            logger.error(f"表情分析失败: {e}")
+            return {
+                "success": False,
+                "error": f"表情分析失败: {str(e)}"
+            }
+        return await self._aanalyze_bytes(image_bytes)
+
+    async def aanalyze_image(self, image_data: bytes) -> Dict[str, Union[str, dict]]:
+        """异步分析客户端上传的图片，符合要求的JPEG直接上传，否则在线程中解码、缩放"""
+        if len(image_data) <= MAX_IMAGE_BYTES and is_complete_jpeg(image_data):
+            image_bytes = image_data
+        else:
+            try:
+                image_bytes = await asyncio.to_thread(prepare_image, image_data)
+            except Exception as e:
+                logger.error(f"表情分析失败: {e}")
+                image_bytes = None
+        if image_bytes is None:
+            return {
+                "success": False,
+                "error": "无法读取图片数据"
+            }
+        return await self._aanalyze_bytes(image_bytes)
+
+    async def analyze_frames(self, frames, concurrency: int = None) -> list:
+        """
+        批量分析多帧，最多 concurrency 个请求同时进行（仍受 face 限流器约束）
+        :return: 与 frames 顺序一致的分析结果列表
+        """
+        semaphore = asyncio.Semaphore(concurrency or BATCH_CONCURRENCY)
+
+        async def analyze(frame):
+            async with semaphore:
+                return await self.aanalyze_frame(frame)
+
+        return await asyncio.gather(*[analyze(frame) for frame in frames])
+
+    async def _aanalyze_bytes(self, image_bytes: bytes) -> Dict[str, Union[str, dict]]:
+        """通过共享HTTP客户端上传JPEG字节流进行表情分析"""
+        try:
+            image_name = f"frame_{int(time.time() * 1000)}.jpg"
+            headers = self._generate_headers(image_name)
+
+            async with get_limiter("face").acquire():
+                session = await get_client_session()
+                async with session.post(
+                    self.URL,
+                    headers=headers,
+                    data=image_bytes,
+                    timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+                ) as response:
+                    response.raise_for_status()
+                    result = await response.json(content_type=None)
+            logger.info(f"表情分析API响应: {result}")
+
+            emotions = self._parse_expression_result(result)
+            return {
+                "success": True,
+                "data": emotions,
+                "message": "表情分析成功"
+            }
+
+        except RateLimitExceeded as e:
+            logger.warning(f"表情分析被限流: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "rate_limited": True
+            }
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"API请求失败: {e}")
+            return {
+                "success": False,
+                "error": f"API请求失败: {str(e)}",
+                "status_code": e.status
+            }
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"API请求失败: {e!r}")
+            return {
+                "success": False,
+                "error": f"API请求失败: {e!r}",
+                "status_code": None
+            }
+        except Exception as e:
+            logger.error(f"表情分析失败: {e}")
+            return {
+                "success": False,
+                "error": f"表情分析失败: {str(e)}"
+            }
+
     def _parse_expression_result(self, result: Dict) -> Dict:
         """
         解析API返回的表情结果
@@ -240,6 +409,20 @@ class FacialExpressionAnalyzer:
 
         return emotions
 
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_facial_analyzer() -> FacialExpressionAnalyzer:
+    """获取进程内共享的表情分析器（缺少配置时抛出ValueError）"""
+    global _analyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            _analyzer = FacialExpressionAnalyzer()
+        return _analyzer
+
+
 # 示例用法
 if __name__ == "__main__":
     # 配置日志
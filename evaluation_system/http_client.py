@@ -0,0 +1,55 @@
+"""
+讯飞/阿里云等外部服务共用的 aiohttp 客户端
+
+每个事件循环懒加载一个 ClientSession，所有引擎共用同一个连接器（连接数限制、keep-alive、DNS缓存、SSL上下文），
+避免每次调用都重新创建连接器并进行DNS解析和TLS握手。进程退出（ASGI lifespan shutdown）时统一关闭。
+"""
+import asyncio
+import logging
+import os
+import weakref
+
+import aiohttp
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+POOL_LIMIT = int(os.getenv("XF_HTTP_POOL_LIMIT", "200"))  # 总连接数上限（WebSocket连接同样占用）
+POOL_LIMIT_PER_HOST = int(os.getenv("XF_HTTP_POOL_LIMIT_PER_HOST", "64"))  # 单个主机连接数上限
+KEEPALIVE_TIMEOUT = float(os.getenv("XF_HTTP_KEEPALIVE_TIMEOUT", "30"))  # 空闲连接保持时间(单位:s)
+DNS_CACHE_TTL = int(os.getenv("XF_HTTP_DNS_CACHE_TTL", "300"))  # DNS缓存时间(单位:s)
+REQUEST_TIMEOUT = float(os.getenv("XF_HTTP_TIMEOUT", "60"))  # 默认请求总超时(单位:s)
+
+# 事件循环 -> ClientSession，ClientSession不能跨事件循环使用
+_sessions = weakref.WeakKeyDictionary()
+
+
+async def get_client_session():
+    """获取当前事件循环上的共享ClientSession，首次调用时创建"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=POOL_LIMIT,
+            limit_per_host=POOL_LIMIT_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=DNS_CACHE_TTL
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        )
+        _sessions[loop] = session
+        logger.info("已创建共享HTTP客户端")
+    return session
+
+
+async def close_client_session():
+    """关闭当前事件循环上的共享ClientSession"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.pop(loop, None)
+    if session is not None and not session.closed:
+        await session.close()
+        logger.info("已关闭共享HTTP客户端")
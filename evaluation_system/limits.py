@@ -0,0 +1,184 @@
+"""
+外部服务调用限流模块
+
+为讯飞（星火对话、语音合成、语音听写、表情分析、星火HTTP接口）和阿里云文档解析分别设置令牌桶（QPS）和最大并发数。
+超出配额的调用排队等待，超过排队超时才失败（抛出 RateLimitExceeded），并记录排队/拒绝次数以便观察。
+同一个限流器同时支持异步（acquire）和同步线程（acquire_sync）调用方。
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# 各服务默认配额：rate为每秒请求数，burst为令牌桶容量，max_in_flight为最大并发，timeout为最长排队时间(单位:s)
+# 可通过环境变量覆盖，如 XF_LIMIT_SPARK_CHAT_QPS / _BURST / _CONCURRENCY / _TIMEOUT
+PROVIDER_DEFAULTS = {
+    "spark_chat": {"rate": 5, "burst": 5, "max_in_flight": 10, "timeout": 30},
+    "tts": {"rate": 10, "burst": 10, "max_in_flight": 20, "timeout": 30},
+    "iat": {"rate": 10, "burst": 10, "max_in_flight": 20, "timeout": 30},
+    "face": {"rate": 5, "burst": 5, "max_in_flight": 5, "timeout": 10},
+    "spark_http": {"rate": 2, "burst": 2, "max_in_flight": 2, "timeout": 60},
+    "docmind": {"rate": 2, "burst": 2, "max_in_flight": 2, "timeout": 60},
+}
+
+POLL_INTERVAL = 0.05  # 并发已满时重试获取的间隔(单位:s)
+
+
+class RateLimitExceeded(Exception):
+    """排队超时，调用被限流拒绝"""
+
+    def __init__(self, provider, waited):
+        super().__init__(f"{provider} 调用排队超时（已等待{waited:.1f}秒），请稍后重试")
+        self.provider = provider
+        self.waited = waited
+
+
+class ProviderLimiter:
+    """单个外部服务的令牌桶 + 最大并发限流器"""
+
+    def __init__(self, name, rate=None, burst=None, max_in_flight=None, timeout=30,
+                 clock=time.monotonic, sleep=asyncio.sleep, sync_sleep=time.sleep):
+        self.name = name
+        self.rate = rate  # None表示不限制QPS
+        self.burst = burst or rate or 1
+        self.max_in_flight = max_in_flight  # None表示不限制并发
+        self.timeout = timeout
+        self._clock = clock
+        self._sleep = sleep
+        self._sync_sleep = sync_sleep
+
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._in_flight = 0
+        self._counters = {"calls": 0, "queued": 0, "rejected": 0, "wait_seconds": 0.0}
+
+    def _try_acquire(self):
+        """尝试占用一个名额，成功返回0，否则返回建议等待时间"""
+        with self._lock:
+            now = self._clock()
+            if self.rate:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self.max_in_flight is not None and self._in_flight >= self.max_in_flight:
+                return POLL_INTERVAL
+            if self.rate and self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+
+            if self.rate:
+                self._tokens -= 1
+            self._in_flight += 1
+            return 0
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _record(self, started, queued, rejected=False):
+        with self._lock:
+            self._counters["calls"] += 1
+            self._counters["queued"] += int(queued)
+            self._counters["rejected"] += int(rejected)
+            self._counters["wait_seconds"] += self._clock() - started
+
+    def _next_wait(self, started, wait):
+        """计算本次等待时间，超过排队超时返回None"""
+        remaining = self.timeout - (self._clock() - started)
+        if remaining <= 0:
+            return None
+        return min(wait, remaining)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """异步获取调用名额"""
+        started = self._clock()
+        queued = False
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                break
+            queued = True
+            wait = self._next_wait(started, wait)
+            if wait is None:
+                self._record(started, queued, rejected=True)
+                logger.warning(f"{self.name} 调用排队超时被拒绝")
+                raise RateLimitExceeded(self.name, self._clock() - started)
+            await self._sleep(wait)
+
+        self._record(started, queued)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @contextmanager
+    def acquire_sync(self):
+        """同步获取调用名额（用于线程中执行的同步调用）"""
+        started = self._clock()
+        queued = False
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                break
+            queued = True
+            wait = self._next_wait(started, wait)
+            if wait is None:
+                self._record(started, queued, rejected=True)
+                logger.warning(f"{self.name} 调用排队超时被拒绝")
+                raise RateLimitExceeded(self.name, self._clock() - started)
+            self._sync_sleep(wait)
+
+        self._record(started, queued)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self):
+        """返回调用计数：总调用、排队、拒绝、累计等待时间和当前并发"""
+        with self._lock:
+            return dict(self._counters, in_flight=self._in_flight)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _env_number(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def get_limiter(provider):
+    """获取（首次调用时创建）指定服务的共享限流器"""
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            defaults = PROVIDER_DEFAULTS.get(provider, {})
+            prefix = f"XF_LIMIT_{provider.upper()}"
+            max_in_flight = _env_number(f"{prefix}_CONCURRENCY", defaults.get("max_in_flight"))
+            limiter = ProviderLimiter(
+                provider,
+                rate=_env_number(f"{prefix}_QPS", defaults.get("rate")),
+                burst=_env_number(f"{prefix}_BURST", defaults.get("burst")),
+                max_in_flight=int(max_in_flight) if max_in_flight else None,
+                timeout=_env_number(f"{prefix}_TIMEOUT", defaults.get("timeout", 30))
+            )
+            _limiters[provider] = limiter
+        return limiter
+
+
+def all_stats():
+    """返回所有已创建限流器的调用计数"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -0,0 +1,169 @@
+"""
+大模型响应缓存
+
+以「规范化消息列表 + 模型domain」的哈希作为键，缓存成功的响应：
+- 进程内LRU（条目数上限 + TTL）作为前端；
+- 配置了Django时使用Django缓存作为共享后端（多进程部署时配置Redis等共享缓存即可跨进程命中）；
+- 相同请求并发时只发起一次上游调用（single-flight），其余调用方等待同一个结果。
+缓存为按调用启用（agenerate(..., use_cache=True)），只适合结果可复用的确定性提示词。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from evaluation_system.tts_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+SHARED_KEY_PREFIX = "spark_response_"
+
+
+def normalize_messages(messages):
+    """规范化消息列表：只保留角色和规范化后的内容"""
+    return [{"role": message["role"], "content": normalize_text(message["content"])} for message in messages]
+
+
+class LLMResponseCache:
+    """内存LRU + 共享后端的大模型响应缓存，带并发请求合并"""
+
+    def __init__(self, ttl=3600, max_entries=1024, shared=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared  # Django缓存对象，None表示仅使用进程内缓存
+
+        self._memory = OrderedDict()  # key -> (过期时间, 响应)
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> asyncio.Task
+        self._counters = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "coalesced": 0}
+
+    @staticmethod
+    def make_key(messages, domain):
+        payload = json.dumps(
+            {"domain": domain, "messages": normalize_messages(messages)},
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= time.monotonic():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return response
+
+    def _put_memory(self, key, response):
+        with self._lock:
+            self._memory[key] = (time.monotonic() + self.ttl, response)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    async def get_or_call(self, messages, domain, call):
+        """
+        命中缓存时直接返回，否则调用call()（返回响应字典的协程函数）获取结果
+        只缓存 success 为True的响应；相同请求正在进行时等待其结果
+        """
+        key = self.make_key(messages, domain)
+
+        response = self._get_memory(key)
+        if response is not None:
+            self._count("memory_hits")
+            return response
+
+        loop = asyncio.get_running_loop()
+        task = self._in_flight.get(key)
+        if task is not None and task.get_loop() is loop:
+            self._count("coalesced")
+            return await asyncio.shield(task)
+
+        task = loop.create_task(self._load(key, call))
+        self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key, call):
+        try:
+            if self.shared is not None:
+                try:
+                    response = await self.shared.aget(SHARED_KEY_PREFIX + key)
+                except Exception as e:
+                    logger.warning(f"读取共享响应缓存失败: {str(e)}")
+                    response = None
+                if response is not None:
+                    self._count("shared_hits")
+                    self._put_memory(key, response)
+                    return response
+
+            self._count("misses")
+            response = await call()
+            if response.get("success"):
+                self._put_memory(key, response)
+                if self.shared is not None:
+                    try:
+                        await self.shared.aset(SHARED_KEY_PREFIX + key, response, self.ttl)
+                    except Exception as e:
+                        logger.warning(f"写入共享响应缓存失败: {str(e)}")
+            return response
+        finally:
+            if self._in_flight.get(key) is asyncio.current_task():
+                del self._in_flight[key]
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        """返回命中统计"""
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._memory))
+        total = stats["memory_hits"] + stats["shared_hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_ratio"] = (total - stats["misses"]) / total if total else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _cache_settings():
+    """优先读取Django配置（并使用Django缓存作为共享后端），脚本独立运行时读取环境变量"""
+    try:
+        from django.conf import settings
+        if settings.configured:
+            from django.core.cache import cache
+            return (
+                getattr(settings, "SPARK_CACHE_ENABLED", True),
+                getattr(settings, "SPARK_CACHE_TTL", 3600),
+                getattr(settings, "SPARK_CACHE_MAX_ENTRIES", 1024),
+                cache
+            )
+    except ImportError:
+        pass
+    return (
+        os.getenv("SPARK_CACHE_ENABLED", "True").lower() == "true",
+        int(os.getenv("SPARK_CACHE_TTL", "3600")),
+        int(os.getenv("SPARK_CACHE_MAX_ENTRIES", "1024")),
+        None
+    )
+
+
+def get_llm_cache():
+    """获取进程内共享的大模型响应缓存，未启用时返回None"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            enabled, ttl, max_entries, shared = _cache_settings()
+            if not enabled:
+                return None
+            _cache = LLMResponseCache(ttl=ttl, max_entries=max_entries, shared=shared)
+        return _cache
@@ -11,6 +11,8 @@ import requests
 import os
 from dotenv import load_dotenv
 
+from evaluation_system.limits import get_limiter
+
 # 加载.env文件中的环境变量
 load_dotenv()
 
@@ -66,7 +68,8 @@ class ResumeParser:
                 file_name_extension=file_name.split(".")[-1] if "." in file_name else ""
             )
             runtime = RuntimeOptions()
-            response = self.client.submit_doc_parser_job_advance(request, runtime)
+            with get_limiter("docmind").acquire_sync():
+                response = self.client.submit_doc_parser_job_advance(request, runtime)
             logger.info(f"文件上传成功，订单号: {response.body.data.id}")
             return response.body.to_map()
         except Exception as e:
@@ -77,7 +80,8 @@ class ResumeParser:
         """检查文档解析任务状态"""
         try:
             request = QueryDocParserStatusRequest(id=job_id)
-            response = self.client.query_doc_parser_status(request)
+            with get_limiter("docmind").acquire_sync():
+                response = self.client.query_doc_parser_status(request)
             status = response.body.data.status
             logger.info(f"任务 {job_id} 状态: {status}")
             return response.body.to_map()
@@ -93,7 +97,8 @@ class ResumeParser:
                 layout_step_size=layout_step_size,
                 layout_num=layout_num
             )
-            response = self.client.get_doc_parser_result(request)
+            with get_limiter("docmind").acquire_sync():
+                response = self.client.get_doc_parser_result(request)
             logger.debug(f"获取任务 {job_id} 第{layout_num//layout_step_size + 1}页结果成功")
             return response.body.to_map()
         except Exception as e:
@@ -243,32 +248,33 @@ class XunfeiEvaluator:
                 full_response = ""
                 isFirstContent = True
 
-                response = requests.post(
-                    url=self.api_url,
-                    json=body,
-                    headers=headers,
-                    stream=True,
-                    timeout=30
-                )
-                response.raise_for_status()
-
-                for chunks in response.iter_lines():
-                    if chunks and '[DONE]' not in str(chunks):
-                        data_org = chunks[6:]
-                        try:
-                            chunk = json.loads(data_org)
-                            text = chunk['choices'][0]['delta']
-
-                            if 'content' in text and text['content']:
-                                content = text["content"]
-                                if isFirstContent:
-                                    isFirstContent = False
-                                logger.debug(content)
-                                full_response += content
-
-                        except json.JSONDecodeError as e:
-                            logger.warning(f"JSON解析错误: {e}")
-                            continue
+                with get_limiter("spark_http").acquire_sync():
+                    response = requests.post(
+                        url=self.api_url,
+                        json=body,
+                        headers=headers,
+                        stream=True,
+                        timeout=30
+                    )
+                    response.raise_for_status()
+
+                    for chunks in response.iter_lines():
+                        if chunks and '[DONE]' not in str(chunks):
+                            data_org = chunks[6:]
+                            try:
+                                chunk = json.loads(data_org)
+                                text = chunk['choices'][0]['delta']
+
+                                if 'content' in text and text['content']:
+                                    content = text["content"]
+                                    if isFirstContent:
+                                        isFirstContent = False
+                                    logger.debug(content)
+                                    full_response += content
+
+                            except json.JSONDecodeError as e:
+                                logger.warning(f"JSON解析错误: {e}")
+                                continue
 
                 score = None
                 summary = None
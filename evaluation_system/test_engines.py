@@ -0,0 +1,496 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import aiohttp
+from django.test import SimpleTestCase
+
+
+class FakeWebSocket:
+    """模拟讯飞websocket：reply 根据收到的帧返回要推送的消息列表，None 表示服务端关闭连接"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.sent = []
+        self.closed = False
+        self._incoming = asyncio.Queue()
+
+    async def send_json(self, data):
+        if self.closed:
+            raise ConnectionResetError("Cannot write to closing transport")
+        self.sent.append(data)
+        for message in self.reply(data):
+            self._incoming.put_nowait(message)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self._incoming.get()
+        if message is None:
+            self.closed = True
+            raise StopAsyncIteration
+        return SimpleNamespace(type=aiohttp.WSMsgType.TEXT, data=json.dumps(message))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+
+def _iat_result(text, status):
+    return {"code": 0, "data": {"status": status, "result": {"ws": [{"cw": [{"w": text}]}]}}}
+
+
+class RecognitionSessionTests(SimpleTestCase):
+    """增量语音识别会话测试"""
+
+    def _run(self, replies, chunks, limiter=None):
+        """依次为每个iat连接使用 replies 中的应答函数，推送 chunks 后结束，返回 (识别结果, 各连接)"""
+        from unittest.mock import patch
+        from evaluation_system import audio_recognize_engine
+        from evaluation_system.limits import ProviderLimiter
+
+        sockets = []
+
+        async def ws_connect(url, **kwargs):
+            sockets.append(FakeWebSocket(replies[len(sockets)]))
+            return sockets[-1]
+
+        async def get_client_session():
+            return SimpleNamespace(ws_connect=ws_connect)
+
+        async def run():
+            session = audio_recognize_engine.RecognitionSession(frame_size=4)
+            for chunk in chunks:
+                session.feed(chunk)
+                await asyncio.sleep(0.01)  # 让识别任务和读取结果的任务先处理
+            return await session.finish(timeout=1)
+
+        limiter = limiter or ProviderLimiter("iat", rate=100, burst=100, max_in_flight=1)
+        with patch.object(audio_recognize_engine, "get_credentials", return_value=("app", "key", "secret")), \
+                patch.object(audio_recognize_engine, "get_client_session", get_client_session), \
+                patch.object(audio_recognize_engine, "get_limiter", return_value=limiter):
+            return asyncio.run(run()), sockets
+
+    def test_feed_and_finish(self):
+        def reply(frame):
+            if frame["data"]["status"] == 2:
+                return [_iat_result("你好", 2), None]
+            return []
+
+        result, sockets = self._run([reply], [b"\x00" * 6, b"\x00" * 2])
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["text"], "你好")
+        self.assertFalse(result["truncated"])
+        statuses = [frame["data"]["status"] for frame in sockets[0].sent]
+        self.assertEqual(statuses, [0, 1, 1, 2])
+        self.assertIn("business", sockets[0].sent[0])
+
+    def test_limiter_released_after_connect(self):
+        from evaluation_system.limits import ProviderLimiter
+
+        limiter = ProviderLimiter("iat", rate=100, burst=100, max_in_flight=1)
+        seen = []
+
+        def reply(frame):
+            seen.append(limiter._in_flight)
+            return [_iat_result("好", 2), None] if frame["data"]["status"] == 2 else []
+
+        result, _ = self._run([reply], [b"\x00" * 4], limiter=limiter)
+
+        self.assertTrue(result["success"])
+        self.assertEqual(set(seen), {0})
+
+    def test_reconnects_when_upstream_ends_early(self):
+        def first(frame):
+            return [_iat_result("第一段", 2), None]
+
+        def second(frame):
+            return [_iat_result("第二段", 2), None] if frame["data"]["status"] == 2 else []
+
+        result, sockets = self._run([first, second], [b"\x01" * 4, b"\x02" * 4])
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["text"], "第一段第二段")
+        self.assertEqual(result["segments"], 2)
+        self.assertEqual(len(sockets), 2)
+        self.assertEqual(sockets[1].sent[0]["data"]["status"], 0)
+
+    def test_upstream_error(self):
+        def reply(frame):
+            return [{"code": 10165, "message": "invalid handle"}, None]
+
+        result, _ = self._run([reply], [b"\x00" * 4])
+
+        self.assertFalse(result["success"])
+        self.assertEqual(result["code"], 10165)
+
+    def test_rate_limited(self):
+        from contextlib import asynccontextmanager
+        from evaluation_system.limits import RateLimitExceeded
+
+        class Saturated:
+            @asynccontextmanager
+            async def acquire(self):
+                raise RateLimitExceeded("iat", 0.1)
+                yield
+
+        result, sockets = self._run([], [b"\x00" * 4], limiter=Saturated())
+
+        self.assertFalse(result["success"])
+        self.assertTrue(result["rate_limited"])
+        self.assertEqual(sockets, [])
+
+
+class ClientSessionTests(SimpleTestCase):
+    """共享HTTP客户端测试"""
+
+    def test_reuses_session_per_loop(self):
+        from evaluation_system.http_client import get_client_session, close_client_session
+
+        async def run():
+            first = await get_client_session()
+            second = await get_client_session()
+            await first.close()  # 被意外关闭后重新创建
+            third = await get_client_session()
+            await close_client_session()
+            return first, second, third
+
+        first, second, third = asyncio.run(run())
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, third)
+        self.assertTrue(third.closed)
+
+    def test_close_only_affects_own_loop(self):
+        from evaluation_system.http_client import get_client_session, close_client_session
+
+        loop = asyncio.new_event_loop()
+        try:
+            session = loop.run_until_complete(get_client_session())
+
+            async def other_loop():
+                await close_client_session()  # 当前事件循环上没有客户端
+                other = await get_client_session()
+                await close_client_session()
+                await close_client_session()  # 重复关闭
+                return other
+
+            other = asyncio.run(other_loop())
+
+            self.assertIsNot(session, other)
+            self.assertTrue(other.closed)
+            self.assertFalse(session.closed)
+            self.assertIs(loop.run_until_complete(get_client_session()), session)
+        finally:
+            loop.run_until_complete(close_client_session())
+            loop.close()
+        self.assertTrue(session.closed)
+
+
+def _spark_frame(content, status, code=0):
+    return {
+        "header": {"code": code, "message": "ok" if code == 0 else "invalid", "status": status},
+        "payload": {"choices": {"text": [{"content": content}]}, "usage": {"text": {"total_tokens": 3}}}
+    }
+
+
+class SparkAIEngineTests(SimpleTestCase):
+    """星火大模型引擎测试"""
+
+    def _collect(self, frames, call):
+        """服务端收到请求后依次推送 frames，返回 call(engine) 的结果"""
+        import os
+        from unittest.mock import patch
+        from evaluation_system import evaluate_engine
+
+        sockets = []
+
+        def ws_connect(url, **kwargs):
+            sockets.append(FakeWebSocket(lambda request: frames))
+            return sockets[-1]
+
+        async def get_client_session():
+            return SimpleNamespace(ws_connect=ws_connect)
+
+        credentials = {"XF_APP_ID": "app", "XF_APP_KEY": "key", "XF_APP_SECRET": "secret"}
+        with patch.dict(os.environ, credentials), \
+                patch.object(evaluate_engine, "get_client_session", get_client_session):
+            engine = evaluate_engine.SparkAIEngine()
+            result = asyncio.run(call(engine))
+        self.assertEqual(sockets[0].sent[0]["payload"]["message"]["text"][-1]["content"], "问题")
+        return result
+
+    def test_astream_yields_until_last_frame(self):
+        async def call(engine):
+            return [delta async for delta in engine.astream("问题")]
+
+        deltas = self._collect([_spark_frame("你好", 1), _spark_frame("世界", 2), _spark_frame("多余", 2)], call)
+
+        self.assertEqual(deltas, ["你好", "世界"])
+
+    def test_achat_raises_on_error_frame(self):
+        from evaluation_system.evaluate_engine import SparkAPIError
+
+        async def call(engine):
+            with self.assertRaises(SparkAPIError) as raised:
+                async for _ in engine._achat("问题"):
+                    pass
+            return raised.exception
+
+        error = self._collect([_spark_frame("", 2, code=10013)], call)
+
+        self.assertEqual(error.code, 10013)
+
+    def test_closed_before_last_frame_is_an_error(self):
+        from evaluation_system.evaluate_engine import SparkAPIError
+
+        async def call(engine):
+            deltas = []
+            with self.assertRaises(SparkAPIError):
+                async for delta in engine.astream("问题"):
+                    deltas.append(delta)
+            return deltas, await engine.agenerate("问题")
+
+        deltas, response = self._collect([_spark_frame("你好", 1), None], call)
+
+        self.assertEqual(deltas, ["你好"])
+        self.assertFalse(response["success"])
+
+
+class FakeClock:
+    """测试用时钟，sleep 直接推进时间"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+    def sync_sleep(self, seconds):
+        self.now += seconds
+
+
+def _fake_limiter(clock, **kwargs):
+    from evaluation_system.limits import ProviderLimiter
+    return ProviderLimiter("stub", clock=clock, sleep=clock.sleep, sync_sleep=clock.sync_sleep, **kwargs)
+
+
+class ProviderLimiterTests(SimpleTestCase):
+    """外部服务限流器测试"""
+
+    def test_queues_calls_beyond_burst(self):
+        """超出令牌桶容量的调用排队等待令牌，而不是直接失败"""
+        clock = FakeClock()
+        limiter = _fake_limiter(clock, rate=2, burst=2, timeout=5)
+        started = []
+
+        async def stub_provider(index):
+            async with limiter.acquire():
+                started.append((index, clock.now))
+
+        async def run():
+            for index in range(4):
+                await stub_provider(index)
+
+        asyncio.run(run())
+
+        self.assertEqual(started, [(0, 0.0), (1, 0.0), (2, 0.5), (3, 1.0)])
+        stats = limiter.stats()
+        self.assertEqual(stats["calls"], 4)
+        self.assertEqual(stats["queued"], 2)
+        self.assertEqual(stats["rejected"], 0)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_rejects_after_queue_timeout(self):
+        """并发已满且排队超时后抛出 RateLimitExceeded"""
+        from evaluation_system.limits import RateLimitExceeded
+
+        clock = FakeClock()
+        limiter = _fake_limiter(clock, max_in_flight=1, timeout=1)
+
+        async def run():
+            async with limiter.acquire():
+                with self.assertRaises(RateLimitExceeded):
+                    async with limiter.acquire():
+                        pass
+                self.assertAlmostEqual(clock.now, 1.0)
+
+            async with limiter.acquire():
+                pass
+
+        asyncio.run(run())
+
+        stats = limiter.stats()
+        self.assertEqual(stats["calls"], 3)
+        self.assertEqual(stats["rejected"], 1)
+
+    def test_sync_callers_share_quota(self):
+        """同步调用方（线程中的SDK调用）与异步调用方共用同一配额"""
+        clock = FakeClock()
+        limiter = _fake_limiter(clock, rate=1, burst=1, timeout=5)
+
+        with limiter.acquire_sync():
+            pass
+        with limiter.acquire_sync():
+            pass
+
+        self.assertAlmostEqual(clock.now, 1.0)
+        self.assertEqual(limiter.stats()["queued"], 1)
+
+
+class TTSCacheTests(SimpleTestCase):
+    """问题语音缓存测试"""
+
+    def setUp(self):
+        import tempfile
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+
+    def test_shares_disk_store_between_instances(self):
+        """磁盘存储在多个进程（实例）间共享，键对文本空白和全半角不敏感"""
+        from evaluation_system.tts_cache import TTSCache
+
+        params = {"vcn": "x4_yezi", "speed": 50}
+        writer = TTSCache(self.cache_dir.name)
+        reader = TTSCache(self.cache_dir.name)
+        key = TTSCache.make_key("请介绍一下你自己。", params)
+
+        self.assertIsNone(reader.get(key))
+        writer.put(key, b"mp3-bytes")
+
+        self.assertEqual(TTSCache.make_key("  请介绍一下你自己。 ", params), key)
+        self.assertNotEqual(TTSCache.make_key("请介绍一下你自己。", {"vcn": "x4_yezi", "speed": 60}), key)
+        self.assertEqual(reader.get(key), b"mp3-bytes")
+        self.assertEqual(reader.get(key), b"mp3-bytes")
+        stats = reader.stats()
+        self.assertAlmostEqual(stats.pop("hit_ratio"), 2 / 3)
+        self.assertEqual(stats, {
+            "memory_hits": 1, "disk_hits": 1, "misses": 1, "memory_bytes": 9, "memory_entries": 1
+        })
+
+    def test_evicts_to_size_limits(self):
+        """内存和磁盘均按字节上限淘汰"""
+        from evaluation_system.tts_cache import TTSCache
+
+        cache = TTSCache(self.cache_dir.name, memory_limit=25, disk_limit=25)
+        keys = [TTSCache.make_key(f"问题{index}", {}) for index in range(3)]
+        for key in keys:
+            cache.put(key, b"x" * 10)
+
+        self.assertEqual(cache.stats()["memory_entries"], 2)
+        self.assertLessEqual(sum(1 for _ in cache._cache_files()), 2)
+
+
+class LLMResponseCacheTests(SimpleTestCase):
+    """大模型响应缓存测试"""
+
+    def test_coalesces_identical_requests(self):
+        """相同请求并发时只调用一次上游，失败响应不缓存"""
+        from evaluation_system.llm_cache import LLMResponseCache
+
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"success": True, "content": "评估结果"}
+
+        async def failing():
+            calls.append(1)
+            return {"success": False, "error": "限流"}
+
+        async def run():
+            cache = LLMResponseCache(ttl=60, max_entries=2)
+            messages = [{"role": "user", "content": "评估面试回答: 你好"}]
+            results = await asyncio.gather(*[cache.get_or_call(messages, "generalv3", upstream) for _ in range(5)])
+            # 空白差异规范化后视为同一请求
+            again = await cache.get_or_call([{"role": "user", "content": " 评估面试回答:  你好 "}], "generalv3", upstream)
+
+            other = [{"role": "user", "content": "另一个问题"}]
+            await cache.get_or_call(other, "generalv3", failing)
+            await cache.get_or_call(other, "generalv3", failing)
+            return results, again, cache.stats()
+
+        results, again, stats = asyncio.run(run())
+
+        self.assertTrue(all(result["content"] == "评估结果" for result in results))
+        self.assertEqual(again["content"], "评估结果")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(stats["coalesced"], 4)
+        self.assertEqual(stats["memory_hits"], 1)
+        self.assertEqual(stats["misses"], 3)
+
+
+class FacialEngineTests(SimpleTestCase):
+    """表情分析引擎测试"""
+
+    def test_prepare_image_passes_small_jpeg_through(self):
+        """符合大小上限的完整JPEG原样上传，其他情况解码后重新编码"""
+        import cv2
+        import numpy as np
+        from evaluation_system.facial_engine import prepare_image
+
+        image = np.random.randint(0, 255, (480, 640, 3), np.uint8)
+        jpeg = cv2.imencode(".jpg", image)[1].tobytes()
+        png = cv2.imencode(".png", image)[1].tobytes()
+
+        self.assertIs(prepare_image(jpeg), jpeg)
+        self.assertEqual(prepare_image(png)[:3], b"\xff\xd8\xff")
+
+        resized = prepare_image(jpeg, max_bytes=len(jpeg) // 4)
+        self.assertLessEqual(len(resized), len(jpeg) // 4)
+        self.assertLess(cv2.imdecode(np.frombuffer(resized, np.uint8), cv2.IMREAD_COLOR).shape[1], 640)
+
+        self.assertIsNone(prepare_image(b"\xff\xd8\xff" + b"x" * 100))  # 截断的JPEG需要解码检查
+        self.assertIsNone(prepare_image(b"not an image"))
+
+    def test_analyze_frames_pipelines_requests(self):
+        """批量分析多帧时请求并发进行，总耗时接近一次往返"""
+        import os
+        import time
+        from unittest.mock import patch
+        import numpy as np
+        from aiohttp import web
+        from evaluation_system.facial_engine import FacialExpressionAnalyzer
+        from evaluation_system.http_client import close_client_session
+
+        received = []
+
+        async def expression(request):
+            received.append(await request.read())
+            await asyncio.sleep(0.2)
+            return web.json_response({"code": 0, "data": {"fileList": [{"code": 0, "label": 7, "rate": 0.8}]}})
+
+        async def run():
+            app = web.Application()
+            app.router.add_post("/v1/expression", expression)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                analyzer = FacialExpressionAnalyzer()
+                analyzer.URL = f"http://127.0.0.1:{port}/v1/expression"
+                frames = [np.full((48, 64, 3), value, np.uint8) for value in (0, 80, 160, 240)]
+                started = time.perf_counter()
+                results = await analyzer.analyze_frames(frames, concurrency=4)
+                return results, time.perf_counter() - started
+            finally:
+                await close_client_session()
+                await runner.cleanup()
+
+        with patch.dict(os.environ, {"XF_APP_ID": "test_appid", "XF_API_KEY": "test_key"}):
+            results, elapsed = asyncio.run(run())
+
+        self.assertEqual([result["data"]["face_0"]["expression"] for result in results], ["neutral"] * 4)
+        self.assertEqual(len(received), 4)
+        self.assertTrue(all(body[:3] == b"\xff\xd8\xff" for body in received))
+        self.assertLess(elapsed, 0.6)
@@ -0,0 +1,222 @@
+"""
+语音合成结果缓存
+
+以「规范化文本 + 发音人/格式等合成参数」的哈希作为键：
+- 内存LRU作为前端，命中时直接返回；
+- 磁盘存储（默认 MEDIA_ROOT/tts_cache）作为后端，多个工作进程共享，写入采用临时文件+原子替换；
+- 内存和磁盘均按总字节数上限淘汰（磁盘按最近访问时间）。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE_SUFFIX = ".mp3"
+
+
+def normalize_text(text):
+    """规范化文本：全半角统一、去除首尾空白、合并连续空白"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class TTSCache:
+    """内存LRU + 磁盘共享存储的两级语音缓存"""
+
+    def __init__(self, root, memory_limit=32 * 1024 * 1024, disk_limit=512 * 1024 * 1024):
+        self.root = root
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None  # 首次写入时统计
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(text, params):
+        """根据规范化文本和合成参数计算缓存键"""
+        payload = json.dumps(
+            {"text": normalize_text(text), "params": params},
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + CACHE_FILE_SUFFIX)
+
+    def get(self, key):
+        """查询缓存，未命中返回None"""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return audio
+
+        audio = self._read_disk(key)
+        with self._lock:
+            if audio is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+        self._remember(key, audio)
+        return audio
+
+    def put(self, key, audio):
+        """写入缓存"""
+        if not audio:
+            return
+        self._remember(key, audio)
+        self._write_disk(key, audio)
+
+    async def aget(self, key):
+        """异步查询：内存命中直接返回，磁盘读取放到线程中执行"""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return audio
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key, audio):
+        """异步写入"""
+        await asyncio.to_thread(self.put, key, audio)
+
+    def stats(self):
+        """返回命中统计"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_bytes"] = self._memory_bytes
+            stats["memory_entries"] = len(self._memory)
+        total = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["memory_hits"] + stats["disk_hits"]) / total if total else 0.0
+        return stats
+
+    def _remember(self, key, audio):
+        if len(audio) > self.memory_limit:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = audio
+            self._memory_bytes += len(audio)
+            while self._memory_bytes > self.memory_limit:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # 记录访问时间，供磁盘淘汰使用
+            return audio
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"读取语音缓存失败: {str(e)}")
+            return None
+
+    def _write_disk(self, key, audio):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"写入语音缓存失败: {str(e)}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_usage()
+            else:
+                self._disk_bytes += len(audio)
+            over_limit = self._disk_bytes > self.disk_limit
+        if over_limit:
+            self._evict_disk()
+
+    def _cache_files(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(CACHE_FILE_SUFFIX):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue  # 已被其他进程淘汰
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _scan_disk_usage(self):
+        return sum(size for _, size, _ in self._cache_files())
+
+    def _evict_disk(self):
+        """淘汰最久未访问的文件，直到占用降到上限的90%"""
+        files = sorted(self._cache_files(), key=lambda item: item[2])
+        usage = sum(size for _, size, _ in files)
+        target = self.disk_limit * 0.9
+        removed = 0
+        for path, size, _ in files:
+            if usage <= target:
+                break
+            try:
+                os.unlink(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            usage -= size
+        with self._lock:
+            self._disk_bytes = usage
+        logger.info(f"语音缓存磁盘淘汰 {removed} 个文件，当前占用 {usage} bytes")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _cache_settings():
+    """优先读取Django配置，脚本独立运行时读取环境变量"""
+    try:
+        from django.conf import settings
+        if settings.configured:
+            return (
+                getattr(settings, "TTS_CACHE_ENABLED", True),
+                getattr(settings, "TTS_CACHE_DIR", os.path.join(settings.MEDIA_ROOT, "tts_cache")),
+                getattr(settings, "TTS_CACHE_MEMORY_MB", 32),
+                getattr(settings, "TTS_CACHE_DISK_MB", 512),
+            )
+    except ImportError:
+        pass
+    return (
+        os.getenv("TTS_CACHE_ENABLED", "True").lower() == "true",
+        os.getenv("TTS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_cache")),
+        int(os.getenv("TTS_CACHE_MEMORY_MB", "32")),
+        int(os.getenv("TTS_CACHE_DISK_MB", "512")),
+    )
+
+
+def get_tts_cache():
+    """获取进程内共享的语音缓存，未启用时返回None"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            enabled, root, memory_mb, disk_mb = _cache_settings()
+            if not enabled:
+                return None
+            _cache = TTSCache(root, memory_limit=memory_mb * 1024 * 1024, disk_limit=disk_mb * 1024 * 1024)
+        return _cache
@@ -1,11 +1,21 @@
 import base64
+import functools
 
 from channels.generic.websocket import AsyncWebsocketConsumer
 import json
 import logging
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from .face_cache import get_session_cache, release_session_cache
+from . import speculation
+from .ingest import SessionIngestQueue
 from .models import InterviewSession
-from .services import process_live_media, generate_initial_question, process_image_data, process_text_answer
+from .protocol import decode_frame, encode_frame, FrameError, FRAME_TYPE_NAMES, FRAME_VERSION, \
+    FRAME_TYPE_QUESTION_AUDIO, FRAME_FLAG_LAST, CLIENT_FRAME_TYPES
+from .services import process_live_media, generate_initial_question, process_image_data, process_text_answer, \
+    process_audio_stream, safe_base64_decode, resume_session, open_video_stream
+from .turn_state import acknowledge_sequence
+from evaluation_system.audio_recognize_engine import RecognitionSession
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +24,11 @@ class LiveStreamConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         """处理WebSocket连接建立"""
         self.session_id = self.scope["url_route"]["kwargs"].get("session_id")
+        self.binary_frames = False
+        self.turn_queue = None
+        self.media_queue = None
+        self.recognition = None
+        self.video_stream = None
         if not self.session_id:
             await self.close(code=4000)
             return
@@ -33,8 +48,45 @@ class LiveStreamConsumer(AsyncWebsocketConsumer):
         await self.accept()
         logger.info(f"WebSocket连接建立，会话ID: {self.session_id}")
 
-        # 生成初始问题
-        await generate_initial_question(self.session)
+        # 回答类任务（音频、文本）涉及ASR+LLM+TTS，必须按序执行；视频/图片分析相互独立，可并行
+        self.turn_queue = SessionIngestQueue(
+            f"turn-{self.session_id}",
+            maxsize=getattr(settings, "INTERVIEW_TURN_QUEUE_SIZE", 4)
+        )
+        self.media_queue = SessionIngestQueue(
+            f"media-{self.session_id}",
+            maxsize=getattr(settings, "INTERVIEW_MEDIA_QUEUE_SIZE", 16),
+            workers=getattr(settings, "INTERVIEW_MEDIA_QUEUE_WORKERS", 2)
+        )
+        self.turn_queue.start()
+        self.media_queue.start()
+        get_session_cache(self.session_id)  # 表情分析缓存随连接创建、断开时释放，后台任务只查找不创建
+
+        # 生成初始问题或重连时回放当前问题（放入回答队列，保证先于候选人的回答执行，且不阻塞消息接收）
+        self.turn_queue.submit(self._start_or_resume)
+
+    async def _start_or_resume(self):
+        """新会话生成初始问题；重连时恢复会话，回放当前问题而不重新生成"""
+        resumed = await resume_session(self.session)
+        if resumed is None:
+            await generate_initial_question(self.session)
+            return
+
+        await self.send(text_data=json.dumps({
+            "type": "session_resumed",
+            "pending": resumed["pending"],  # 为True时问题正在生成，完成后推送
+            "question_id": resumed.get("question_id"),
+            "question_number": resumed.get("question_number"),
+            "last_seq": resumed["last_seq"]  # 客户端应重发序号大于此值的回答
+        }))
+        if not resumed["pending"]:
+            await self.send(text_data=json.dumps({
+                "type": "question",
+                "audio_data": base64.b64encode(resumed["audio_data"]).decode('utf-8'),
+                "question_text": resumed["question_text"],
+                "audio_streaming": False,
+                "replayed": True
+            }))
 
     async def receive(self, text_data=None, bytes_data=None):
         """处理接收到的消息"""
@@ -43,84 +95,41 @@ class LiveStreamConsumer(AsyncWebsocketConsumer):
                 data = json.loads(text_data)
                 message_type = data.get("type")
 
-                if message_type.lower() == "audio":
-                    # 处理音频数据
-                    result = await process_live_media(
-                        self.session_id,
-                        data.get("data"),
-                        data.get("timestamp"),
-                        self.scope["user"].id if self.scope.get("user") else None,
-                        media_type="audio"
-                    )
-                    await self.send(text_data=json.dumps({
-                        "type": "audio_ack",
-                        "success": result["success"],
-                        "message": result.get("message", ""),
-                        "answer": result.get("answer", ""),  # 添加识别结果
-                        "timestamp": data.get("timestamp")
-                    }))
+                if message_type.lower() == "video" and self._video_streaming:
+                    # 视频片段直接送入会话的视频流（不经过队列，保证片段顺序）
+                    await self._handle_video_chunk(data.get("data"), data.get("timestamp"), seq=data.get("seq"))
 
-                elif message_type.lower() == "video":
-                    # 处理视频数据
-                    result = await process_live_media(
-                        self.session_id,
-                        data.get("data"),
-                        data.get("timestamp"),
-                        self.scope["user"].id if self.scope.get("user") else None,
-                        media_type="video"
+                elif message_type.lower() in ("audio", "video", "image"):
+                    # 处理base64编码的媒体数据
+                    await self._enqueue(
+                        message_type.lower(), data.get("data"), data.get("timestamp"), seq=data.get("seq")
                     )
-                    await self.send(text_data=json.dumps({
-                        "type": "video_ack",
-                        "success": result["success"],
-                        "message": result.get("message", ""),
-                        "timestamp": data.get("timestamp")
-                    }))
 
-                elif message_type.lower() == "image":
-                    # 处理图片数据
-                    result = await process_image_data(
-                        self.session_id,
-                        data.get("data"),
-                        data.get("timestamp")
+                elif message_type.lower() in ("audio_chunk", "audio_end"):
+                    # 流式语音识别：候选人说话过程中持续推送音频片段
+                    await self._handle_audio_stream(
+                        message_type.lower(), data.get("data"), data.get("timestamp"), seq=data.get("seq")
                     )
-                    await self.send(text_data=json.dumps({
-                        "type": "image_ack",
-                        "success": result["success"],
-                        "message": result.get("message", ""),
-                        "timestamp": data.get("timestamp"),
-                        "analysis": result.get("data", {})
-                    }))
 
                 elif message_type.lower() == "text":
                     # 处理文本回答
                     answer_text = data.get("data", "")
-                    timestamp = data.get("timestamp", "")
                     logger.info(f"收到文本回答: {answer_text[:50]}...")
-
-                    # 处理文本回答并生成新问题
-                    result = await process_text_answer(
-                        self.session_id,
-                        answer_text,
-                        timestamp
-                    )
-
-                    await self.send(text_data=json.dumps({
-                        "type": "text_ack",
-                        "success": result["success"],
-                        "message": result.get("message", ""),
-                        "timestamp": timestamp
-                    }))
+                    await self._enqueue("text", answer_text, data.get("timestamp", ""), seq=data.get("seq"))
 
                 elif message_type == "control":
                     # 处理控制消息
                     control_action = data.get("action")
                     logger.info(f"收到控制消息: {control_action}")
                 elif message_type == "connect":
-                    # 处理连接确认消息
+                    # 处理连接确认消息，客户端可协商启用二进制帧
                     logger.info("收到连接确认消息")
+                    self.binary_frames = bool(data.get("binary"))
                     await self.send(text_data=json.dumps({
                         "type": "connect_ack",
-                        "message": "连接已建立"
+                        "message": "连接已建立",
+                        "binary": self.binary_frames,
+                        "frame_version": FRAME_VERSION
                     }))
                 else:
                     logger.warning(f"未知消息类型: {message_type}")
@@ -136,15 +145,194 @@ class LiveStreamConsumer(AsyncWebsocketConsumer):
                     "type": "parse_error"
                 }))
         elif bytes_data:
-            logger.warning("收到原始二进制数据，应使用base64编码")
+            if not self.binary_frames:
+                logger.warning("收到原始二进制数据，但未协商二进制帧协议")
+                await self.send(text_data=json.dumps({
+                    "type": "error",
+                    "message": "请先在connect消息中协商二进制帧协议，或使用base64编码的文本数据"
+                }))
+                return
+
+            try:
+                frame = decode_frame(bytes_data)
+            except FrameError as e:
+                logger.error(f"二进制帧解析失败: {str(e)}")
+                await self.send(text_data=json.dumps({
+                    "error": str(e),
+                    "type": "parse_error"
+                }))
+                return
+
+            if frame.type not in CLIENT_FRAME_TYPES:
+                logger.warning(f"客户端发送了不允许的帧类型: {frame.type}")
+                await self.send(text_data=json.dumps({
+                    "error": f"客户端不能发送该类型的帧: {FRAME_TYPE_NAMES[frame.type]}",
+                    "type": "parse_error",
+                    "seq": frame.seq
+                }))
+                return
+
+            frame_name = FRAME_TYPE_NAMES[frame.type]
+            if frame_name in ("audio_chunk", "audio_end"):
+                await self._handle_audio_stream(frame_name, frame.payload, frame.timestamp, seq=frame.seq)
+            elif frame_name == "video" and self._video_streaming:
+                await self._handle_video_chunk(frame.payload, frame.timestamp, seq=frame.seq)
+            else:
+                await self._enqueue(frame_name, frame.payload, frame.timestamp, seq=frame.seq)
+
+    async def _handle_audio_stream(self, message_type, payload, timestamp, seq=None):
+        """音频片段直接转发给识别会话（不经过队列），结束消息将识别结果的处理放入回答队列"""
+        if message_type == "audio_chunk":
+            chunk = safe_base64_decode(payload)
+            if chunk is None:
+                await self.send(text_data=json.dumps({
+                    "type": "error",
+                    "message": "音频片段解码失败",
+                    "timestamp": timestamp
+                }))
+                return
+            if self.recognition is None:
+                self.recognition = RecognitionSession()
+                self.recognition.open()
+                logger.info(f"开始流式语音识别，会话ID: {self.session_id}")
+            self.recognition.feed(chunk)
+            return
+
+        recognition, self.recognition = self.recognition, None
+        if recognition is None:
             await self.send(text_data=json.dumps({
                 "type": "error",
-                "message": "请使用base64编码的文本数据"
+                "message": "没有正在进行的流式音频",
+                "timestamp": timestamp
             }))
+            return
+        await self._enqueue("audio_end", recognition, timestamp, seq=seq)
+
+    @property
+    def _video_streaming(self):
+        return getattr(settings, "INTERVIEW_VIDEO_STREAMING", True)
+
+    async def _handle_video_chunk(self, payload, timestamp, seq=None):
+        """视频片段送入会话的视频流，在内存中增量解码和抽帧分析"""
+        chunk = safe_base64_decode(payload)
+        if chunk is None:
+            await self.send(text_data=json.dumps({
+                "type": "error",
+                "message": "视频片段解码失败",
+                "timestamp": timestamp
+            }))
+            return
+        if self.video_stream is None:
+            self.video_stream = open_video_stream(self.session_id)
+            logger.info(f"开始视频流解码，会话ID: {self.session_id}")
+        if not self.video_stream.feed(chunk):
+            # 解码跟不上或长时间没有空闲的解码名额，深度以未解码的字节数表示
+            await self._send_busy(
+                "video_chunk", self.video_stream.buffered, self.video_stream.max_buffer, timestamp, seq
+            )
+            return
+
+        ack = {
+            "type": "video_ack",
+            "success": True,
+            "status": "streaming",
+            "timestamp": timestamp
+        }
+        if seq is not None:
+            ack["seq"] = seq
+        await self.send(text_data=json.dumps(ack))
+
+    async def _enqueue(self, message_type, payload, timestamp, seq=None):
+        """将消息放入对应队列并立即确认，队列已满时回复繁忙"""
+        queue = self.turn_queue if message_type in ("audio", "audio_end", "text") else self.media_queue
+        job = functools.partial(self._process_message, message_type, payload, timestamp, seq)
+
+        if not queue.submit(job):
+            await self._send_busy(message_type, queue.depth, queue.maxsize, timestamp, seq)
+            if message_type == "audio_end":
+                await payload.abort()
+            return
+
+        ack = {
+            "type": f"{message_type}_ack",
+            "success": True,
+            "status": "queued",
+            "queue_depth": queue.depth,
+            "timestamp": timestamp
+        }
+        if seq is not None:
+            ack["seq"] = seq
+        await self.send(text_data=json.dumps(ack))
+
+    async def _send_busy(self, message_type, depth, max_depth, timestamp, seq=None):
+        """回复繁忙，客户端应稍后重发该消息"""
+        busy = {
+            "type": "busy",
+            "message": "服务器繁忙，请稍后重试",
+            "media_type": message_type,
+            "queue_depth": depth,
+            "max_depth": max_depth,
+            "timestamp": timestamp
+        }
+        if seq is not None:
+            busy["seq"] = seq
+        await self.send(text_data=json.dumps(busy))
+
+    async def _process_message(self, message_type, payload, timestamp, seq=None):
+        """队列工作协程中执行的实际处理，完成后回复 *_result 消息"""
+        if message_type == "text":
+            result = await process_text_answer(self.session_id, payload, timestamp)
+        elif message_type == "audio_end":
+            result = await process_audio_stream(self.session_id, payload, timestamp)
+        elif message_type == "image":
+            result = await process_image_data(self.session_id, payload, timestamp)
+        else:
+            result = await process_live_media(
+                self.session_id,
+                payload,
+                timestamp,
+                self.scope["user"].id if self.scope.get("user") else None,
+                media_type=message_type
+            )
+
+        reply = {
+            "type": f"{message_type}_result",
+            "success": result["success"],
+            "message": result.get("message", result.get("error", "")),
+            "timestamp": timestamp
+        }
+        if message_type in ("audio", "audio_end"):
+            reply["answer"] = result.get("answer", "")  # 添加识别结果
+        elif message_type == "image":
+            reply["analysis"] = result.get("data", {})
+        if seq is not None:
+            reply["seq"] = seq
+            if message_type in ("text", "audio", "audio_end") and isinstance(seq, int):
+                await acknowledge_sequence(self.session_id, seq)
+
+        try:
+            await self.send(text_data=json.dumps(reply))
+        except Exception as e:
+            logger.warning(f"发送处理结果失败（连接可能已断开）: {str(e)}")
 
     async def disconnect(self, close_code):
         """处理WebSocket连接断开"""
         logger.info(f"WebSocket连接断开，会话ID: {self.session_id}，关闭代码: {close_code}")
+        for queue in (self.turn_queue, self.media_queue):
+            if queue:
+                for job in queue.close():
+                    # 排队中的 audio_end 任务持有尚未结束的识别会话，需要主动放弃
+                    if isinstance(job, functools.partial) and job.args[0] == "audio_end":
+                        await job.args[1].abort()
+        if self.recognition:
+            await self.recognition.abort()
+            self.recognition = None
+        if self.video_stream:
+            # 剩余的片段和帧在后台继续解码、分析
+            self.video_stream.close()
+            self.video_stream = None
+        release_session_cache(self.session_id)
+        speculation.discard(self.session_id)
 
     # 修改消息处理函数名以匹配utils.py中的类型
     async def send_audio_and_text(self, event):
@@ -157,8 +345,59 @@ class LiveStreamConsumer(AsyncWebsocketConsumer):
             await self.send(text_data=json.dumps({
                 "type": "question",
                 "audio_data": audio_data,  # 现在是base64字符串
-                "question_text": event["question_text"]
+                "question_text": event["question_text"],
+                "audio_streaming": event.get("audio_streaming", False)
             }))
             logger.info(f"已发送问题和音频数据，问题长度: {len(event['question_text'])}")
         except Exception as e:
-            logger.error(f"发送音频和文本失败: {str(e)}", exc_info=True)
\ No newline at end of file
+            logger.error(f"发送音频和文本失败: {str(e)}", exc_info=True)
+
+    async def send_question_delta(self, event):
+        """发送流式生成的问题文本片段"""
+        try:
+            await self.send(text_data=json.dumps({
+                "type": "question_delta",
+                "delta": event["delta"],
+                "index": event["index"],
+                "reset": event["reset"]
+            }))
+        except Exception as e:
+            logger.error(f"发送问题文本片段失败: {str(e)}", exc_info=True)
+
+    async def send_question_audio_start(self, event):
+        """问题语音开始标记，之后的question_audio_chunk属于该问题，完整问题随后以question消息发送"""
+        try:
+            await self.send(text_data=json.dumps({
+                "type": "question_audio_start",
+                "question_text": event["question_text"],
+                "audio_streaming": True
+            }))
+        except Exception as e:
+            logger.error(f"发送问题语音开始标记失败: {str(e)}", exc_info=True)
+
+    async def send_evaluation_ready(self, event):
+        """发送后台完成的回答评估结果"""
+        try:
+            await self.send(text_data=json.dumps(dict(event["evaluation"], type="evaluation_ready")))
+        except Exception as e:
+            logger.error(f"发送评估结果失败: {str(e)}", exc_info=True)
+
+    async def send_audio_chunk(self, event):
+        """发送流式合成的问题语音片段，已协商二进制帧时直接发送原始MP3字节"""
+        try:
+            if self.binary_frames:
+                await self.send(bytes_data=encode_frame(
+                    FRAME_TYPE_QUESTION_AUDIO,
+                    event["audio_data"],
+                    seq=event["index"],
+                    flags=FRAME_FLAG_LAST if event["is_last"] else 0
+                ))
+            else:
+                await self.send(text_data=json.dumps({
+                    "type": "question_audio_chunk",
+                    "index": event["index"],
+                    "audio_data": base64.b64encode(event["audio_data"]).decode('utf-8'),
+                    "is_last": event["is_last"]
+                }))
+        except Exception as e:
+            logger.error(f"发送问题语音片段失败: {str(e)}", exc_info=True)
\ No newline at end of file
@@ -0,0 +1,168 @@
+# interview_manager/context.py
+"""
+面试会话的对话上下文
+
+从数据库中的问题（InterviewQuestion）和回答（ResponseAnalysis.speech_text）构建传给大模型的历史对话：
+- 使用本地估算的token数控制历史长度，超出预算的较早轮次不再逐条传入；
+- 较早的轮次在后台压缩为滚动摘要（存放在Django缓存中），以系统消息的形式放在历史最前面。
+这样面试轮次增加时提示词长度（以及星火接口的延迟和费用）基本保持不变。
+"""
+import asyncio
+import logging
+import math
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from evaluation_system.evaluate_engine import spark_ai_engine
+from evaluation_system.models import ResponseAnalysis
+from .models import InterviewQuestion
+
+logger = logging.getLogger(__name__)
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+MESSAGE_OVERHEAD_TOKENS = 4  # 每条消息的角色等额外开销
+
+SUMMARY_PROMPT = (
+    "请将以下面试对话压缩为一段简洁的摘要（不超过{limit}字），保留已考察的知识点、候选人回答的要点和表现：\n"
+    "{previous}{dialogue}"
+)
+
+# 星火接口要求历史消息（系统消息之后）以user开始、user和assistant交替，问题由assistant提出，因此在第一个问题前补一条开场消息
+OPENING_MESSAGE = "请开始面试。"
+CONTINUE_MESSAGE = "请继续面试。"
+
+# 正在生成摘要的会话，避免同一会话重复提交
+_summaries_in_flight = set()
+
+
+def estimate_tokens(text):
+    """本地估算token数：中日韩字符按1个token计，其余字符按每4个字符1个token计"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def turn_messages(turn):
+    """单轮问答转换为历史消息"""
+    messages = [{"role": "assistant", "content": turn["question"]}]
+    if turn["answer"]:
+        messages.append({"role": "user", "content": turn["answer"]})
+    return messages
+
+
+def turn_tokens(turn):
+    return sum(estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in turn_messages(turn))
+
+
+def select_turns(turns, budget):
+    """
+    从最近的轮次往前选取，直到超出token预算
+    返回 (保留的轮次, 超出预算的较早轮次)，均按时间顺序排列
+    """
+    used = 0
+    index = len(turns)
+    while index > 0:
+        tokens = turn_tokens(turns[index - 1])
+        if used + tokens > budget:
+            break
+        used += tokens
+        index -= 1
+    return turns[index:], turns[:index]
+
+
+class ConversationContext:
+    """单个面试会话的对话上下文"""
+
+    def __init__(self, session_id, budget=None, summary_limit=None):
+        self.session_id = session_id
+        self.budget = budget or getattr(settings, "INTERVIEW_CONTEXT_TOKEN_BUDGET", 1500)
+        self.summary_limit = summary_limit or getattr(settings, "INTERVIEW_CONTEXT_SUMMARY_LIMIT", 200)
+
+    @property
+    def _summary_key(self):
+        return f"interview_context_summary_{self.session_id}"
+
+    async def _load_summary(self):
+        """返回 {"text": 摘要, "upto": 摘要覆盖到的题号}"""
+        return await cache.aget(self._summary_key) or {"text": "", "upto": 0}
+
+    async def _load_turns(self, after):
+        """读取题号大于after的问答轮次"""
+        def load():
+            questions = list(
+                InterviewQuestion.objects.filter(session_id=self.session_id, question_number__gt=after)
+                .order_by("question_number")
+                .values_list("id", "question_number", "question_text")
+            )
+            answers = {}
+            for question_id, speech_text in (
+                ResponseAnalysis.objects.filter(metadata__question_id__in=[q[0] for q in questions])
+                .order_by("analysis_timestamp")
+                .values_list("metadata__question_id", "speech_text")
+            ):
+                if speech_text:
+                    answers.setdefault(question_id, []).append(speech_text)
+            return [
+                {"question_id": question_id, "number": number, "question": text,
+                 "answer": "\n".join(answers.get(question_id, []))}
+                for question_id, number, text in questions
+            ]
+
+        return await sync_to_async(load)()
+
+    async def history(self, exclude_latest=False):
+        """
+        构建历史对话（Spark消息格式）
+        exclude_latest: 是否排除最近一轮（提示词中已单独包含当前问题和回答时使用）
+        """
+        summary = await self._load_summary()
+        turns = await self._load_turns(summary["upto"])
+        if exclude_latest and turns:
+            turns = turns[:-1]
+
+        budget = self.budget - estimate_tokens(summary["text"])
+        kept, overflow = select_turns(turns, max(budget, 0))
+        if overflow:
+            self._schedule_summary(summary, overflow)
+
+        messages = []
+        if summary["text"]:
+            messages.append({"role": "system", "content": f"此前的面试内容摘要：{summary['text']}"})
+        if kept:
+            messages.append({"role": "user", "content": CONTINUE_MESSAGE if summary["text"] or overflow else OPENING_MESSAGE})
+        for turn in kept:
+            messages.extend(turn_messages(turn))
+        return messages
+
+    def _schedule_summary(self, summary, turns):
+        """在后台把超出预算的轮次并入摘要"""
+        if self.session_id in _summaries_in_flight:
+            return
+        _summaries_in_flight.add(self.session_id)
+        task = asyncio.get_running_loop().create_task(self._summarize(summary, turns))
+        task.add_done_callback(lambda _: _summaries_in_flight.discard(self.session_id))
+
+    async def _summarize(self, summary, turns):
+        dialogue = "\n".join(
+            f"面试官：{turn['question']}\n候选人：{turn['answer'] or '（未回答）'}" for turn in turns
+        )
+        previous = f"已有摘要：{summary['text']}\n" if summary["text"] else ""
+        try:
+            response = await spark_ai_engine.agenerate(
+                SUMMARY_PROMPT.format(limit=self.summary_limit, previous=previous, dialogue=dialogue), []
+            )
+            if not response["success"]:
+                logger.warning(f"会话 {self.session_id} 上下文摘要生成失败: {response.get('error')}")
+                return
+            await cache.aset(
+                self._summary_key,
+                {"text": response["content"].strip(), "upto": turns[-1]["number"]},
+                getattr(settings, "INTERVIEW_TURN_STATE_TTL", 6 * 3600)
+            )
+            logger.info(f"会话 {self.session_id} 上下文摘要已更新至第 {turns[-1]['number']} 题")
+        except Exception as e:
+            logger.error(f"会话 {self.session_id} 上下文摘要生成出错: {str(e)}", exc_info=True)
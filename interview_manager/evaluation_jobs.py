@@ -0,0 +1,117 @@
+# interview_manager/evaluation_jobs.py
+"""
+回答评估后台任务
+
+下一个问题先生成并发送，回答评估（大模型调用 + 写入 AnswerEvaluation）在后台执行：
+- 独立的并发上限，避免评估挤占出题所需的大模型配额；
+- 失败（接口错误、限流）时按指数退避重试；
+- 完成后通过 evaluation_ready 消息推送给客户端，也可通过REST接口查询。
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from evaluation_system.evaluate_engine import spark_ai_engine
+from evaluation_system.models import AnswerEvaluation
+from .structured_reply import extract_score
+from .utils import send_evaluation_ready_to_client
+
+logger = logging.getLogger(__name__)
+
+
+async def evaluate_answer(speech_text):
+    """单独评估回答，返回 (评估文本, 评分)，失败返回None"""
+    evaluation_response = await spark_ai_engine.agenerate(
+        f"评估面试回答: {speech_text}", [], use_cache=True  # 相同回答的评估结果可复用
+    )
+    if not evaluation_response["success"]:
+        return None
+    evaluation_text = evaluation_response["content"]
+    return evaluation_text, extract_score(evaluation_text)
+
+
+async def save_evaluation(session_id, question, analysis, evaluation_text, score):
+    """写入评估结果并通知客户端"""
+    evaluation = await sync_to_async(AnswerEvaluation.objects.create)(
+        question=question,
+        analysis=analysis,
+        evaluation_text=evaluation_text,
+        score=score or 0
+    )
+    await send_evaluation_ready_to_client(session_id, {
+        "success": True,
+        "evaluation_id": evaluation.id,
+        "question_id": question.id,
+        "score": evaluation.score,
+        "evaluation_text": evaluation_text
+    })
+    return evaluation
+
+
+class EvaluationScheduler:
+    """进程内的评估任务调度（并发上限 + 重试）"""
+
+    def __init__(self, concurrency=4, retries=2, retry_delay=1.0):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.retry_delay = retry_delay  # 首次重试等待时间(单位:s)，之后逐次翻倍
+        self._semaphore = None
+        self._tasks = set()
+        self._counters = {"submitted": 0, "succeeded": 0, "failed": 0, "retries": 0}
+
+    def submit(self, session_id, question, analysis, speech_text):
+        """提交评估任务，立即返回"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        task = asyncio.get_running_loop().create_task(
+            self._run(session_id, question, analysis, speech_text)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self._counters["submitted"] += 1
+        return task
+
+    async def _run(self, session_id, question, analysis, speech_text):
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self._counters["retries"] += 1
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+                try:
+                    evaluation = await evaluate_answer(speech_text)
+                    if evaluation is None:
+                        logger.warning(f"评估回答失败（第{attempt + 1}次）")
+                        continue
+                    await save_evaluation(session_id, question, analysis, *evaluation)
+                    self._counters["succeeded"] += 1
+                    return
+                except Exception as e:
+                    logger.error(f"评估任务出错（第{attempt + 1}次）: {str(e)}", exc_info=True)
+
+        self._counters["failed"] += 1
+        logger.error(f"问题 {question.id} 的回答评估失败，已放弃")
+        await send_evaluation_ready_to_client(session_id, {
+            "success": False,
+            "question_id": question.id,
+            "error": "回答评估失败"
+        })
+
+    @property
+    def pending(self):
+        return len(self._tasks)
+
+    async def drain(self, timeout=None):
+        """等待进行中的评估任务完成（服务关闭时调用）"""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+
+    def stats(self):
+        return dict(self._counters, pending=self.pending)
+
+
+evaluation_scheduler = EvaluationScheduler(
+    concurrency=getattr(settings, "INTERVIEW_EVALUATION_CONCURRENCY", 4),
+    retries=getattr(settings, "INTERVIEW_EVALUATION_RETRIES", 2)
+)
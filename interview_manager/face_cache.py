@@ -0,0 +1,178 @@
+# interview_manager/face_cache.py
+"""
+表情分析结果的感知哈希缓存
+
+候选人长时间保持同一姿势时，相邻的图片和视频抽帧几乎相同，却都要调用一次远程表情分析接口。
+每个会话保留最近若干帧的差值哈希（dHash：缩小为9x8灰度图后比较相邻像素，64位）和分析结果，
+新帧与某个缓存帧的汉明距离不超过阈值、且缓存结果未过期时直接复用该结果。
+统计命中次数和节省的接口调用数，会话结束时输出。
+"""
+import asyncio
+import logging
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8  # 哈希为 HASH_SIZE x HASH_SIZE 位
+
+# 会话 -> FaceResultCache
+_caches = {}
+_counters = {"hits": 0, "misses": 0}
+
+
+def dhash(image):
+    """计算BGR或灰度图像的64位差值哈希"""
+    small = cv2.resize(image, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def dhash_jpeg(data):
+    """计算图片字节流的差值哈希（按1/8缩小解码灰度图，比完整解码快得多），无法解码时返回None"""
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    return dhash(image)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class FaceResultCache:
+    """单个会话最近的帧哈希 -> 表情分析结果"""
+
+    def __init__(self, threshold=4, max_age=60, max_entries=8):
+        self.threshold = threshold  # 汉明距离不超过该值视为同一画面
+        self.max_age = max_age  # 缓存结果的有效期(单位:s)，过期后重新调用接口
+        self.max_entries = max_entries
+        self._entries = []  # [(哈希, 写入时间, 结果)]，最新的在最后
+        self.hits = 0
+        self.misses = 0
+
+    def _find(self, image_hash):
+        now = time.monotonic()
+        self._entries = [entry for entry in self._entries if now - entry[1] <= self.max_age]
+        for cached_hash, _, result in reversed(self._entries):
+            if hamming(image_hash, cached_hash) <= self.threshold:
+                return result
+        return None
+
+    def lookup(self, image_hash):
+        """查找相近画面的分析结果，同时记录命中统计"""
+        result = self._find(image_hash)
+        self._count(hit=result is not None)
+        return result
+
+    def store(self, image_hash, result):
+        """只缓存成功且检测到人脸的分析结果（没有数据的结果复用后会被调用方丢弃）"""
+        if not result.get("success") or not result.get("data"):
+            return
+        self._entries.append((image_hash, time.monotonic(), result))
+        del self._entries[:-self.max_entries]
+
+    async def analyze(self, image_hash, call):
+        """命中时返回缓存结果，否则 await call() 并缓存"""
+        if image_hash is not None:
+            result = self.lookup(image_hash)
+            if result is not None:
+                return result
+        result = await call()
+        if image_hash is not None:
+            self.store(image_hash, result)
+        return result
+
+    async def analyze_frames(self, images, analyze_batch):
+        """
+        批量分析：先查缓存，同一批中相近的帧只请求一次
+        analyze_batch 为接收图像列表、返回等长结果列表的协程函数
+        """
+        hashes = await asyncio.to_thread(lambda: [dhash(image) for image in images])
+        results = [None] * len(images)
+        pending = []  # 需要调用接口的帧下标
+        sources = {}  # 帧下标 -> 复用 pending 中第几个请求的结果
+        for index, image_hash in enumerate(hashes):
+            results[index] = self._find(image_hash)
+            if results[index] is not None:
+                self._count(hit=True)
+                continue
+            for position, pending_index in enumerate(pending):
+                if hamming(image_hash, hashes[pending_index]) <= self.threshold:
+                    sources[index] = position
+                    self._count(hit=True)
+                    break
+            else:
+                sources[index] = len(pending)
+                pending.append(index)
+                self._count(hit=False)
+
+        fetched = await analyze_batch([images[index] for index in pending]) if pending else []
+        for position, pending_index in enumerate(pending):
+            self.store(hashes[pending_index], fetched[position])
+        for index, position in sources.items():
+            results[index] = fetched[position]
+        return results
+
+    def _count(self, hit):
+        key = "hits" if hit else "misses"
+        setattr(self, key, getattr(self, key) + 1)
+        _counters[key] += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "calls_saved": self.hits,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+
+def get_session_cache(session_id):
+    """获取会话的表情分析缓存，不存在时创建（在连接建立时调用），未启用时返回None"""
+    threshold = getattr(settings, "INTERVIEW_FACE_CACHE_THRESHOLD", 4)
+    if threshold < 0:
+        return None
+    cache = _caches.get(session_id)
+    if cache is None:
+        cache = _caches[session_id] = FaceResultCache(
+            threshold=threshold,
+            max_age=getattr(settings, "INTERVIEW_FACE_CACHE_MAX_AGE", 60)
+        )
+    return cache
+
+
+def find_session_cache(session_id):
+    """
+    查找会话已有的表情分析缓存，不存在时返回None而不创建
+    供后台任务使用：会话断开、缓存释放后仍在运行的任务不会重新创建缓存（否则该缓存不会再被释放）
+    """
+    return _caches.get(session_id)
+
+
+def release_session_cache(session_id):
+    """会话断开时释放缓存并输出命中统计（进行中的分析仍持有缓存对象，不受影响）"""
+    cache = _caches.pop(session_id, None)
+    if cache is not None and cache.hits + cache.misses:
+        session_stats = cache.stats()
+        logger.info(
+            f"会话 {session_id} 表情分析缓存命中 {session_stats['hits']}/{session_stats['hits'] + session_stats['misses']}，"
+            f"节省 {session_stats['calls_saved']} 次接口调用"
+        )
+
+
+def stats():
+    """返回全进程的表情分析缓存统计：命中、未命中、节省的接口调用数和命中率"""
+    total = _counters["hits"] + _counters["misses"]
+    return dict(
+        _counters,
+        calls_saved=_counters["hits"],
+        hit_ratio=_counters["hits"] / total if total else 0.0,
+        sessions=len(_caches)
+    )
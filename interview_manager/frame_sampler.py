@@ -0,0 +1,226 @@
+# interview_manager/frame_sampler.py
+"""
+按媒体时间戳抽取视频帧
+
+按固定的媒体时间间隔（而不是处理时的墙钟时间）选帧，并保证选中第一帧和最后一帧：
+- grab 模式：逐帧 grab()（只解复用和解码，不做颜色转换和拷贝），只有选中的帧才 retrieve()；
+  最后一帧边读边保留，不在结束后回退定位（帧数未知时每帧都要 retrieve 到同一缓冲区，
+  基准测试中“无索引”视频的耗时接近逐帧read）；
+- seek 模式：按目标时间戳定位（从前一个关键帧开始解码），跳过的帧不经过 grab/retrieve，
+  适合抽帧间隔远大于关键帧间隔的视频；需要能获取视频时长，否则回退到 grab 模式；
+- auto 模式：时长已知且相邻两个抽样点之间的帧数较多时使用 seek，否则使用 grab。
+抽帧是阻塞操作，调用方应放到线程中执行（asyncio.to_thread）。
+
+基准测试：python interview_manager/frame_sampler.py benchmark
+"""
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+SampledFrame = namedtuple("SampledFrame", ["index", "timestamp", "image"])
+
+MODES = ("auto", "grab", "seek")
+SEEK_MIN_FRAMES = 60  # auto模式下，相邻抽样点之间的帧数不少于该值时才使用seek
+
+
+def open_video(video_path):
+    """打开视频文件，默认后端失败时尝试FFmpeg后端，均失败返回None"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+        if not cap.isOpened():
+            return None
+    return cap
+
+
+class FrameSampler:
+    """按媒体时间戳抽帧"""
+
+    def __init__(self, interval=10.0, include_first=True, include_last=True, mode="auto"):
+        if mode not in MODES:
+            raise ValueError(f"不支持的抽帧模式: {mode}")
+        self.interval = interval  # 抽帧间隔(单位:s)
+        self.include_first = include_first
+        self.include_last = include_last
+        self.mode = mode
+
+    def sample(self, video_path):
+        """
+        抽取视频帧，返回 (帧列表, 统计信息)
+        统计信息：实际使用的模式、grab的帧数、retrieve/read（完整解码并转换）的帧数、seek次数
+        无法打开视频时抛出 ValueError
+        """
+        cap = open_video(video_path)
+        if cap is None:
+            raise ValueError("无法打开视频文件")
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS) or 0
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            # 浏览器录制的webm分片通常没有时长信息，帧数为0或负数
+            duration = frame_count / fps if fps > 0 and frame_count > 0 else None
+
+            mode = self.mode
+            if mode == "auto":
+                seekable = duration is not None and self.interval * fps >= SEEK_MIN_FRAMES
+                mode = "seek" if seekable else "grab"
+            elif mode == "seek" and duration is None:
+                mode = "grab"
+
+            stats = {"mode": mode, "grabbed": 0, "decoded": 0, "seeks": 0}
+            if mode == "seek":
+                frames = self._sample_by_seek(cap, frame_count, duration, stats)
+            else:
+                frames = self._sample_by_grab(cap, frame_count, fps, stats)
+            stats["selected"] = len(frames)
+            return frames, stats
+        finally:
+            cap.release()
+
+    def _sample_by_grab(self, cap, frame_count, fps, stats):
+        frames = []
+        next_timestamp = 0.0 if self.include_first else self.interval
+        index = -1
+        last_selected = -1
+        # 到达EOF后无法再retrieve，webm（没有cues时）也不能可靠地按帧序号回退定位，
+        # 因此边读边保留最后一帧：帧数已知时只保留最后约1秒内的帧，帧数未知时每帧都retrieve到同一个缓冲区
+        tail_start = max(frame_count - max(int(fps), 1), 0) if frame_count > 0 else 0
+        last = None  # 最后一个未选中帧的 (序号, 时间戳)
+        buffer = None
+        while cap.grab():
+            index += 1
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if timestamp >= next_timestamp:
+                ok, image = cap.retrieve()
+                stats["decoded"] += 1
+                if ok:
+                    frames.append(SampledFrame(index, timestamp, image))
+                    last_selected = index
+                # 下一个抽样点为当前时间之后的第一个间隔整数倍
+                next_timestamp = (math.floor(timestamp / self.interval) + 1) * self.interval
+            elif self.include_last and index >= tail_start:
+                ok, buffer = cap.retrieve(buffer)
+                stats["decoded"] += 1
+                last = (index, timestamp) if ok else None
+        stats["grabbed"] = index + 1
+
+        if self.include_last and last is not None and last[0] == index and index > last_selected:
+            frames.append(SampledFrame(last[0], last[1], buffer))
+        return frames
+
+    def _sample_by_seek(self, cap, frame_count, duration, stats):
+        targets = []
+        timestamp = 0.0 if self.include_first else self.interval
+        while timestamp < duration:
+            targets.append(timestamp)
+            timestamp += self.interval
+
+        frames = []
+        for timestamp in targets:
+            stats["seeks"] += 1
+            if not cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000):
+                continue
+            ok, image = cap.read()
+            stats["decoded"] += 1
+            if ok:
+                frames.append(SampledFrame(int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1, timestamp, image))
+
+        last_index = frame_count - 1
+        if self.include_last and (not frames or frames[-1].index < last_index):
+            stats["seeks"] += 1
+            if cap.set(cv2.CAP_PROP_POS_FRAMES, last_index):
+                ok, image = cap.read()
+                stats["decoded"] += 1
+                if ok:
+                    frames.append(SampledFrame(last_index, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000, image))
+        return frames
+
+
+def _decode_all(video_path):
+    """原实现：逐帧read()，作为基准对照"""
+    cap = open_video(video_path)
+    decoded = 0
+    while True:
+        ok, _ = cap.read()
+        if not ok:
+            break
+        decoded += 1
+    cap.release()
+    return decoded
+
+
+def _write_synthetic_video(path, seconds, fps=30, size=(640, 480)):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"VP80"), fps, size)
+    for index in range(int(seconds * fps)):
+        image = np.full((size[1], size[0], 3), index % 255, np.uint8)
+        cv2.putText(image, str(index), (20, 120), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 5)
+        writer.write(image)
+    writer.release()
+
+
+def _write_unindexed_video(path, seconds, fps=30, size=(640, 480)):
+    """模拟浏览器 MediaRecorder 的输出：写入不可seek的流，webm没有cues和时长，OpenCV无法得到帧数"""
+    import io
+    import av
+
+    class Sink(io.RawIOBase):
+        def __init__(self, file):
+            self.file = file
+
+        def writable(self):
+            return True
+
+        def write(self, b):
+            return self.file.write(b)
+
+    with open(path, "wb") as file, av.open(Sink(file), mode="w", format="webm") as container:
+        stream = container.add_stream("libvpx", rate=fps)
+        stream.width, stream.height, stream.pix_fmt = size[0], size[1], "yuv420p"
+        for index in range(int(seconds * fps)):
+            image = np.full((size[1], size[0], 3), index % 255, np.uint8)
+            cv2.putText(image, str(index), (20, 120), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 5)
+            container.mux(stream.encode(av.VideoFrame.from_ndarray(image, format="bgr24")))
+        container.mux(stream.encode())
+
+
+def benchmark(interval=10.0, lengths=(5, 30, 120)):
+    """
+    对不同长度的合成webm视频比较各抽帧方式的解码帧数、选中帧数和耗时
+    "无索引"为帧数未知的视频（浏览器录制的webm），grab模式需要每帧retrieve才能保留最后一帧，
+    另列出不保留最后一帧（grab-无末帧）的耗时作为对照
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        print(f"抽帧间隔: {interval}s")
+        print(f"{'视频':>10} {'方式':>10} {'grab帧数':>9} {'解码帧数':>9} {'seek次数':>9} {'选中帧数':>9} {'耗时(ms)':>9}")
+        for seconds in lengths:
+            indexed = os.path.join(temp_dir, f"synthetic_{seconds}s.webm")
+            _write_synthetic_video(indexed, seconds)
+            unindexed = os.path.join(temp_dir, f"unindexed_{seconds}s.webm")
+            _write_unindexed_video(unindexed, seconds)
+
+            for label, path in ((f"{seconds}s", indexed), (f"{seconds}s无索引", unindexed)):
+                started = time.perf_counter()
+                decoded = _decode_all(path)
+                elapsed = (time.perf_counter() - started) * 1000
+                print(f"{label:>10} {'read全部':>10} {0:>9} {decoded:>9} {0:>9} {'-':>9} {elapsed:>9.1f}")
+
+                for mode, include_last in (("grab", True), ("grab", False), ("seek", True), ("auto", True)):
+                    started = time.perf_counter()
+                    frames, stats = FrameSampler(interval=interval, mode=mode, include_last=include_last).sample(path)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    name = mode if include_last else f"{mode}-无末帧"
+                    name = name if stats["mode"] == mode else f"{name}->{stats['mode']}"
+                    print(f"{label:>10} {name:>10} {stats['grabbed']:>9} {stats['decoded']:>9} "
+                          f"{stats['seeks']:>9} {len(frames):>9} {elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark(float(sys.argv[2]) if len(sys.argv) > 2 else 10.0)
+    else:
+        print("用法: python interview_manager/frame_sampler.py benchmark [抽帧间隔秒数]")
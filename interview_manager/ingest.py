@@ -0,0 +1,78 @@
+# interview_manager/ingest.py
+"""
+会话级接收队列
+
+LiveStreamConsumer 将耗时的媒体处理（ASR、LLM、TTS、表情分析）放入有界队列，由后台工作协程按序执行，
+receive() 只负责入队并立即回复确认，队列满时向客户端返回繁忙提示，形成背压。
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SessionIngestQueue:
+    """有界、有序的任务队列，任务为无参数的协程函数"""
+
+    def __init__(self, name, maxsize, workers=1):
+        self.name = name
+        self.maxsize = maxsize
+        self.workers = workers
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks = []
+        self._closed = False
+
+    @property
+    def depth(self):
+        """当前排队中的任务数"""
+        return self._queue.qsize()
+
+    def start(self):
+        """启动工作协程"""
+        for index in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(index)))
+
+    def submit(self, job):
+        """入队任务，队列已满或已关闭时返回False"""
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            logger.warning(f"队列 {self.name} 已满（{self.maxsize}），拒绝新任务")
+            return False
+        return True
+
+    def close(self):
+        """停止接收新任务并丢弃排队任务，正在执行的任务允许完成；返回被丢弃的任务，由调用方释放其持有的资源"""
+        if self._closed:
+            return []
+        self._closed = True
+
+        dropped = []
+        while not self._queue.empty():
+            dropped.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if dropped:
+            logger.info(f"队列 {self.name} 关闭，丢弃 {len(dropped)} 个未处理任务")
+
+        for task in self._tasks:
+            try:
+                self._queue.put_nowait(None)
+            except asyncio.QueueFull:
+                task.cancel()
+        return dropped
+
+    async def _worker(self, index):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job is None:
+                    return
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"队列 {self.name} 工作协程 {index} 执行任务失败: {str(e)}", exc_info=True)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,142 @@
+# interview_manager/planner.py
+"""
+面试规划
+
+第一个问题提出后，根据面试场景（技术领域、场景说明）、用户的简历评估和已经问过的问题，一次大模型调用生成按顺序排列的N个后续问题，
+并在后台依次预合成语音（写入语音缓存）。之后的轮次直接取用规划中的问题，
+只有候选人的回答需要追问（过短、明确表示不会等）时才实时生成追问问题。
+规划存放在Django缓存中：{"questions": [...], "next": 下一个待使用的下标}
+"""
+import asyncio
+import logging
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from evaluation_system.audio_generate_engine import synthesize
+from evaluation_system.evaluate_engine import spark_ai_engine
+from evaluation_system.models import ResumeEvaluation
+from .models import InterviewQuestion, InterviewSession
+
+logger = logging.getLogger(__name__)
+
+PLAN_PROMPT = (
+    "假设你现在是一个面试官，正在对一个应聘{technology_field}岗位的大学生进行面试。\n"
+    "面试场景说明：{description}\n{resume}{asked}"
+    "请按由浅入深的顺序列出接下来要问的{count}个面试问题，要求每个问题比较简短，不要与已经问过的问题重复。"
+    "每行一个问题，以序号开头，不要输出其他内容。"
+)
+
+_LIST_MARKER = re.compile(r"^\s*(?:第?\d+\s*[.、．:：)）]|[-*•])\s*")
+
+# 候选人回答中表示不会/不确定的说法，出现时需要追问
+HESITATION_PHRASES = ("不知道", "不清楚", "不太清楚", "不了解", "不太了解", "没做过", "没用过", "忘了")
+
+# 正在生成规划的会话：session_id -> asyncio.Task
+_plans_in_flight = {}
+
+
+def _plan_key(session_id):
+    return f"interview_plan_{session_id}"
+
+
+def parse_plan(text):
+    """从模型回复中解析问题列表（去掉序号和列表符号；有带序号的行时忽略其余的说明文字）"""
+    lines = [line for line in (text or "").splitlines() if line.strip()]
+    marked = [line for line in lines if _LIST_MARKER.match(line)]
+    questions = []
+    for line in marked or lines:
+        question = _LIST_MARKER.sub("", line).strip()
+        if len(question) >= 4:
+            questions.append(question)
+    return questions
+
+
+def needs_follow_up(answer_text):
+    """根据回答判断是否需要实时生成追问（本地规则，不调用大模型）"""
+    answer = (answer_text or "").strip()
+    if len(answer) < getattr(settings, "INTERVIEW_FOLLOW_UP_MIN_CHARS", 15):
+        return True
+    return any(phrase in answer for phrase in HESITATION_PHRASES)
+
+
+def ensure_plan(session_id):
+    """会话还没有规划时在后台生成（需在事件循环中调用）"""
+    if not getattr(settings, "INTERVIEW_PLAN_ENABLED", True):
+        return None
+    task = _plans_in_flight.get(session_id)
+    if task is None:
+        task = asyncio.get_running_loop().create_task(_create_plan(session_id))
+        _plans_in_flight[session_id] = task
+        task.add_done_callback(lambda _: _plans_in_flight.pop(session_id, None))
+    return task
+
+
+def _load_plan_context(session_id):
+    """读取生成规划所需的面试场景、简历评估和已经问过的问题"""
+    session = InterviewSession.objects.select_related("scenario").get(id=session_id)
+    resume_summary = ResumeEvaluation.objects.filter(user_id=session.user_id) \
+        .values_list("resume_summary", flat=True).first()
+    asked = list(
+        InterviewQuestion.objects.filter(session_id=session_id).order_by("question_number")
+        .values_list("question_text", flat=True)
+    )
+    return session.scenario, resume_summary, asked
+
+
+async def _create_plan(session_id):
+    if await cache.aget(_plan_key(session_id)) is not None:
+        return
+
+    try:
+        scenario, resume_summary, asked = await sync_to_async(_load_plan_context)(session_id)
+        count = getattr(settings, "INTERVIEW_PLAN_SIZE", 6)
+        prompt = PLAN_PROMPT.format(
+            technology_field=scenario.technology_field,
+            description=scenario.description,
+            resume=f"候选人简历评估：{resume_summary}\n" if resume_summary else "",
+            asked="已经问过的问题：\n" + "\n".join(asked) + "\n" if asked else "",
+            count=count
+        )
+        response = await spark_ai_engine.agenerate(prompt, [])
+        if not response["success"]:
+            logger.warning(f"会话 {session_id} 生成面试规划失败: {response.get('error')}")
+            return
+        # 模型仍可能复述已经问过的问题，按文本去重
+        asked_texts = {question.strip() for question in asked}
+        questions = [question for question in parse_plan(response["content"]) if question not in asked_texts][:count]
+        if not questions:
+            logger.warning(f"会话 {session_id} 面试规划无法解析")
+            return
+
+        await cache.aset(
+            _plan_key(session_id),
+            {"questions": questions, "next": 0},
+            getattr(settings, "INTERVIEW_TURN_STATE_TTL", 6 * 3600)
+        )
+        logger.info(f"会话 {session_id} 已生成面试规划，共 {len(questions)} 个问题")
+
+        # 按使用顺序预合成语音，写入语音缓存
+        for question in questions:
+            await synthesize(question)
+    except Exception as e:
+        logger.error(f"会话 {session_id} 生成面试规划出错: {str(e)}", exc_info=True)
+
+
+async def take_planned_question(session_id):
+    """取出规划中的下一个问题，没有规划或已用完返回None"""
+    plan = await cache.aget(_plan_key(session_id))
+    if not plan or plan["next"] >= len(plan["questions"]):
+        return None
+    question = plan["questions"][plan["next"]]
+    plan["next"] += 1
+    await cache.aset(_plan_key(session_id), plan, getattr(settings, "INTERVIEW_TURN_STATE_TTL", 6 * 3600))
+    return question
+
+
+async def has_planned_questions(session_id):
+    """规划中是否还有未使用的问题"""
+    plan = await cache.aget(_plan_key(session_id))
+    return bool(plan) and plan["next"] < len(plan["questions"])
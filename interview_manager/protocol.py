@@ -0,0 +1,72 @@
+# interview_manager/protocol.py
+"""
+WebSocket二进制帧协议
+
+客户端在 connect 消息中携带 "binary": true 协商启用后，音频/视频/图片可直接以二进制帧发送，
+无需JSON + base64编码。帧结构（大端序）：
+
+    magic(1B) | version(1B) | type(1B) | flags(1B) | seq(4B) | timestamp(8B, 毫秒) | payload
+
+JSON文本消息（control/connect/text等）保持不变，两种格式可在同一连接中混用。
+"""
+import struct
+from collections import namedtuple
+
+FRAME_MAGIC = 0xA1
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("!BBBBIQ")
+
+# 帧类型
+FRAME_TYPE_AUDIO = 1
+FRAME_TYPE_VIDEO = 2
+FRAME_TYPE_IMAGE = 3
+FRAME_TYPE_AUDIO_CHUNK = 4  # 流式识别的PCM片段
+FRAME_TYPE_AUDIO_END = 5  # 流式识别结束（负载为空）
+FRAME_TYPE_QUESTION_AUDIO = 6  # 服务端下发的问题语音片段
+
+# 帧标志位
+FRAME_FLAG_LAST = 0x01  # 当前片段为最后一段
+
+FRAME_TYPE_NAMES = {
+    FRAME_TYPE_AUDIO: "audio",
+    FRAME_TYPE_VIDEO: "video",
+    FRAME_TYPE_IMAGE: "image",
+    FRAME_TYPE_AUDIO_CHUNK: "audio_chunk",
+    FRAME_TYPE_AUDIO_END: "audio_end",
+    FRAME_TYPE_QUESTION_AUDIO: "question_audio",
+}
+FRAME_TYPES_BY_NAME = {name: frame_type for frame_type, name in FRAME_TYPE_NAMES.items()}
+# 客户端可以发送的帧类型（问题语音只由服务端下发）
+CLIENT_FRAME_TYPES = frozenset({
+    FRAME_TYPE_AUDIO, FRAME_TYPE_VIDEO, FRAME_TYPE_IMAGE, FRAME_TYPE_AUDIO_CHUNK, FRAME_TYPE_AUDIO_END
+})
+
+Frame = namedtuple("Frame", ["type", "flags", "seq", "timestamp", "payload"])
+
+
+class FrameError(ValueError):
+    """二进制帧格式错误"""
+
+
+def encode_frame(frame_type, payload, seq=0, timestamp=0, flags=0):
+    """将负载打包为二进制帧"""
+    if frame_type not in FRAME_TYPE_NAMES:
+        raise FrameError(f"未知帧类型: {frame_type}")
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, frame_type, flags, seq, timestamp)
+    return header + bytes(payload)
+
+
+def decode_frame(data):
+    """解析二进制帧，返回Frame(type, flags, seq, timestamp, payload)"""
+    if len(data) < FRAME_HEADER.size:
+        raise FrameError(f"帧长度不足: {len(data)} bytes")
+
+    magic, version, frame_type, flags, seq, timestamp = FRAME_HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC:
+        raise FrameError(f"帧标识错误: {magic:#x}")
+    if version != FRAME_VERSION:
+        raise FrameError(f"不支持的帧版本: {version}")
+    if frame_type not in FRAME_TYPE_NAMES:
+        raise FrameError(f"未知帧类型: {frame_type}")
+
+    return Frame(frame_type, flags, seq, timestamp, data[FRAME_HEADER.size:])
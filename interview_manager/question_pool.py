@@ -0,0 +1,190 @@
+# interview_manager/question_pool.py
+"""
+首个面试问题预生成池
+
+每个面试场景维护若干个已生成好的首问（文本 + 合成语音），建立连接时直接取用，
+取用后在后台异步补充到目标数量。池为空（冷启动、补充失败）时由调用方回退到实时生成。
+
+服务启动时预生成需开启 INTERVIEW_FIRST_QUESTION_POOL_WARMUP（默认关闭，避免每个工作进程启动都调用大模型和语音合成），
+否则在第一次取用时才开始补充。
+
+另外，通过REST接口创建会话时即开始准备该会话的首问（schedule_first_question），
+客户端授权摄像头/麦克风、建立WebSocket连接期间完成生成和语音合成，连接后直接取用（claim_prepared_question），
+后续问题的面试规划也同时开始生成。
+"""
+import asyncio
+import logging
+from collections import deque, namedtuple
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+
+from evaluation_system.audio_generate_engine import synthesize
+from evaluation_system.evaluate_engine import spark_ai_engine
+from .models import InterviewScenario
+from .planner import ensure_plan
+
+logger = logging.getLogger(__name__)
+
+FIRST_QUESTION_PROMPT = "假设你现在是一个面试官，正在对一个求职的大学生进行面试，请提出第一个面试问题。要求该问题比较简短。"
+SCENARIO_FIRST_QUESTION_PROMPT = (
+    "假设你现在是一个面试官，正在对一个应聘{technology_field}岗位的大学生进行面试，"
+    "请提出第一个面试问题。要求该问题比较简短。"
+)
+
+PooledQuestion = namedtuple("PooledQuestion", ["question_text", "audio_data"])
+
+# 会话创建后提前准备的首问：session_id -> asyncio.Task（结果为PooledQuestion或None）
+_prepared_questions = {}
+
+
+async def scenario_technology_field(scenario_id):
+    """面试场景的技术领域，场景不存在时返回None"""
+    scenario = await sync_to_async(
+        InterviewScenario.objects.filter(id=scenario_id).only("technology_field").first
+    )()
+    return scenario.technology_field if scenario else None
+
+
+def first_question_prompt(technology_field=None):
+    """生成首问的提示词，有技术领域时针对该领域提问"""
+    if technology_field:
+        return SCENARIO_FIRST_QUESTION_PROMPT.format(technology_field=technology_field)
+    return FIRST_QUESTION_PROMPT
+
+
+async def produce_first_question(technology_field=None):
+    """生成一个首问并合成语音（同时写入语音缓存），失败返回None"""
+    response = await spark_ai_engine.agenerate(first_question_prompt(technology_field), [])
+    if not response["success"]:
+        logger.warning(f"预生成首问失败: {response.get('error')}")
+        return None
+    question_text = response["content"].strip()
+
+    audio_result = await synthesize(question_text)
+    if not audio_result["success"]:
+        logger.warning(f"预生成首问语音失败: {audio_result.get('error')}")
+        return None
+    return PooledQuestion(question_text, audio_result["audio_data"])
+
+
+class FirstQuestionPool:
+    """按面试场景划分的首问池"""
+
+    def __init__(self, target_size=3, max_attempts=None):
+        self.target_size = target_size
+        self.max_attempts = max_attempts or target_size * 2  # 单次补充最多尝试次数，避免接口异常时反复调用
+        self._pools = {}  # scenario_id -> deque[PooledQuestion]
+        self._refills = {}  # scenario_id -> 正在执行的补充任务
+        self._counters = {"hits": 0, "misses": 0, "produced": 0, "failures": 0}
+
+    def size(self, scenario_id):
+        return len(self._pools.get(scenario_id, ()))
+
+    def take(self, scenario_id):
+        """取出一个预生成的首问（池为空返回None），并安排后台补充"""
+        pool = self._pools.get(scenario_id)
+        question = pool.popleft() if pool else None
+        self._counters["hits" if question else "misses"] += 1
+        self.ensure_filled(scenario_id)
+        return question
+
+    def ensure_filled(self, scenario_id):
+        """池未满且没有补充任务在执行时，启动后台补充"""
+        if self.target_size <= 0 or self.size(scenario_id) >= self.target_size:
+            return None
+        task = self._refills.get(scenario_id)
+        if task is None or task.done():
+            task = asyncio.get_running_loop().create_task(self._refill(scenario_id))
+            self._refills[scenario_id] = task
+        return task
+
+    async def _refill(self, scenario_id):
+        pool = self._pools.setdefault(scenario_id, deque())
+        attempts = 0
+        try:
+            technology_field = await self._technology_field(scenario_id)
+            while len(pool) < self.target_size and attempts < self.max_attempts:
+                attempts += 1
+                question = await self._produce(technology_field)
+                if question is None:
+                    self._counters["failures"] += 1
+                    continue
+                if any(item.question_text == question.question_text for item in pool):
+                    continue  # 与池中已有问题重复，重新生成
+                pool.append(question)
+                self._counters["produced"] += 1
+            logger.info(f"场景 {scenario_id} 首问池已补充，当前 {len(pool)} 个")
+        except Exception as e:
+            logger.error(f"补充场景 {scenario_id} 首问池失败: {str(e)}", exc_info=True)
+
+    async def _technology_field(self, scenario_id):
+        return await scenario_technology_field(scenario_id)
+
+    async def _produce(self, technology_field):
+        return await produce_first_question(technology_field)
+
+    def stats(self):
+        """返回命中统计和各场景当前库存"""
+        return dict(self._counters, sizes={scenario_id: len(pool) for scenario_id, pool in self._pools.items()})
+
+
+first_question_pool = FirstQuestionPool(
+    target_size=getattr(settings, "INTERVIEW_FIRST_QUESTION_POOL_SIZE", 3)
+)
+
+
+async def warm_up_first_question_pools():
+    """为所有面试场景启动首问池补充（服务启动时调用）"""
+    scenario_ids = await sync_to_async(list)(InterviewScenario.objects.values_list("id", flat=True))
+    for scenario_id in scenario_ids:
+        first_question_pool.ensure_filled(scenario_id)
+    logger.info(f"已为 {len(scenario_ids)} 个面试场景启动首问池预生成")
+
+
+async def _prepare_first_question(session_id, scenario_id):
+    """准备会话首问：优先取池中的问题，否则实时生成并合成语音"""
+    try:
+        question = first_question_pool.take(scenario_id)
+        if question is None:
+            question = await produce_first_question(await scenario_technology_field(scenario_id))
+        logger.info(f"会话 {session_id} 首问已准备{'完成' if question else '失败'}")
+        return question
+    except Exception as e:
+        logger.error(f"准备会话 {session_id} 首问失败: {str(e)}", exc_info=True)
+        return None
+
+
+async def _start_preparation(session_id, scenario_id):
+    loop = asyncio.get_running_loop()
+    task = loop.create_task(_prepare_first_question(session_id, scenario_id))
+    _prepared_questions[session_id] = task
+    ensure_plan(session_id)
+
+    # 客户端一直未连接时，超时后丢弃准备结果
+    def expire():
+        if _prepared_questions.get(session_id) is task:
+            _prepared_questions.pop(session_id, None)
+            task.cancel()
+    loop.call_later(getattr(settings, "INTERVIEW_PREPARED_QUESTION_TTL", 600), expire)
+
+
+def schedule_first_question(session_id, scenario_id):
+    """
+    在服务主事件循环中启动首问准备（供同步视图调用，立即返回）
+    ASGI下同步视图运行在线程中，async_to_sync会把协程交回主事件循环执行，后台任务随之在主事件循环上运行
+    """
+    try:
+        async_to_sync(_start_preparation)(session_id, scenario_id)
+    except Exception as e:
+        logger.error(f"启动会话 {session_id} 首问准备失败: {str(e)}", exc_info=True)
+
+
+async def claim_prepared_question(session_id):
+    """取出会话提前准备的首问（仍在生成时等待其完成），没有可用结果返回None"""
+    task = _prepared_questions.pop(session_id, None)
+    if task is None:
+        return None
+    if task.cancelled() or task.get_loop() is not asyncio.get_running_loop():
+        return None  # 已过期，或不在同一事件循环（如WSGI下临时创建的事件循环）无法等待
+    return await task
@@ -1,22 +1,33 @@
 import logging
 import base64
-import cv2
+import binascii
 import os
 import subprocess
 import sys  # 新增：用于判断操作系统
+import threading
 from django.conf import settings
 import asyncio
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from asgiref.sync import sync_to_async
 from .models import InterviewSession, InterviewQuestion
-from evaluation_system.models import ResponseMetadata, ResponseAnalysis, AnswerEvaluation
+from evaluation_system.models import ResponseMetadata, ResponseAnalysis
 from evaluation_system.audio_recognize_engine import recognize
-from evaluation_system.facial_engine import FacialExpressionAnalyzer
+from evaluation_system.facial_engine import get_facial_analyzer
 from evaluation_system.evaluate_engine import spark_ai_engine
-from evaluation_system.audio_generate_engine import synthesize
-from interview_manager.utils import send_audio_and_text_to_client  # 修改导入的函数名
-import time  # 新增：用于记录时间
+from evaluation_system.audio_generate_engine import synthesize, synthesize_stream, audio_cache_key, get_cached_audio
+from interview_manager.utils import send_audio_and_text_to_client, send_audio_chunk_to_client, \
+    send_question_delta_to_client, send_question_audio_start_to_client  # 修改导入的函数名
+from interview_manager.question_pool import first_question_pool, first_question_prompt, claim_prepared_question, \
+    scenario_technology_field
+from interview_manager.context import ConversationContext
+from interview_manager.face_cache import find_session_cache, dhash, dhash_jpeg
+from interview_manager.frame_sampler import FrameSampler
+from interview_manager.video_stream import VideoStream
+from interview_manager.evaluation_jobs import evaluation_scheduler, evaluate_answer, save_evaluation
+from interview_manager import speculation
+from interview_manager.planner import ensure_plan, needs_follow_up, take_planned_question
+from interview_manager.structured_reply import TurnReplyParser, build_turn_prompt
+from interview_manager.turn_state import get_turn_state, set_current_question, question_in_flight, \
+    is_question_in_flight
 
 logger = logging.getLogger(__name__)
 
@@ -39,7 +50,7 @@ if sys.platform == 'win32':
 
 
 def safe_base64_decode(base64_data):
-    """安全的base64解码，处理常见的编码问题"""
+    """安全的base64解码，处理常见的编码问题（二进制帧的原始字节直接返回）"""
     try:
         if not base64_data:
             logger.error("Base64数据为空")
@@ -60,20 +71,17 @@ def safe_base64_decode(base64_data):
         # 移除可能的空白字符
         base64_data = base64_data.strip()
 
-        # 验证base64字符集
-        import string
-        valid_chars = set(string.ascii_letters + string.digits + '+/=')
-        if not all(c in valid_chars for c in base64_data):
-            logger.error("Base64数据包含无效字符")
-            return None
-
         # 确保base64字符串长度是4的倍数
         missing_padding = len(base64_data) % 4
         if missing_padding:
             base64_data += '=' * (4 - missing_padding)
 
-        # 解码
-        decoded_data = base64.b64decode(base64_data)
+        # 解码（validate=True 在C层校验字符集，避免逐字符的Python循环）
+        try:
+            decoded_data = base64.b64decode(base64_data, validate=True)
+        except binascii.Error:
+            logger.error("Base64数据包含无效字符")
+            return None
 
         # 验证解码后数据不为空
         if not decoded_data:
@@ -116,11 +124,7 @@ async def process_live_media(session_id, base64_data, timestamp, user_id, media_
                 }
             return {"success": False, "error": result.get("error", "音频处理失败")}
         elif media_type == "video":
-            # 视频处理保持不变
-            file_path = await sync_to_async(_save_media_to_filesystem)(
-                session_id, audio_bytes, timestamp, media_type
-            )
-            asyncio.create_task(_process_video_data(session_id, file_path, timestamp))
+            asyncio.create_task(_process_video_data(session_id, audio_bytes, timestamp))
             return {"success": True, "message": "视频数据接收成功"}
 
     except Exception as e:
@@ -128,21 +132,6 @@ async def process_live_media(session_id, base64_data, timestamp, user_id, media_
         return {"success": False, "error": f"处理失败: {str(e)}"}
 
 
-def _save_media_to_filesystem(session_id, data, timestamp, media_type):
-    """根据媒体类型保存到不同目录"""
-    # 根据媒体类型选择保存目录
-    save_dir=""
-    if media_type == "audio":
-        save_dir = "audio_chunks"
-    elif media_type == "video":
-        save_dir = "video_chunks"
-
-    file_name = f"interview_{session_id}_{timestamp}_{media_type}_{os.urandom(8).hex()}.webm"
-    file_path = default_storage.save(f"{save_dir}/{file_name}", ContentFile(data, name=file_name))
-    logger.info(f"文件保存成功: {file_path}")
-    return file_path
-
-
 async def _process_audio_data(session_id, pcm_bytes, timestamp):
     """专门处理PCM音频数据"""
     try:
@@ -150,154 +139,217 @@ async def _process_audio_data(session_id, pcm_bytes, timestamp):
 
         # 直接使用PCM数据进行语音识别
         result = await recognize(pcm_bytes)
-        if not result["success"]:
-            logger.error(f"语音识别失败: {result.get('error', '未知错误')}")
-            return {"success": False, "error": result.get("error", "语音识别失败")}
+        return await _handle_recognition_result(session_id, result, len(pcm_bytes), timestamp)
 
-        speech_text = result["text"]
-        logger.info(f"语音识别结果: {speech_text[:50]}...")
+    except Exception as e:
+        logger.error(f"处理音频数据失败: {str(e)}", exc_info=True)
+        return {"success": False, "error": str(e)}
 
-        # 计算音频时长（秒）并转换为PostgreSQL interval格式
-        # PCM格式假设: 16kHz采样率, 16位深度, 单声道
-        duration_seconds = len(pcm_bytes) / (16000 * 2)  # 估算秒数 (采样率*位深)
-        duration_interval = f"{duration_seconds} seconds"  # PostgreSQL interval格式
 
-        # 保存识别结果
-        session = await sync_to_async(InterviewSession.objects.get)(id=session_id)
-        current_question = await sync_to_async(
-            InterviewQuestion.objects.filter(session=session).latest
-        )('asked_at')
+async def process_audio_stream(session_id, recognition, timestamp):
+    """结束流式语音识别会话并处理识别结果（音频已在候选人说话时转发给识别服务）"""
+    try:
+        logger.info(f"结束流式语音识别，session_id: {session_id}，已接收 {recognition.audio_bytes} bytes")
+
+        result = await recognition.finish()
+        result = await _handle_recognition_result(session_id, result, recognition.audio_bytes, timestamp)
+        if result.get("success"):
+            return {
+                "success": True,
+                "message": "音频数据接收和处理成功",
+                "answer": result.get("speech_text", "")
+            }
+        return {"success": False, "error": result.get("error", "音频处理失败")}
 
-        metadata = await sync_to_async(ResponseMetadata.objects.create)(
-            question=current_question,
-            audio_duration=duration_interval
-        )
+    except Exception as e:
+        logger.error(f"处理流式音频失败: {str(e)}", exc_info=True)
+        return {"success": False, "error": f"处理失败: {str(e)}"}
 
-        analysis = await sync_to_async(ResponseAnalysis.objects.create)(
-            metadata=metadata,
-            speech_text=speech_text,
-            analysis_timestamp=timestamp
-        )
 
-        # 评估回答并生成新问题
-        await evaluate_and_generate_question(session, speech_text, analysis)
-        logger.info("音频数据处理完成")
+async def _handle_recognition_result(session_id, result, pcm_size, timestamp):
+    """保存语音识别结果，并评估回答、生成新问题"""
+    if not result["success"]:
+        logger.error(f"语音识别失败: {result.get('error', '未知错误')}")
+        return {"success": False, "error": result.get("error", "语音识别失败")}
 
-        return {"success": True, "speech_text": speech_text}
+    speech_text = result["text"]
+    logger.info(f"语音识别结果: {speech_text[:50]}...")
+    if result.get("truncated"):
+        logger.warning(f"会话 {session_id} 的回答只识别了前 {result.get('segments')} 段，其余音频未识别")
 
-    except Exception as e:
-        logger.error(f"处理音频数据失败: {str(e)}", exc_info=True)
-        return {"success": False, "error": str(e)}
+    # 计算音频时长（秒）并转换为PostgreSQL interval格式
+    # PCM格式假设: 16kHz采样率, 16位深度, 单声道
+    duration_seconds = pcm_size / (16000 * 2)  # 估算秒数 (采样率*位深)
+    duration_interval = f"{duration_seconds} seconds"  # PostgreSQL interval格式
 
+    # 保存识别结果
+    session = await sync_to_async(InterviewSession.objects.get)(id=session_id)
+    current_question = await sync_to_async(
+        InterviewQuestion.objects.filter(session=session).latest
+    )('asked_at')
 
-async def _process_video_data(session_id, file_path, timestamp):
-    """专门处理视频数据，避免重复保存"""
-    try:
-        logger.info(f"开始处理视频数据: {file_path}")
+    metadata = await sync_to_async(ResponseMetadata.objects.create)(
+        question=current_question,
+        audio_duration=duration_interval
+    )
 
-        # 从已保存的文件中读取数据
-        with default_storage.open(file_path, 'rb') as f:
-            webm_bytes = f.read()
+    analysis = await sync_to_async(ResponseAnalysis.objects.create)(
+        metadata=metadata,
+        speech_text=speech_text,
+        analysis_timestamp=timestamp
+    )
 
-        logger.info(f"读取视频文件大小: {len(webm_bytes)} bytes")
+    # 评估回答并生成新问题
+    await evaluate_and_generate_question(session, speech_text, analysis)
+    logger.info("音频数据处理完成")
 
-        # 创建视频专用临时文件
-        temp_path = os.path.join(VIDEO_TEMP_DIR, f"video_{timestamp}_{os.urandom(8).hex()}.webm")
-        try:
-            with open(temp_path, 'wb') as f:
-                f.write(webm_bytes)
+    return {"success": True, "speech_text": speech_text}
 
-            # 分析视频帧
-            analysis_result = await _analyze_video_frames(temp_path)
 
-            if not analysis_result.get("success"):
-                logger.error(f"视频分析失败: {analysis_result.get('error', '未知错误')}")
-                return
+async def _process_video_data(session_id, webm_bytes, timestamp):
+    """处理单个视频片段（未启用视频流增量解码时），只写一次临时文件供OpenCV读取"""
+    temp_path = os.path.join(VIDEO_TEMP_DIR, f"video_{timestamp}_{os.urandom(8).hex()}.webm")
+    try:
+        logger.info(f"开始处理视频数据，大小: {len(webm_bytes)} bytes")
+        await asyncio.to_thread(_write_file, temp_path, webm_bytes)
 
-            frame_data = analysis_result.get("data", [])
-            logger.info(f"视频分析完成，共分析{len(frame_data)}帧")
+        # 分析视频帧
+        analysis_result = await _analyze_video_frames(temp_path, session_id)
 
-            # 保存分析结果
-            session = await sync_to_async(InterviewSession.objects.get)(id=session_id)
-            latest_analysis = await sync_to_async(
-                ResponseAnalysis.objects.filter(metadata__question__session=session)
-                .order_by('-analysis_timestamp').first
-            )()
+        if not analysis_result.get("success"):
+            logger.error(f"视频分析失败: {analysis_result.get('error', '未知错误')}")
+            return
 
-            if latest_analysis:
-                valid_data = [d for d in frame_data if d.get("analysis")]
-                latest_analysis.facial_expression = str(valid_data)
-                await sync_to_async(latest_analysis.save)()
-                logger.info("视频分析结果保存成功")
+        frame_data = analysis_result.get("data", [])
+        logger.info(f"视频分析完成，共分析{len(frame_data)}帧")
 
-        finally:
-            # 清理临时文件
-            if os.path.exists(temp_path):
-                try:
-                    os.unlink(temp_path)
-                    logger.info(f"清理临时视频文件: {temp_path}")
-                except Exception as e:
-                    logger.warning(f"删除临时视频文件失败: {str(e)}")
+        # 保存分析结果
+        session = await sync_to_async(InterviewSession.objects.get)(id=session_id)
+        latest_analysis = await sync_to_async(
+            ResponseAnalysis.objects.filter(metadata__question__session=session)
+            .order_by('-analysis_timestamp').first
+        )()
+
+        if latest_analysis:
+            valid_data = [d for d in frame_data if d.get("analysis")]
+            latest_analysis.facial_expression = str(valid_data)
+            await sync_to_async(latest_analysis.save)()
+            logger.info("视频分析结果保存成功")
 
     except Exception as e:
         logger.error(f"处理视频失败: {str(e)}", exc_info=True)
     finally:
-        # 清理原始文件
-        if file_path and default_storage.exists(file_path):
+        # 清理临时文件
+        if os.path.exists(temp_path):
             try:
-                await sync_to_async(default_storage.delete)(file_path)
-                logger.info(f"清理视频文件: {file_path}")
+                os.unlink(temp_path)
+                logger.info(f"清理临时视频文件: {temp_path}")
             except Exception as e:
-                logger.warning(f"清理视频文件失败: {str(e)}")
+                logger.warning(f"删除临时视频文件失败: {str(e)}")
+
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+# 进程内同时解码视频的线程数上限（解码线程只在解码时占用名额），所有会话共享
+_video_decode_slots = threading.BoundedSemaphore(getattr(settings, "INTERVIEW_VIDEO_DECODE_THREADS", 8))
 
 
-async def _analyze_video_frames(video_path):
+def open_video_stream(session_id):
+    """
+    创建会话的视频流（需在事件循环中调用）
+    视频片段在内存中增量解码，按媒体时间戳抽帧分析表情，结果写入候选人最近一次回答的分析记录
+    """
+    state = {"analysis_id": None, "results": []}
+    face_cache = find_session_cache(session_id)
+
+    async def analyze(frame):
+        analyzer = get_facial_analyzer()
+        if face_cache is None:
+            frame_result = await analyzer.aanalyze_frame(frame.image)
+        else:
+            # 画面与最近分析过的帧几乎相同时复用结果
+            image_hash = await asyncio.to_thread(dhash, frame.image)
+            frame_result = await face_cache.analyze(image_hash, lambda: analyzer.aanalyze_frame(frame.image))
+        if not frame_result.get("success") or not frame_result.get("data"):
+            return
+        logger.info(f"分析帧 {frame.index}，时间戳: {frame.timestamp:.2f}s")
+        await _save_frame_analysis(session_id, state, {
+            "frame": frame.index,
+            "timestamp": frame.timestamp,
+            "analysis": frame_result["data"]
+        })
+
+    return VideoStream(
+        analyze,
+        interval=getattr(settings, "INTERVIEW_VIDEO_SAMPLE_INTERVAL", 10),
+        name=f"video-{session_id}",
+        max_buffer=getattr(settings, "INTERVIEW_VIDEO_BUFFER_BYTES", 8 * 1024 * 1024),
+        max_frames=getattr(settings, "INTERVIEW_VIDEO_FRAME_QUEUE_SIZE", 4),
+        decode_slots=_video_decode_slots
+    )
+
+
+async def _save_frame_analysis(session_id, state, frame_data):
+    """追加一帧的分析结果；最近的回答变化时重新开始累积，只保留当前回答期间的结果"""
+    latest_analysis = await sync_to_async(
+        ResponseAnalysis.objects.filter(metadata__question__session_id=session_id)
+        .order_by('-analysis_timestamp').first
+    )()
+    if latest_analysis is None:
+        return
+
+    if latest_analysis.id != state["analysis_id"]:
+        state["analysis_id"] = latest_analysis.id
+        state["results"] = []
+    state["results"].append(frame_data)
+    latest_analysis.facial_expression = str(state["results"])
+    await sync_to_async(latest_analysis.save)(update_fields=["facial_expression"])
+
+
+async def _analyze_video_frames(video_path, session_id=None):
     """分析视频帧获取表情和肢体语言（直接使用文件路径）"""
     try:
         logger.info(f"开始分析视频帧: {video_path}")
-        # 使用OpenCV打开视频
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            # 尝试用FFmpeg后端打开
-            cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
-            if not cap.isOpened():
-                logger.error("无法打开视频文件")
-                return {"success": False, "error": "无法打开视频文件", "data": []}
-
-        fps = cap.get(cv2.CAP_PROP_FPS) or 30
-        frame_count = 0
+        # 按媒体时间戳抽帧（默认每10秒一帧，保证首尾帧），未选中的帧不做完整解码
+        sampler = FrameSampler(
+            interval=getattr(settings, "INTERVIEW_VIDEO_SAMPLE_INTERVAL", 10),
+            mode=getattr(settings, "INTERVIEW_VIDEO_SAMPLE_MODE", "auto")
+        )
+        try:
+            frames, stats = await asyncio.to_thread(sampler.sample, video_path)
+        except ValueError as e:
+            logger.error(str(e))
+            return {"success": False, "error": str(e), "data": []}
+
+        logger.info(
+            f"抽帧完成（{stats['mode']}模式）: grab {stats['grabbed']}帧，"
+            f"解码 {stats['decoded']}帧，seek {stats['seeks']}次，选中 {stats['selected']}帧"
+        )
+
+        # 多帧同时请求（有并发上限），总耗时接近一次往返；与已分析画面相同的帧复用结果
         results = []
-        facial_analyzer = FacialExpressionAnalyzer()
-        last_analysis_time = time.time()
-
-        logger.info(f"视频帧率: {fps}, 开始逐帧分析")
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            current_time = time.time()
-            if (current_time - last_analysis_time) >= 10:  # 每10秒分析一帧
-                try:
-                    frame_result = await asyncio.to_thread(
-                        facial_analyzer.analyze_frame, frame
-                    )
-                    if frame_result.get("success"):
-                        results.append({
-                            "frame": frame_count,
-                            "timestamp": frame_count / fps,
-                            "analysis": frame_result.get("data", {})
-                        })
-                        logger.info(f"分析帧 {frame_count}，时间戳: {frame_count / fps:.2f}s")
-                    last_analysis_time = current_time
-                except Exception as e:
-                    logger.error(f"分析视频帧失败: {str(e)}")
-
-            frame_count += 1
-
-        cap.release()
-        logger.info(f"视频分析完成，共处理{frame_count}帧，有效分析{len(results)}帧")
+        analyzer = get_facial_analyzer()
+        images = [frame.image for frame in frames]
+        face_cache = find_session_cache(session_id) if session_id is not None else None
+        if face_cache is None:
+            frame_results = await analyzer.analyze_frames(images)
+        else:
+            frame_results = await face_cache.analyze_frames(images, analyzer.analyze_frames)
+        for frame, frame_result in zip(frames, frame_results):
+            if frame_result.get("success"):
+                results.append({
+                    "frame": frame.index,
+                    "timestamp": frame.timestamp,
+                    "analysis": frame_result.get("data", {})
+                })
+                logger.info(f"分析帧 {frame.index}，时间戳: {frame.timestamp:.2f}s")
+            else:
+                logger.error(f"分析视频帧失败: {frame_result.get('error')}")
+
+        logger.info(f"视频分析完成，共抽取{len(frames)}帧，有效分析{len(results)}帧")
         return {"success": True, "data": results}
 
     except Exception as e:
@@ -406,25 +458,15 @@ async def process_image_data(session_id, base64_data, timestamp):
         if image_bytes is None:
             return {"success": False, "error": "Base64解码失败"}
 
-        # 保存图片到临时文件
-        temp_path = os.path.join(VIDEO_TEMP_DIR, f"image_{timestamp}_{os.urandom(8).hex()}.jpg")
-        with open(temp_path, 'wb') as f:
-            f.write(image_bytes)
-
-        # 分析图片
-        analyzer = FacialExpressionAnalyzer()
-        frame = cv2.imread(temp_path)
-        if frame is None:
-            logger.error("无法读取图片文件")
-            return {"success": False, "error": "无法读取图片文件"}
-
-        analysis_result = await asyncio.to_thread(analyzer.analyze_frame, frame)
-        print(analysis_result["data"]["face_0"]["expression"])
-        # 清理临时文件
-        try:
-            os.unlink(temp_path)
-        except Exception as e:
-            logger.warning(f"删除临时图片文件失败: {str(e)}")
+        # 直接在内存中分析：符合大小上限的JPEG原样上传，不落盘、不重新编码
+        analyzer = get_facial_analyzer()
+        face_cache = find_session_cache(session_id)
+        if face_cache is None:
+            analysis_result = await analyzer.aanalyze_image(image_bytes)
+        else:
+            # 按1/8缩小解码计算感知哈希，画面与最近分析过的图片几乎相同时复用结果
+            image_hash = await asyncio.to_thread(dhash_jpeg, image_bytes)
+            analysis_result = await face_cache.analyze(image_hash, lambda: analyzer.aanalyze_image(image_bytes))
 
         if not analysis_result.get("success"):
             return {"success": False, "error": analysis_result.get("error", "表情分析失败")}
@@ -487,39 +529,251 @@ async def process_text_answer(session_id, answer_text, timestamp):
         return {"success": False, "error": str(e)}
 
 
+async def _save_question(session, question_text, audio_keys=None):
+    """写入问题记录（题号顺延），并记为会话的当前问题；audio_keys为问题语音在语音缓存中的键"""
+    question_count = await sync_to_async(
+        InterviewQuestion.objects.filter(session=session).count
+    )()
+    question = await sync_to_async(InterviewQuestion.objects.create)(
+        session=session,
+        question_text=question_text,
+        question_number=question_count + 1
+    )
+    await set_current_question(session.id, question, audio_keys or [audio_cache_key(question_text)])
+    logger.info(f"生成问题: {question_text[:50]}...")
+    speculation.start(session.id, question_text)  # 候选人作答期间在后台预先准备下一个问题
+    return question
+
+
+async def _ask_question(session, prompt, history):
+    """
+    生成下一个问题：写入问题记录，并把文本和语音发送给客户端，返回问题文本（失败返回None）
+    文本与语音均为流式时，使用按句流水线让语音合成与文本生成重叠进行
+    """
+    if (getattr(settings, "INTERVIEW_TTS_PIPELINE", True)
+            and getattr(settings, "INTERVIEW_STREAM_QUESTION_TEXT", True)
+            and getattr(settings, "INTERVIEW_STREAM_TTS", True)):
+        async def on_text_complete(question_text, sentences):
+            await _save_question(session, question_text, [audio_cache_key(sentence) for sentence in sentences])
+            await send_audio_and_text_to_client(session.id, b"", question_text, audio_streaming=True)
+
+        return await _stream_question(session.id, prompt, history, on_text_complete)
+
+    question_text = await _generate_question_text(session.id, prompt, history)
+    if not question_text:
+        return None
+    await _save_question(session, question_text)
+    await _send_question(session.id, question_text)
+    return question_text
+
+
+class SentenceSplitter:
+    """将流式输出的文本按句切分（中文和西文标点），用于逐句提交语音合成"""
+
+    SENTENCE_ENDINGS = "。！？；!?;\n"
+    CLOSING_MARKS = "”’」』）)\"'"
+
+    def __init__(self, min_length=6):
+        self.min_length = min_length  # 过短的句子并入下一句，避免零碎的合成请求
+        self._buffer = ""
+
+    def feed(self, text):
+        """追加文本，返回已完整的句子列表"""
+        self._buffer += text
+        buffer = self._buffer
+        sentences = []
+        start = 0
+        pos = 0
+        while pos < len(buffer):
+            char = buffer[pos]
+            end = None
+            if char in self.SENTENCE_ENDINGS:
+                end = pos + 1
+            elif char == ".":
+                if pos + 1 >= len(buffer):
+                    break  # 需等待下一个字符才能区分句号与小数点
+                if buffer[pos + 1].isspace():
+                    end = pos + 1
+
+            if end is None:
+                pos += 1
+                continue
+
+            while end < len(buffer) and buffer[end] in self.CLOSING_MARKS:
+                end += 1
+            sentence = buffer[start:end].strip()
+            if len(sentence) >= self.min_length:
+                sentences.append(sentence)
+                start = end
+            pos = end
+
+        self._buffer = buffer[start:]
+        return sentences
+
+    def flush(self):
+        """返回剩余未结束的文本"""
+        rest, self._buffer = self._buffer.strip(), ""
+        return rest
+
+
+async def _stream_question(session_id, prompt, history, on_text_complete):
+    """
+    LLM → TTS 按句流水线
+    模型输出以question_delta推送的同时按句切分，每句立即并发提交语音合成，音频片段按句子顺序推送给客户端；
+    文本生成完成后调用on_text_complete(问题文本, 各句文本)（写入问题记录、发送完整问题），全部音频发送完毕后返回问题文本
+    第一个音频片段可能早于完整问题发出，因此先发送question_audio_start标记（携带已生成的文本），与_send_question一样保证客户端先收到开始消息
+    """
+    splitter = SentenceSplitter()
+    semaphore = asyncio.Semaphore(getattr(settings, "INTERVIEW_TTS_PIPELINE_CONCURRENCY", 3))
+    segments = asyncio.Queue()  # 按句子顺序排列的音频片段队列，None表示没有更多句子
+    tasks = []
+    sentences = []
+
+    async def synthesize_segment(sentence, chunks):
+        try:
+            async with semaphore:
+                async for chunk in synthesize_stream(sentence):
+                    chunks.put_nowait(chunk)
+        except Exception as e:
+            logger.error(f"句子语音合成失败: {str(e)}")
+        finally:
+            chunks.put_nowait(None)
+
+    async def emit_audio():
+        # 当前句子的音频边合成边发送，后续句子的音频在各自队列中缓存等待
+        index = 0
+        started = False
+        try:
+            while True:
+                chunks = await segments.get()
+                if chunks is None:
+                    break
+                while True:
+                    chunk = await chunks.get()
+                    if chunk is None:
+                        break
+                    if not started:
+                        started = True
+                        await send_question_audio_start_to_client(session_id, "".join(parts))
+                    await send_audio_chunk_to_client(session_id, chunk, index)
+                    index += 1
+        finally:
+            # 结束标记同样不能早于开始标记
+            if not started:
+                await send_question_audio_start_to_client(session_id, "".join(parts))
+            await send_audio_chunk_to_client(session_id, b"", index, is_last=True)
+
+    def dispatch(sentence):
+        sentences.append(sentence)
+        chunks = asyncio.Queue()
+        tasks.append(asyncio.create_task(synthesize_segment(sentence, chunks)))
+        segments.put_nowait(chunks)
+
+    emitter = asyncio.create_task(emit_audio())
+    parts = []
+    try:
+        async for delta in spark_ai_engine.astream(prompt, history):
+            await send_question_delta_to_client(session_id, delta, len(parts))
+            parts.append(delta)
+            for sentence in splitter.feed(delta):
+                dispatch(sentence)
+        rest = splitter.flush()
+        if rest:
+            dispatch(rest)
+        segments.put_nowait(None)
+
+        question_text = "".join(parts).strip()
+        if not question_text:
+            raise ValueError("模型没有返回任何内容")
+        await on_text_complete(question_text, sentences)
+        await emitter
+        return question_text
+
+    except Exception as e:
+        logger.error(f"流式生成问题失败: {str(e)}", exc_info=True)
+        for task in tasks + [emitter]:
+            task.cancel()
+        await asyncio.gather(*tasks, emitter, return_exceptions=True)
+        if parts:
+            await send_question_delta_to_client(session_id, "", len(parts), reset=True)
+        return None
+
+
+async def _generate_question_text(session_id, prompt, history):
+    """
+    生成问题文本，返回完整文本（失败返回None）
+    流式模式下模型输出的每个片段都会以question_delta推送给客户端，问题记录在生成完成后再写入数据库
+    """
+    if not getattr(settings, "INTERVIEW_STREAM_QUESTION_TEXT", True):
+        response = await spark_ai_engine.agenerate(prompt, history)
+        return response["content"] if response["success"] else None
+
+    parts = []
+    try:
+        async for delta in spark_ai_engine.astream(prompt, history):
+            await send_question_delta_to_client(session_id, delta, len(parts))
+            parts.append(delta)
+    except Exception as e:
+        logger.error(f"流式生成问题失败: {str(e)}", exc_info=True)
+        if parts:
+            await send_question_delta_to_client(session_id, "", len(parts), reset=True)
+        return None
+
+    return "".join(parts).strip() or None
+
+
+async def _send_question(session_id, question_text):
+    """
+    合成问题语音并发送给客户端
+    流式模式下先发送问题文本，再边合成边以question_audio_chunk推送音频片段，客户端收到首个片段即可开始播放
+    """
+    if not getattr(settings, "INTERVIEW_STREAM_TTS", True):
+        audio_result = await synthesize(question_text)
+        if not audio_result["success"]:
+            logger.error("音频生成失败")
+            return False
+        await send_audio_and_text_to_client(session_id, audio_result["audio_data"], question_text)
+        return True
+
+    await send_audio_and_text_to_client(session_id, b"", question_text, audio_streaming=True)
+    index = 0
+    try:
+        async for chunk in synthesize_stream(question_text):
+            await send_audio_chunk_to_client(session_id, chunk, index)
+            index += 1
+        return True
+    except Exception as e:
+        logger.error(f"音频生成失败: {str(e)}", exc_info=True)
+        return False
+    finally:
+        # 结束标记，客户端据此判断音频已完整（出错时同样发送，避免客户端一直等待）
+        await send_audio_chunk_to_client(session_id, b"", index, is_last=True)
+
+
 async def generate_initial_question(session):
-    """生成初始面试问题"""
+    """生成初始面试问题，之后在后台生成后续问题的面试规划（规划需要知道第一个问题，避免重复）"""
+    async with question_in_flight(session.id):
+        await _generate_initial_question(session)
+    ensure_plan(session.id)
+
+
+async def _generate_initial_question(session):
     try:
-        logger.info(f"为会话 {session.id} 生成初始问题")
+        # 优先使用创建会话时提前准备的首问或池中预生成的首问，文本和语音均已就绪，无需等待大模型和语音合成
+        pooled = await claim_prepared_question(session.id) or first_question_pool.take(session.scenario_id)
+        if pooled:
+            logger.info(f"会话 {session.id} 使用预生成的初始问题")
+            await _save_question(session, pooled.question_text)
+            await send_audio_and_text_to_client(session.id, pooled.audio_data, pooled.question_text)
+            return
 
-        new_question_response = spark_ai_engine.generate_response(
-            "假设你现在是一个面试官，正在对一个求职的大学生进行面试，请提出第一个面试问题。要求该问题比较简短。", []
-        )
-        if new_question_response["success"]:
-            new_question_text = new_question_response["content"]
-            await sync_to_async(InterviewQuestion.objects.create)(
-                session=session,
-                question_text=new_question_text,
-                question_number=1
-            )
+        logger.info(f"为会话 {session.id} 生成初始问题")
 
-            logger.info(f"生成问题: {new_question_text[:50]}...")
-
-            audio_result = await synthesize(new_question_text)
-            if audio_result["success"]:
-                # 确保audio_data是bytes类型
-                audio_data = audio_result["audio_data"]
-                if isinstance(audio_data, str):
-                    # 如果已经是base64字符串，解码为bytes
-                    audio_data = base64.b64decode(audio_data)
-                await send_audio_and_text_to_client(
-                    session.id,
-                    audio_data,  # 发送bytes数据
-                    new_question_text
-                )
-                logger.info("初始问题发送成功")
-            else:
-                logger.error("音频生成失败")
+        # 与首问池、提前准备的首问使用相同的场景提示词
+        technology_field = await scenario_technology_field(session.scenario_id)
+        new_question_text = await _ask_question(session, first_question_prompt(technology_field), [])
+        if new_question_text:
+            logger.info("初始问题发送成功")
         else:
             logger.error("生成初始问题失败")
     except Exception as e:
@@ -527,43 +781,162 @@ async def generate_initial_question(session):
 
 
 async def evaluate_and_generate_question(session, speech_text, analysis):
-    evaluation_response = spark_ai_engine.generate_response(
-        f"评估面试回答: {speech_text}", []
+    async with question_in_flight(session.id):
+        await _evaluate_and_generate_question(session, speech_text, analysis)
+
+
+async def _evaluate_and_generate_question(session, speech_text, analysis):
+    # 回答无需追问时直接使用面试规划中的下一个问题（语音已预合成），不在本轮调用大模型出题
+    follow_up = needs_follow_up(speech_text)
+    if not follow_up:
+        planned_question = await take_planned_question(session.id)
+        if planned_question:
+            speculation.discard(session.id)
+            await _prepared_turn(session, planned_question, speech_text, analysis)
+            return
+
+    # 候选人作答期间推测生成的问题与回答需要的类型一致时直接使用
+    speculated_question = await speculation.claim(
+        session.id, speculation.KIND_FOLLOW_UP if follow_up else speculation.KIND_NEXT
     )
-    if evaluation_response["success"]:
-        evaluation_text = evaluation_response["content"]
+    if speculated_question:
+        await _prepared_turn(session, speculated_question, speech_text, analysis)
+        return
+
+    if getattr(settings, "INTERVIEW_COMBINED_TURN", True):
+        if await _combined_turn(session, speech_text, analysis):
+            return
+        logger.warning("合并调用的回复无法解析，回退到分别评估和出题")
+
+    if getattr(settings, "INTERVIEW_DEFERRED_EVALUATION", True):
+        # 评估放到后台执行，先生成并发送下一个问题
         current_question = await sync_to_async(
             InterviewQuestion.objects.filter(session=session).latest
         )('asked_at')
-        await sync_to_async(AnswerEvaluation.objects.create)(
-            question=current_question,
-            analysis=analysis,
-            evaluation_text=evaluation_text,
-            score=0
-        )
+        evaluation_scheduler.submit(session.id, current_question, analysis, speech_text)
+        new_question_text = await _ask_question(session, "生成下一个面试问题", await ConversationContext(session.id).history())
+        if not new_question_text:
+            logger.error("生成新问题失败")
+        return
 
-        # 生成新问题
-        new_question_response = spark_ai_engine.generate_response(
-            "生成下一个面试问题", []
-        )
-        if new_question_response["success"]:
-            new_question_text = new_question_response["content"]
-
-            question_count = await sync_to_async(
-                InterviewQuestion.objects.filter(session=session).count
-            )()
-            await sync_to_async(InterviewQuestion.objects.create)(
-                session=session,
-                question_text=new_question_text,
-                question_number=question_count + 1
-            )
+    evaluation = await evaluate_answer(speech_text)
+    if evaluation:
+        current_question = await sync_to_async(
+            InterviewQuestion.objects.filter(session=session).latest
+        )('asked_at')
+        await save_evaluation(session.id, current_question, analysis, *evaluation)
 
-            # 生成语音（音频数据仅用于传输，不存入数据库）
-            audio_result = await synthesize(new_question_text)
-            if audio_result["success"]:
-                await send_audio_and_text_to_client(session.id, audio_result["audio_data"],
-                                                    new_question_text)  # 修改调用的函数名
-        else:
+        # 生成新问题（音频数据仅用于传输，不存入数据库）
+        new_question_text = await _ask_question(session, "生成下一个面试问题", await ConversationContext(session.id).history())
+        if not new_question_text:
             logger.error("生成新问题失败")
     else:
-        logger.error("评估回答失败")
\ No newline at end of file
+        logger.error("评估回答失败")
+
+
+async def resume_session(session):
+    """
+    WebSocket重连时恢复会话，不重新生成问题
+    返回None表示会话还没有问题（需要生成初始问题）；
+    问题正在生成时返回{"pending": True}，生成完成后会推送给会话组内的新连接；
+    否则返回当前问题及其语音（优先从语音缓存读取，未命中时重新合成）
+    """
+    if await is_question_in_flight(session.id):
+        state = await get_turn_state(session.id) or {}
+        return {"pending": True, "last_seq": state.get("last_seq")}
+
+    state = await get_turn_state(session.id)
+    if state is None:
+        return None
+
+    audio_data = await get_cached_audio(state["audio_keys"])
+    if audio_data is None:
+        audio_result = await synthesize(state["question_text"])
+        audio_data = audio_result["audio_data"] if audio_result["success"] else b""
+    logger.info(f"会话 {session.id} 重连，回放第 {state['question_number']} 个问题")
+    return dict(state, pending=False, audio_data=audio_data)
+
+
+async def _combined_turn(session, speech_text, analysis):
+    """
+    一次大模型调用同时完成回答评估和下一个问题生成（结构化JSON回复）
+    流式接收时下一个问题一完整就写入记录并开始合成语音，评估部分在此期间继续生成；
+    返回False表示没能解析出下一个问题，由调用方回退到两次调用；问题已发出但评估无法解析时单独补做评估（可延后时交给后台任务）
+    """
+    current_question = await sync_to_async(
+        InterviewQuestion.objects.filter(session=session).order_by('-asked_at').first
+    )()
+    prompt = build_turn_prompt(current_question.question_text if current_question else "", speech_text)
+    stream_text = getattr(settings, "INTERVIEW_STREAM_QUESTION_TEXT", True)
+    history = await ConversationContext(session.id).history(exclude_latest=True)  # 当前问题和回答已包含在提示词中
+
+    parser = TurnReplyParser()
+    delivery = None
+    sent_length = 0
+    delta_index = 0
+    try:
+        async for delta in spark_ai_engine.astream(prompt, history):
+            parser.feed(delta)
+            if delivery is not None:
+                continue
+
+            question_text, complete = parser.partial_string("next_question")
+            if stream_text and len(question_text) > sent_length:
+                await send_question_delta_to_client(session.id, question_text[sent_length:], delta_index)
+                delta_index += 1
+                sent_length = len(question_text)
+            if complete and question_text.strip():
+                delivery = asyncio.create_task(_deliver_question(session, question_text.strip()))
+    except Exception as e:
+        logger.error(f"合并调用失败: {str(e)}", exc_info=True)
+
+    if delivery is None:
+        if delta_index:
+            await send_question_delta_to_client(session.id, "", delta_index, reset=True)
+        return False
+
+    try:
+        reply = parser.result()
+        if current_question is None:
+            logger.warning("会话没有当前问题，跳过回答评估")
+        elif reply["evaluation"]:
+            await save_evaluation(session.id, current_question, analysis, reply["evaluation"], reply["score"])
+        elif getattr(settings, "INTERVIEW_DEFERRED_EVALUATION", True):
+            logger.warning("合并调用的评估部分无法解析，转为后台评估")
+            evaluation_scheduler.submit(session.id, current_question, analysis, speech_text)
+        else:
+            logger.warning("合并调用的评估部分无法解析，单独评估回答")
+            evaluation = await evaluate_answer(speech_text)
+            if evaluation:
+                await save_evaluation(session.id, current_question, analysis, *evaluation)
+            else:
+                logger.error("评估回答失败")
+    finally:
+        await delivery
+    return True
+
+
+async def _prepared_turn(session, question_text, speech_text, analysis):
+    """使用已准备好的问题（规划或推测）完成本轮：评估回答（可延后时交给后台任务）并发送问题"""
+    logger.info(f"会话 {session.id} 使用已准备好的问题")
+    current_question = await sync_to_async(
+        InterviewQuestion.objects.filter(session=session).latest
+    )('asked_at')
+    if getattr(settings, "INTERVIEW_DEFERRED_EVALUATION", True):
+        evaluation_scheduler.submit(session.id, current_question, analysis, speech_text)
+    else:
+        evaluation = await evaluate_answer(speech_text)
+        if evaluation:
+            await save_evaluation(session.id, current_question, analysis, *evaluation)
+        else:
+            logger.error("评估回答失败")
+    await _deliver_question(session, question_text)
+
+
+async def _deliver_question(session, question_text):
+    """写入已生成的问题并发送文本和语音"""
+    try:
+        await _save_question(session, question_text)
+        await _send_question(session.id, question_text)
+    except Exception as e:
+        logger.error(f"发送问题失败: {str(e)}", exc_info=True)
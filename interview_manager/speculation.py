@@ -0,0 +1,154 @@
+# interview_manager/speculation.py
+"""
+候选人作答期间的推测性出题
+
+问题发出后到收到回答之间，后台预先生成一个候选问题并合成语音（写入语音缓存）：
+- 面试规划中还有问题时，推测的是针对当前问题的通用追问（回答需要追问时使用）；
+- 没有规划可用时，推测的是下一个问题（回答无需追问时使用）。
+收到回答后根据回答决定直接使用还是丢弃。推测会额外消耗大模型和语音合成调用，
+因此限制每个会话的推测次数和全进程同时进行的推测数，并统计命中率和节省的等待时间以便调整。
+"""
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from evaluation_system.audio_generate_engine import synthesize
+from evaluation_system.evaluate_engine import spark_ai_engine
+from .context import ConversationContext
+from .planner import has_planned_questions
+
+logger = logging.getLogger(__name__)
+
+KIND_FOLLOW_UP = "follow_up"
+KIND_NEXT = "next"
+
+FOLLOW_UP_PROMPT = (
+    "面试官刚刚提出的问题是：“{question}”。如果候选人的回答不够充分或表示不了解，"
+    "请提出一个简短的追问或引导性问题。只输出问题本身。"
+)
+NEXT_PROMPT = "面试官刚刚提出的问题是：“{question}”。请换一个考察方向，提出下一个面试问题，要求比较简短。只输出问题本身。"
+
+# 会话当前的推测：session_id -> {"task", "kind", "started"}
+_speculations = {}
+# 正在启动推测（检查成本上限、选择推测类型）的会话：session_id -> asyncio.Task
+_starting = {}
+_counters = {"started": 0, "hits": 0, "misses": 0, "failed": 0, "capped": 0, "saved_seconds": 0.0}
+
+
+def _count_key(session_id):
+    return f"interview_speculation_count_{session_id}"
+
+
+def start(session_id, question_text):
+    """在后台为刚发出的问题启动推测，不占用问题下发的时间（需在事件循环中调用）"""
+    if not getattr(settings, "INTERVIEW_SPECULATION_ENABLED", False):
+        return None
+    discard(session_id)
+    task = asyncio.get_running_loop().create_task(speculate(session_id, question_text))
+    _starting[session_id] = task
+    task.add_done_callback(lambda done: _starting.pop(session_id) if _starting.get(session_id) is done else None)
+    return task
+
+
+async def speculate(session_id, question_text):
+    """为刚发出的问题启动推测（替换该会话之前的推测），超出成本上限时跳过"""
+    if not getattr(settings, "INTERVIEW_SPECULATION_ENABLED", False):
+        return None
+    _drop(session_id)
+
+    in_flight = sum(1 for item in _speculations.values() if not item["task"].done())
+    count = await cache.aget(_count_key(session_id), 0)
+    if (count >= getattr(settings, "INTERVIEW_SPECULATION_MAX_PER_SESSION", 5)
+            or in_flight >= getattr(settings, "INTERVIEW_SPECULATION_MAX_IN_FLIGHT", 4)):
+        _counters["capped"] += 1
+        return None
+    await cache.aset(_count_key(session_id), count + 1, getattr(settings, "INTERVIEW_TURN_STATE_TTL", 6 * 3600))
+
+    if await has_planned_questions(session_id):
+        kind, history = KIND_FOLLOW_UP, []
+    else:
+        kind, history = KIND_NEXT, await ConversationContext(session_id).history()
+    prompt = (FOLLOW_UP_PROMPT if kind == KIND_FOLLOW_UP else NEXT_PROMPT).format(question=question_text)
+    task = asyncio.get_running_loop().create_task(_generate(prompt, history))
+    _speculations[session_id] = {"task": task, "kind": kind, "started": time.monotonic()}
+    _counters["started"] += 1
+    return task
+
+
+async def _generate(prompt, history):
+    """生成候选问题并预合成语音，返回 (问题文本, 耗时)，失败返回None"""
+    started = time.monotonic()
+    try:
+        response = await spark_ai_engine.agenerate(prompt, history)
+        if not response["success"]:
+            return None
+        question_text = response["content"].strip()
+        if not question_text:
+            return None
+        audio_result = await synthesize(question_text)
+        if not audio_result["success"]:
+            return None
+        return question_text, time.monotonic() - started
+    except Exception as e:
+        logger.error(f"推测出题失败: {str(e)}", exc_info=True)
+        return None
+
+
+def discard(session_id):
+    """丢弃会话当前的推测（未使用即计为未命中），会话结束或连接断开时同样调用"""
+    _cancel_start(session_id)
+    _drop(session_id)
+
+
+def _cancel_start(session_id):
+    """取消尚未完成启动的推测，避免它在会话进入下一轮后才登记"""
+    task = _starting.pop(session_id, None)
+    if task is not None:
+        task.cancel()
+
+
+def _drop(session_id):
+    item = _speculations.pop(session_id, None)
+    if item is None:
+        return
+    item["task"].cancel()
+    _counters["misses"] += 1
+
+
+async def claim(session_id, kind):
+    """
+    按回答需要的问题类型取用推测结果，类型不符时丢弃
+    推测仍在进行时等待其完成（已经过的时间同样节省了）；还没启动完成的推测直接取消
+    """
+    _cancel_start(session_id)
+    item = _speculations.get(session_id)
+    if item is None:
+        return None
+    if item["kind"] != kind:
+        _drop(session_id)
+        return None
+
+    _speculations.pop(session_id)
+    elapsed = time.monotonic() - item["started"]
+    result = await item["task"]
+    if result is None:
+        _counters["failed"] += 1
+        return None
+
+    question_text, duration = result
+    saved = min(duration, elapsed)
+    _counters["hits"] += 1
+    _counters["saved_seconds"] += saved
+    logger.info(f"会话 {session_id} 命中推测问题，节省约 {saved:.2f} 秒")
+    return question_text
+
+
+def stats():
+    """返回推测统计：启动、命中、未命中、失败、因成本上限跳过的次数，命中率和累计节省时间"""
+    stats = dict(_counters, in_flight=sum(1 for item in _speculations.values() if not item["task"].done()))
+    resolved = stats["hits"] + stats["misses"] + stats["failed"]
+    stats["hit_ratio"] = stats["hits"] / resolved if resolved else 0.0
+    return stats
@@ -0,0 +1,125 @@
+# interview_manager/structured_reply.py
+"""
+「评估回答 + 生成下一个问题」合并调用的提示词与结构化回复解析
+
+要求模型按 next_question、score、evaluation 的顺序输出JSON，下一个问题最先生成，
+流式接收时问题文本一完整即可开始合成语音，评估部分在此期间继续生成。
+解析器对常见的格式偏差保持容错：代码块包裹、前后多余文字、尾随逗号、分数写成字符串或带“分”等。
+"""
+import json
+import re
+
+TURN_PROMPT = (
+    "你是一名面试官。候选人对问题“{question}”的回答如下：\n{answer}\n\n"
+    "请评估该回答，并提出下一个面试问题（要求比较简短）。"
+    "只输出一个JSON对象，不要输出其他内容，字段顺序必须为：\n"
+    '{{"next_question": "下一个面试问题", "score": 0到100的整数评分, "evaluation": "对回答的评估"}}'
+)
+
+_SCORE_PATTERN = re.compile(r'"score"\s*[:：]\s*"?\s*(\d+(?:\.\d+)?)')
+_NUMBER_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*分")
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def build_turn_prompt(question_text, answer_text):
+    """生成合并调用的提示词"""
+    return TURN_PROMPT.format(question=question_text or "", answer=answer_text)
+
+
+def normalize_score(value):
+    """将评分转换为0~100之间的数值，无法识别返回None"""
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, min(100.0, score))
+
+
+def extract_score(text):
+    """从评估文本中提取“xx分”形式的评分（两次调用路径使用），没有返回None"""
+    match = _NUMBER_PATTERN.search(text or "")
+    return normalize_score(match.group(1)) if match else None
+
+
+class TurnReplyParser:
+    """合并调用回复的增量解析器"""
+
+    def __init__(self):
+        self._text = ""
+
+    def feed(self, delta):
+        self._text += delta
+
+    @property
+    def text(self):
+        return self._text
+
+    def partial_string(self, key):
+        """
+        读取字符串字段当前已生成的内容
+        返回 (内容, 是否完整)；字段尚未出现时返回 ("", False)
+        """
+        match = re.search(rf'"{key}"\s*[:：]\s*"', self._text)
+        if not match:
+            return "", False
+
+        chars = []
+        pos = match.end()
+        text = self._text
+        while pos < len(text):
+            char = text[pos]
+            if char == '"':
+                return "".join(chars), True
+            if char == "\\":
+                if pos + 1 >= len(text):
+                    break  # 转义序列尚未接收完整
+                escape = text[pos + 1]
+                if escape == "u":
+                    if pos + 6 > len(text):
+                        break
+                    try:
+                        chars.append(chr(int(text[pos + 2:pos + 6], 16)))
+                    except ValueError:
+                        chars.append(text[pos:pos + 6])
+                    pos += 6
+                    continue
+                chars.append(_ESCAPES.get(escape, escape))
+                pos += 2
+                continue
+            chars.append(char)
+            pos += 1
+        return "".join(chars), False
+
+    def result(self):
+        """
+        解析完整回复，返回 {"next_question", "score", "evaluation"}，无法识别的字段为None
+        先按JSON整体解析，失败时逐个字段提取
+        """
+        data = self._load_json()
+        if data is not None:
+            question = data.get("next_question")
+            evaluation = data.get("evaluation")
+            return {
+                "next_question": question.strip() or None if isinstance(question, str) else None,
+                "score": normalize_score(data.get("score")),
+                "evaluation": evaluation.strip() or None if isinstance(evaluation, str) else None
+            }
+
+        fields = {}
+        for key in ("next_question", "evaluation"):
+            value, complete = self.partial_string(key)
+            fields[key] = value.strip() or None if complete else None
+        match = _SCORE_PATTERN.search(self._text)
+        fields["score"] = normalize_score(match.group(1)) if match else None
+        return fields
+
+    def _load_json(self):
+        start = self._text.find("{")
+        end = self._text.rfind("}")
+        if start < 0 or end <= start:
+            return None
+        try:
+            data = json.loads(self._text[start:end + 1])
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
@@ -1,3 +1,784 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .protocol import (
+    decode_frame, encode_frame, FrameError, FRAME_HEADER, FRAME_TYPE_AUDIO, FRAME_TYPE_IMAGE
+)
+
+
+class FrameProtocolTests(SimpleTestCase):
+    """二进制帧协议测试"""
+
+    def test_round_trip(self):
+        payload = b"\x00\x01" * 4000
+        data = encode_frame(FRAME_TYPE_AUDIO, payload, seq=7, timestamp=1700000000123)
+        frame = decode_frame(data)
+
+        self.assertEqual(len(data), FRAME_HEADER.size + len(payload))
+        self.assertEqual(frame.type, FRAME_TYPE_AUDIO)
+        self.assertEqual(frame.seq, 7)
+        self.assertEqual(frame.timestamp, 1700000000123)
+        self.assertEqual(frame.payload, payload)
+
+    def test_rejects_bad_frames(self):
+        with self.assertRaises(FrameError):
+            decode_frame(b"\xa1\x01")
+        with self.assertRaises(FrameError):
+            decode_frame(b"\x00" + encode_frame(FRAME_TYPE_IMAGE, b"jpeg")[1:])
+        with self.assertRaises(FrameError):
+            encode_frame(99, b"")
+
+    def test_consumer_rejects_server_only_frames(self):
+        import asyncio
+        import json
+        from unittest.mock import AsyncMock
+        from .consumers import LiveStreamConsumer
+        from .protocol import FRAME_TYPE_QUESTION_AUDIO
+
+        consumer = LiveStreamConsumer()
+        consumer.send = AsyncMock()
+        consumer._enqueue = AsyncMock()
+        consumer.binary_frames = True
+        asyncio.run(consumer.receive(bytes_data=encode_frame(FRAME_TYPE_QUESTION_AUDIO, b"mp3", seq=3)))
+
+        consumer._enqueue.assert_not_awaited()
+        reply = json.loads(consumer.send.await_args.kwargs["text_data"])
+        self.assertEqual((reply["type"], reply["seq"]), ("parse_error", 3))
+
+
+class SessionIngestQueueTests(SimpleTestCase):
+    """会话接收队列测试"""
+
+    def test_runs_jobs_in_order_and_refuses_when_full(self):
+        import asyncio
+        from .ingest import SessionIngestQueue
+
+        async def run():
+            done = []
+            release = asyncio.Event()
+
+            async def job(name):
+                if name == "first":
+                    await release.wait()
+                done.append(name)
+
+            queue = SessionIngestQueue("test", maxsize=2)
+            queue.start()
+            self.assertTrue(queue.submit(lambda: job("first")))
+            await asyncio.sleep(0)  # 第一个任务已被工作协程取走
+            self.assertTrue(queue.submit(lambda: job("second")))
+            self.assertTrue(queue.submit(lambda: job("third")))
+            self.assertFalse(queue.submit(lambda: job("fourth")))  # 队列已满
+            self.assertEqual(queue.depth, 2)
+
+            release.set()
+            await queue._queue.join()
+            queue.close()
+            await asyncio.gather(*queue._tasks)
+            return done
+
+        self.assertEqual(asyncio.run(run()), ["first", "second", "third"])
+
+    def test_close_drops_pending_jobs_and_lets_running_job_finish(self):
+        import asyncio
+        from .ingest import SessionIngestQueue
+
+        async def run():
+            done = []
+            release = asyncio.Event()
+
+            async def running():
+                await release.wait()
+                done.append("running")
+
+            async def pending():
+                done.append("pending")
+
+            queue = SessionIngestQueue("test", maxsize=4)
+            queue.start()
+            queue.submit(running)
+            await asyncio.sleep(0)
+            queue.submit(pending)
+            self.assertEqual(queue.close(), [pending])  # 返回被丢弃的任务，供调用方清理
+            self.assertEqual(queue.close(), [])
+            self.assertFalse(queue.submit(pending))  # 关闭后不再接收
+
+            release.set()
+            await asyncio.wait_for(asyncio.gather(*queue._tasks), 1)
+            return done, queue.depth
+
+        self.assertEqual(asyncio.run(run()), (["running"], 0))
+
+    def test_disconnect_aborts_queued_recognition(self):
+        import asyncio
+        from unittest.mock import AsyncMock, MagicMock, patch
+        from .consumers import LiveStreamConsumer
+        from .ingest import SessionIngestQueue
+
+        async def run():
+            consumer = LiveStreamConsumer()
+            consumer.session_id = 1
+            consumer.send = AsyncMock()
+            consumer.turn_queue = SessionIngestQueue("turn-test", maxsize=2)  # 未启动工作协程，任务停留在队列中
+            consumer.media_queue = consumer.recognition = consumer.video_stream = None
+            recognition = MagicMock(abort=AsyncMock())
+            await consumer._enqueue("audio_end", recognition, 1, seq=2)
+            with patch("interview_manager.consumers.release_session_cache"):
+                await consumer.disconnect(1000)
+            return recognition.abort
+
+        asyncio.run(run()).assert_awaited_once()
+
+    def test_consumer_replies_busy_when_queue_is_full(self):
+        import asyncio
+        import json
+        from unittest.mock import AsyncMock
+        from .consumers import LiveStreamConsumer
+        from .ingest import SessionIngestQueue
+
+        async def run():
+            consumer = LiveStreamConsumer()
+            consumer.send = AsyncMock()
+            consumer.media_queue = SessionIngestQueue("media-test", maxsize=1)  # 未启动工作协程，任务停留在队列中
+            await consumer._enqueue("image", b"jpeg", 1, seq=5)
+            await consumer._enqueue("image", b"jpeg", 2, seq=6)
+            return [json.loads(call.kwargs["text_data"]) for call in consumer.send.await_args_list]
+
+        ack, busy = asyncio.run(run())
+        self.assertEqual((ack["type"], ack["seq"], ack["queue_depth"]), ("image_ack", 5, 1))
+        self.assertEqual((busy["type"], busy["seq"], busy["media_type"], busy["max_depth"]), ("busy", 6, "image", 1))
+
+
+class SentenceSplitterTests(SimpleTestCase):
+    """流式文本按句切分测试"""
+
+    def test_splits_streamed_text(self):
+        from .services import SentenceSplitter
+
+        splitter = SentenceSplitter()
+        sentences = []
+        for delta in ["请介绍一下", "你自己。然后谈谈", "Python 3.11 的新特性? And", " your projects. 最后"]:
+            sentences += splitter.feed(delta)
+
+        self.assertEqual(sentences, ["请介绍一下你自己。", "然后谈谈Python 3.11 的新特性?", "And your projects."])
+        self.assertEqual(splitter.flush(), "最后")
+
+    def test_merges_short_fragments(self):
+        from .services import SentenceSplitter
+
+        splitter = SentenceSplitter(min_length=6)
+        self.assertEqual(splitter.feed("好的。那么请说说你的项目。"), ["好的。那么请说说你的项目。"])
+
+
+class QuestionPipelineTests(SimpleTestCase):
+    """LLM → TTS 按句流水线测试"""
+
+    def test_audio_start_marker_precedes_audio_chunks(self):
+        import asyncio
+        from unittest.mock import patch
+        from . import services
+
+        messages = []
+
+        async def astream(prompt, history):
+            yield "请介绍一下你自己。"
+            await asyncio.sleep(0.05)  # 第一句的语音先于完整文本合成完毕
+            yield "然后谈谈你的项目。"
+
+        async def synthesize_stream(sentence):
+            yield sentence.encode()
+
+        async def send_start(session_id, question_text):
+            messages.append(("start", question_text))
+
+        async def send_chunk(session_id, chunk, index, is_last=False):
+            messages.append(("last" if is_last else "chunk", index))
+
+        async def send_delta(session_id, delta, index, reset=False):
+            pass
+
+        async def on_text_complete(question_text, sentences):
+            messages.append(("question", question_text))
+
+        with patch.object(services.spark_ai_engine, "astream", astream), \
+                patch.object(services, "synthesize_stream", synthesize_stream), \
+                patch.object(services, "send_question_audio_start_to_client", send_start), \
+                patch.object(services, "send_audio_chunk_to_client", send_chunk), \
+                patch.object(services, "send_question_delta_to_client", send_delta):
+            question_text = asyncio.run(services._stream_question(1, "prompt", [], on_text_complete))
+
+        self.assertEqual(question_text, "请介绍一下你自己。然后谈谈你的项目。")
+        self.assertEqual(messages[0], ("start", "请介绍一下你自己。"))
+        self.assertEqual(messages[1], ("chunk", 0))
+        self.assertEqual(messages[-1], ("last", 2))
+        self.assertIn(("question", question_text), messages)
+
+
+class FirstQuestionPoolTests(SimpleTestCase):
+    """首问预生成池测试"""
+
+    def test_take_serves_pooled_question_and_refills(self):
+        import asyncio
+        from .question_pool import FirstQuestionPool, PooledQuestion
+
+        class FakePool(FirstQuestionPool):
+            produced = 0
+
+            async def _technology_field(self, scenario_id):
+                return "Python"
+
+            async def _produce(self, technology_field):
+                FakePool.produced += 1
+                return PooledQuestion(f"{technology_field}问题{FakePool.produced}", b"mp3")
+
+        async def run():
+            pool = FakePool(target_size=2)
+            self.assertIsNone(pool.take(1))  # 冷启动未命中，触发补充
+            await pool._refills[1]
+            self.assertEqual(pool.size(1), 2)
+
+            question = pool.take(1)
+            self.assertEqual(question.question_text, "Python问题1")
+            await pool._refills[1]
+            self.assertEqual(pool.size(1), 2)
+            self.assertEqual(pool.stats()["hits"], 1)
+            self.assertEqual(pool.stats()["misses"], 1)
+
+        asyncio.run(run())
+
+    def test_claim_awaits_question_prepared_at_session_creation(self):
+        import asyncio
+        from unittest.mock import patch
+        from . import question_pool
+        from .question_pool import PooledQuestion, claim_prepared_question
+
+        async def produce(technology_field=None):
+            await asyncio.sleep(0.01)
+            return PooledQuestion("请介绍一下你自己。", b"mp3")
+
+        async def run():
+            with patch.object(question_pool.first_question_pool, "target_size", 0), \
+                    patch.object(question_pool, "scenario_technology_field", return_value=None), \
+                    patch.object(question_pool, "produce_first_question", produce), \
+                    patch.object(question_pool, "ensure_plan"):
+                await question_pool._start_preparation(42, 1)
+                question = await claim_prepared_question(42)  # 仍在生成，等待完成
+            self.assertEqual(question.question_text, "请介绍一下你自己。")
+            self.assertIsNone(await claim_prepared_question(42))
+
+        asyncio.run(run())
+
+    def test_live_fallback_uses_scenario_prompt(self):
+        import asyncio
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock, patch
+        from . import services
+        from .question_pool import first_question_prompt
+
+        ask = AsyncMock(return_value="请介绍一下你做过的Python项目。")
+        session = SimpleNamespace(id=42, scenario_id=1)
+        with patch.object(services, "claim_prepared_question", AsyncMock(return_value=None)), \
+                patch.object(services.first_question_pool, "take", return_value=None), \
+                patch.object(services, "scenario_technology_field", AsyncMock(return_value="Python")), \
+                patch.object(services, "_ask_question", ask):
+            asyncio.run(services._generate_initial_question(session))
+
+        self.assertEqual(ask.await_args.args[1], first_question_prompt("Python"))
+
+
+class TurnStateTests(SimpleTestCase):
+    """会话轮次状态测试"""
+
+    def test_reconnect_replays_current_question_from_cache(self):
+        import asyncio
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from evaluation_system.audio_generate_engine import audio_cache_key
+        from . import services
+        from .turn_state import acknowledge_sequence, is_question_in_flight, question_in_flight, set_current_question
+
+        question = SimpleNamespace(id=11, question_number=2, question_text="谈谈你的项目。")
+        session = SimpleNamespace(id=901, scenario_id=1)
+
+        async def cached_audio(cache_keys):
+            self.assertEqual(cache_keys, [audio_cache_key("谈谈你的项目。")])
+            return b"mp3"
+
+        async def run():
+            await set_current_question(session.id, question, [audio_cache_key(question.question_text)])
+            await acknowledge_sequence(session.id, 5)
+            await acknowledge_sequence(session.id, 3)
+
+            async with question_in_flight(session.id):
+                self.assertEqual(await services.resume_session(session), {"pending": True, "last_seq": 5})
+            self.assertFalse(await is_question_in_flight(session.id))
+
+            with patch.object(services, "get_cached_audio", cached_audio), \
+                    patch.object(services, "synthesize") as synthesize:
+                resumed = await services.resume_session(session)
+            synthesize.assert_not_called()
+            self.assertEqual(resumed["question_id"], 11)
+            self.assertEqual(resumed["last_seq"], 5)
+            self.assertEqual(resumed["audio_data"], b"mp3")
+
+        try:
+            asyncio.run(run())
+        finally:
+            cache.delete_many(["interview_turn_state_901", "interview_question_in_flight_901"])
+
+    def test_json_answer_acknowledges_client_sequence(self):
+        import asyncio
+        import json
+        from unittest.mock import AsyncMock, patch
+        from django.core.cache import cache
+        from .consumers import LiveStreamConsumer
+        from .ingest import SessionIngestQueue
+        from types import SimpleNamespace
+        from .turn_state import get_turn_state, set_current_question
+
+        async def run():
+            await set_current_question(902, SimpleNamespace(id=12, question_number=1, question_text="自我介绍。"), [])
+            consumer = LiveStreamConsumer()
+            consumer.session_id = 902
+            consumer.send = AsyncMock()
+            consumer.turn_queue = SessionIngestQueue("turn-test", maxsize=2)
+            consumer.turn_queue.start()
+            answer = AsyncMock(return_value={"success": True, "message": "ok"})
+            with patch("interview_manager.consumers.process_text_answer", answer):
+                await consumer.receive(text_data=json.dumps({"type": "text", "data": "我的回答", "seq": 7}))
+                await asyncio.wait_for(consumer.turn_queue._queue.join(), 1)
+            consumer.turn_queue.close()
+            return await get_turn_state(902)
+
+        try:
+            self.assertEqual(asyncio.run(run())["last_seq"], 7)
+        finally:
+            cache.delete("interview_turn_state_902")
+
+
+class TurnReplyParserTests(SimpleTestCase):
+    """合并调用结构化回复解析测试"""
+
+    def test_reads_next_question_incrementally(self):
+        from .structured_reply import TurnReplyParser
+
+        parser = TurnReplyParser()
+        parser.feed('{"next_question": "请说说\\')
+        self.assertEqual(parser.partial_string("next_question"), ("请说说", False))
+        parser.feed('"GIL\\"的作用。", "sco')
+        self.assertEqual(parser.partial_string("next_question"), ('请说说"GIL"的作用。', True))
+        self.assertEqual(parser.partial_string("evaluation"), ("", False))
+
+        parser.feed('re": 85, "evaluation": "回答清晰。"}')
+        self.assertEqual(parser.result(), {
+            "next_question": '请说说"GIL"的作用。', "score": 85.0, "evaluation": "回答清晰。"
+        })
+
+    def test_tolerates_malformed_reply(self):
+        from .structured_reply import TurnReplyParser, extract_score
+
+        parser = TurnReplyParser()
+        parser.feed('```json\n{"next_question": "介绍一下你的项目。", "score": "120分", "evaluation": "不错",}\n```')
+        self.assertEqual(parser.result(), {"next_question": "介绍一下你的项目。", "score": 100.0, "evaluation": "不错"})
+
+        parser = TurnReplyParser()
+        parser.feed("抱歉，我无法评估。")
+        self.assertEqual(parser.result(), {"next_question": None, "evaluation": None, "score": None})
+        self.assertEqual(extract_score("综合评分：78分。"), 78.0)
+
+
+class EvaluationSchedulerTests(SimpleTestCase):
+    """后台回答评估测试"""
+
+    def test_retries_failed_evaluation_in_background(self):
+        import asyncio
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock, patch
+        from . import evaluation_jobs
+        from .evaluation_jobs import EvaluationScheduler
+
+        question = SimpleNamespace(id=3)
+        evaluate = AsyncMock(side_effect=[None, RuntimeError("断开"), ("回答完整，85分", 85.0)])
+        save = AsyncMock()
+
+        async def run():
+            scheduler = EvaluationScheduler(concurrency=1, retries=2, retry_delay=0)
+            with patch.object(evaluation_jobs, "evaluate_answer", evaluate), \
+                    patch.object(evaluation_jobs, "save_evaluation", save):
+                scheduler.submit(7, question, "analysis", "我的回答")
+                self.assertEqual(scheduler.pending, 1)
+                await scheduler.drain()
+            return scheduler.stats()
+
+        stats = asyncio.run(run())
+        save.assert_awaited_once_with(7, question, "analysis", "回答完整，85分", 85.0)
+        self.assertEqual(stats, {"submitted": 1, "succeeded": 1, "failed": 0, "retries": 2, "pending": 0})
+
+
+class ConversationContextTests(SimpleTestCase):
+    """对话上下文token预算测试"""
+
+    def test_estimates_tokens_for_mixed_text(self):
+        from .context import estimate_tokens
+
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("你好"), 2)
+        self.assertEqual(estimate_tokens("Django中间件"), 5)  # 3个汉字 + 6个字符约2个token
+
+    def test_keeps_most_recent_turns_within_budget(self):
+        from .context import select_turns, turn_tokens
+
+        turns = [{"number": n, "question": f"第{n}个问题是什么？", "answer": "这是我的回答。" * n} for n in range(1, 5)]
+        budget = turn_tokens(turns[3]) + turn_tokens(turns[2])
+
+        kept, overflow = select_turns(turns, budget)
+        self.assertEqual([turn["number"] for turn in kept], [3, 4])
+        self.assertEqual([turn["number"] for turn in overflow], [1, 2])
+        self.assertEqual(select_turns(turns, 0), ([], turns))
+
+    def test_history_alternates_roles_with_next_question_request(self):
+        import asyncio
+        from unittest.mock import AsyncMock, patch
+        from evaluation_system.evaluate_engine import SparkAIEngine
+        from .context import ConversationContext, OPENING_MESSAGE
+
+        turns = [
+            {"number": 1, "question": "请介绍一下你自己。", "answer": "我是计算机专业的学生。"},
+            {"number": 2, "question": "谈谈你的项目。", "answer": "我做过一个面试系统。"}
+        ]
+        context = ConversationContext(1, budget=1000)
+        with patch.object(context, "_load_summary", AsyncMock(return_value={"text": "", "upto": 0})), \
+                patch.object(context, "_load_turns", AsyncMock(return_value=turns)):
+            history = asyncio.run(context.history())
+        messages = SparkAIEngine._build_messages("生成下一个面试问题", history)
+
+        self.assertEqual(messages[0], {"role": "user", "content": OPENING_MESSAGE})
+        self.assertEqual([message["role"] for message in messages], ["user", "assistant"] * 2 + ["user"])
+        self.assertEqual(messages[-1]["content"], "我做过一个面试系统。\n\n生成下一个面试问题")
+        self.assertEqual(history[-1]["content"], "我做过一个面试系统。")  # 不修改传入的历史
+
+
+class InterviewPlannerTests(SimpleTestCase):
+    """面试规划测试"""
+
+    def test_parses_numbered_outline(self):
+        from .planner import parse_plan
+
+        text = "好的，以下是问题：\n1. 请介绍一下Python的GIL。\n2、什么是装饰器？\n\n- 说说你做过的项目。\n第4：谈谈数据库索引。"
+        self.assertEqual(parse_plan(text), [
+            "请介绍一下Python的GIL。", "什么是装饰器？", "说说你做过的项目。", "谈谈数据库索引。"
+        ])
+
+    def test_follow_up_only_for_weak_answers(self):
+        from .planner import needs_follow_up
+
+        self.assertTrue(needs_follow_up("嗯"))
+        self.assertTrue(needs_follow_up("这个我不太清楚，之前没有接触过相关的内容"))
+        self.assertFalse(needs_follow_up("装饰器本质上是一个接收函数并返回新函数的高阶函数，常用于日志和鉴权。"))
+
+    def test_plan_skips_questions_already_asked(self):
+        import asyncio
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock, patch
+        from django.core.cache import cache
+        from . import planner
+
+        scenario = SimpleNamespace(technology_field="后端开发", description="技术面")
+        agenerate = AsyncMock(return_value={"success": True, "content": "1. 请介绍一下你自己。\n2. 什么是装饰器？"})
+
+        async def run():
+            with patch.object(planner, "_load_plan_context", return_value=(scenario, None, ["请介绍一下你自己。"])), \
+                    patch.object(planner.spark_ai_engine, "agenerate", agenerate), \
+                    patch.object(planner, "synthesize", AsyncMock()):
+                await planner._create_plan(903)
+            return await planner.take_planned_question(903), await planner.take_planned_question(903)
+
+        try:
+            self.assertEqual(asyncio.run(run()), ("什么是装饰器？", None))
+        finally:
+            cache.delete("interview_plan_903")
+        self.assertIn("已经问过的问题：\n请介绍一下你自己。", agenerate.await_args.args[0])
+
+
+class SpeculationTests(SimpleTestCase):
+    """推测性出题测试"""
+
+    def test_uses_matching_speculation_and_discards_others(self):
+        import asyncio
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from django.test import override_settings
+        from . import speculation
+
+        async def generate(prompt, history):
+            return "能具体说说你是怎么做的吗？", 1.5
+
+        async def run():
+            with override_settings(INTERVIEW_SPECULATION_ENABLED=True, INTERVIEW_SPECULATION_MAX_PER_SESSION=2), \
+                    patch.object(speculation, "_generate", generate), \
+                    patch.object(speculation, "has_planned_questions", return_value=True), \
+                    patch.dict(speculation._counters, {key: 0 for key in speculation._counters}):
+                await speculation.speculate(801, "介绍一下你的项目。")
+                await asyncio.sleep(0)
+                self.assertEqual(await speculation.claim(801, speculation.KIND_FOLLOW_UP), "能具体说说你是怎么做的吗？")
+
+                await speculation.speculate(801, "说说Redis的持久化。")
+                self.assertIsNone(await speculation.claim(801, speculation.KIND_NEXT))  # 类型不符，丢弃
+                self.assertIsNone(await speculation.speculate(801, "第三个问题"))  # 超出会话推测次数上限
+                return speculation.stats()
+
+        try:
+            stats = asyncio.run(run())
+        finally:
+            cache.delete("interview_speculation_count_801")
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["capped"], 1)
+        self.assertGreater(stats["saved_seconds"], 0)
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_starts_in_background_and_discards_on_session_end(self):
+        import asyncio
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from django.test import override_settings
+        from . import speculation
+
+        async def generate(prompt, history):
+            await asyncio.sleep(1)
+
+        async def run():
+            with override_settings(INTERVIEW_SPECULATION_ENABLED=True), \
+                    patch.object(speculation, "_generate", generate), \
+                    patch.object(speculation, "has_planned_questions", return_value=True):
+                starting = speculation.start(802, "介绍一下你的项目。")
+                self.assertNotIn(802, speculation._speculations)  # 不等待推测启动即返回
+                speculation.discard(802)  # 启动完成前会话结束，不再登记
+                await asyncio.gather(starting, return_exceptions=True)
+                self.assertNotIn(802, speculation._speculations)
+
+                await speculation.start(802, "说说Redis的持久化。")
+                task = speculation._speculations[802]["task"]
+                speculation.discard(802)
+                await asyncio.gather(task, return_exceptions=True)
+                return task.cancelled(), 802 in speculation._speculations or 802 in speculation._starting
+
+        try:
+            self.assertEqual(asyncio.run(run()), (True, False))
+        finally:
+            cache.delete("interview_speculation_count_802")
+
+
+class FrameSamplerTests(SimpleTestCase):
+    """按媒体时间戳抽帧测试"""
+
+    def test_samples_by_media_timestamp_with_first_and_last_frames(self):
+        import os
+        import tempfile
+        from .frame_sampler import FrameSampler, open_video, _write_synthetic_video
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "sample.webm")
+            _write_synthetic_video(path, 5, fps=10, size=(64, 48))
+
+            for mode in ("grab", "seek"):
+                frames, stats = FrameSampler(interval=2, mode=mode).sample(path)
+                self.assertEqual(stats["mode"], mode)
+                self.assertEqual([frame.index for frame in frames], [0, 20, 40, 49])
+                self.assertAlmostEqual(frames[1].timestamp, 2.0, places=1)
+                self.assertAlmostEqual(float(frames[-1].image[40:, :10].mean()), 49, delta=3)
+            self.assertEqual(stats["decoded"], 4)
+
+            # grab模式不回退定位：帧数已知时只retrieve最后1秒内的帧，帧数未知（无cues的webm）时保留每一帧
+            frames, stats = FrameSampler(interval=2, mode="grab").sample(path)
+            self.assertEqual((stats["seeks"], stats["decoded"]), (0, 3 + 9))
+            cap = open_video(path)
+            try:
+                stats = {"grabbed": 0, "decoded": 0, "seeks": 0}
+                frames = FrameSampler(interval=2)._sample_by_grab(cap, 0, 0, stats)
+            finally:
+                cap.release()
+            self.assertEqual([frame.index for frame in frames], [0, 20, 40, 49])
+            self.assertEqual((stats["seeks"], stats["decoded"]), (0, 50))
+            self.assertAlmostEqual(float(frames[-1].image[40:, :10].mean()), 49, delta=3)
+
+            with self.assertRaises(ValueError):
+                FrameSampler().sample(os.path.join(temp_dir, "missing.webm"))
+
+
+class VideoStreamTests(SimpleTestCase):
+    """视频片段增量解码测试"""
+
+    @staticmethod
+    def _record(seconds, fps=10):
+        """模拟 MediaRecorder：不可seek的输出，生成无索引的webm"""
+        import io
+        import av
+        import numpy as np
+
+        class Sink(io.RawIOBase):
+            def __init__(self):
+                self.data = bytearray()
+
+            def writable(self):
+                return True
+
+            def write(self, b):
+                self.data += b
+                return len(b)
+
+        sink = Sink()
+        with av.open(sink, mode="w", format="webm") as container:
+            stream = container.add_stream("libvpx", rate=fps)
+            stream.width, stream.height, stream.pix_fmt = 64, 48, "yuv420p"
+            for index in range(seconds * fps):
+                image = np.full((48, 64, 3), index % 255, np.uint8)
+                container.mux(stream.encode(av.VideoFrame.from_ndarray(image, format="bgr24")))
+            container.mux(stream.encode())
+        return bytes(sink.data)
+
+    def test_decodes_chunks_incrementally_and_restarts_on_new_header(self):
+        import asyncio
+        from .video_stream import VideoStream
+
+        data = self._record(5)
+        frames = []
+
+        async def analyze(frame):
+            frames.append((frame.index, round(frame.timestamp, 1), frame.image.shape))
+
+        async def run():
+            stream = VideoStream(analyze, interval=2)
+            for recording in (data, data):  # 第二次录制以新的webm头开始
+                for offset in range(0, len(recording), 1000):
+                    stream.feed(recording[offset:offset + 1000])
+                    await asyncio.sleep(0)
+            stream.close()
+            await asyncio.wait_for(stream.task, 10)
+
+        asyncio.run(run())
+        expected = [(0, 0.0, (48, 64, 3)), (20, 2.0, (48, 64, 3)), (40, 4.0, (48, 64, 3)), (49, 4.9, (48, 64, 3))]
+        self.assertEqual(frames, expected * 2)
+
+    def test_chunk_buffer_refuses_writes_beyond_limit(self):
+        from .video_stream import ChunkReader
+
+        reader = ChunkReader(max_bytes=10)
+        self.assertTrue(reader.write(b"x" * 6))
+        self.assertFalse(reader.write(b"x" * 6))
+        self.assertTrue(reader.write(b"x" * 4))
+        self.assertEqual(reader.read(), b"x" * 6)
+        self.assertTrue(reader.write(b"x" * 6))
+        self.assertEqual(ChunkReader(max_bytes=10).write(b"x" * 20), True)  # 缓冲为空时总是接受
+
+    def test_limits_decode_threads_and_drops_frames_when_analysis_lags(self):
+        import asyncio
+        import threading
+        from .video_stream import VideoStream
+
+        data = self._record(5)
+        frames = []
+
+        async def run():
+            release = asyncio.Event()
+
+            async def analyze(frame):
+                await release.wait()
+                frames.append(frame.index)
+
+            slots = threading.BoundedSemaphore(1)
+            first = VideoStream(analyze, interval=2, max_frames=1, decode_slots=slots)
+            second = VideoStream(analyze, interval=2, max_buffer=len(data), decode_slots=slots)
+            self.assertTrue(first.feed(data))
+
+            # 第一个会话解码完已收到的片段后等待新片段，不再占用唯一的名额；这里占用名额模拟其他会话正在解码
+            self.assertTrue(await asyncio.to_thread(slots.acquire, timeout=10))
+            self.assertTrue(second.feed(data))
+            self.assertFalse(second.feed(data[-10:]))  # 没有空闲名额，片段留在缓冲中，缓冲已满
+            slots.release()
+
+            # 第一个会话仍在进行（空闲），第二个会话照常解码
+            decoder = second._decoder
+            second.close()
+            await asyncio.to_thread(decoder.join, 10)
+            self.assertEqual(decoder.stats["decoded"], 50)
+            self.assertFalse(first._closed)
+
+            decoder = first._decoder
+            first.close()
+            await asyncio.to_thread(decoder.join, 10)
+            await asyncio.sleep(0.01)  # 解码线程投递的帧进入队列
+            release.set()
+            await asyncio.wait_for(asyncio.gather(first.task, second.task), 10)
+            return first.dropped_frames, second.dropped_frames
+
+        dropped, none_dropped = asyncio.run(run())
+        self.assertGreaterEqual(dropped, 2)
+        self.assertEqual(none_dropped, 0)
+        self.assertEqual(len(frames), 4 + 4 - dropped)
+
+    def test_consumer_replies_busy_when_video_is_refused(self):
+        import asyncio
+        import json
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock
+        from .consumers import LiveStreamConsumer
+
+        consumer = LiveStreamConsumer()
+        consumer.send = AsyncMock()
+        consumer.video_stream = SimpleNamespace(feed=lambda chunk: False, buffered=4096, max_buffer=4096)
+        asyncio.run(consumer._handle_video_chunk(b"webm", 1, seq=9))
+
+        busy = json.loads(consumer.send.await_args.kwargs["text_data"])
+        self.assertEqual((busy["type"], busy["media_type"], busy["seq"], busy["max_depth"]), ("busy", "video_chunk", 9, 4096))
+
+
+class FaceResultCacheTests(SimpleTestCase):
+    """表情分析感知哈希缓存测试"""
+
+    def test_reuses_results_for_near_identical_frames(self):
+        import asyncio
+        import numpy as np
+        from unittest.mock import AsyncMock
+        from .face_cache import FaceResultCache, dhash, hamming
+
+        rng = np.random.default_rng(0)
+        scene = rng.integers(0, 255, (120, 160, 3), dtype=np.uint8)
+        noisy = np.clip(scene.astype(int) + rng.integers(-3, 4, scene.shape), 0, 255).astype(np.uint8)
+        other = rng.integers(0, 255, (120, 160, 3), dtype=np.uint8)
+        self.assertLessEqual(hamming(dhash(scene), dhash(noisy)), 4)
+        self.assertGreater(hamming(dhash(scene), dhash(other)), 4)
+
+        analyze_batch = AsyncMock(side_effect=lambda images: [{"success": True, "data": {"n": i}} for i in range(len(images))])
+        call = AsyncMock(return_value={"success": True, "data": {"single": 1}})
+
+        async def run():
+            cache = FaceResultCache(threshold=4)
+            results = await cache.analyze_frames([scene, noisy, other], analyze_batch)
+            again = await cache.analyze(dhash(noisy), call)
+            return results, again, cache.stats()
+
+        results, again, stats = asyncio.run(run())
+        self.assertEqual(len(analyze_batch.await_args.args[0]), 2)  # 同一批中相近的帧只请求一次
+        self.assertIs(results[0], results[1])
+        self.assertIs(again, results[0])
+        call.assert_not_awaited()
+        self.assertEqual(stats, {"hits": 2, "misses": 2, "calls_saved": 2, "hit_ratio": 0.5})
+
+    def test_skips_results_without_faces(self):
+        from .face_cache import FaceResultCache
+
+        cache = FaceResultCache()
+        cache.store(1, {"success": True, "data": {}})
+        cache.store(2, {"success": False, "error": "超时"})
+        self.assertIsNone(cache.lookup(1))
+        self.assertIsNone(cache.lookup(2))
+
+    def test_background_lookup_does_not_recreate_released_cache(self):
+        from .face_cache import find_session_cache, get_session_cache, release_session_cache
+
+        created = get_session_cache(7001)
+        self.assertIs(find_session_cache(7001), created)
+        release_session_cache(7001)
+        self.assertIsNone(find_session_cache(7001))
+        self.assertIsNone(find_session_cache(7001))  # 查找不会重新创建
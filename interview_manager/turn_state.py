@@ -0,0 +1,107 @@
+# interview_manager/turn_state.py
+"""
+面试会话的轮次状态
+
+保存在Django缓存中（多进程部署时配置共享缓存即可跨进程使用），记录：
+- question_id / question_number / question_text：当前问题
+- audio_keys：当前问题语音在语音缓存中的键（按句流水线合成时为各句的键）
+- last_seq：最后一个已处理完成的回答消息序号
+
+WebSocket重连时据此回放当前问题，而不是重新生成问题（避免重复的问题记录和大模型、语音合成调用）。
+缓存中没有状态（过期、服务重启）时从数据库中最新的问题重建。
+正在生成问题的标记同样保存在缓存中，重连到其他工作进程时也能看到；进程异常退出时标记随TTL过期。
+"""
+import logging
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from evaluation_system.audio_generate_engine import audio_cache_key
+from .models import InterviewQuestion
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_key(session_id):
+    return f"interview_turn_state_{session_id}"
+
+
+def _in_flight_key(session_id):
+    return f"interview_question_in_flight_{session_id}"
+
+
+def _timeout():
+    return getattr(settings, "INTERVIEW_TURN_STATE_TTL", 6 * 3600)
+
+
+@asynccontextmanager
+async def question_in_flight(session_id):
+    """
+    标记会话正在生成问题，生成完成后问题会推送给会话组内的所有连接
+    缓存中保存正在生成的数量，计数归零后不删除键（避免与其他进程的计数竞争），随TTL过期
+    """
+    key = _in_flight_key(session_id)
+    timeout = getattr(settings, "INTERVIEW_QUESTION_IN_FLIGHT_TTL", 300)
+    await cache.aadd(key, 0, timeout)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, timeout)  # 键恰好过期
+    try:
+        yield
+    finally:
+        try:
+            await cache.adecr(key)
+        except ValueError:
+            pass  # 已过期
+
+
+async def is_question_in_flight(session_id):
+    return (await cache.aget(_in_flight_key(session_id)) or 0) > 0
+
+
+async def get_turn_state(session_id):
+    """获取会话轮次状态，缓存中没有时从数据库重建，会话还没有问题返回None"""
+    state = await cache.aget(_cache_key(session_id))
+    if state is not None:
+        return state
+
+    question = await sync_to_async(
+        InterviewQuestion.objects.filter(session_id=session_id).order_by("-question_number", "-asked_at").first
+    )()
+    if question is None:
+        return None
+    state = {
+        "question_id": question.id,
+        "question_number": question.question_number,
+        "question_text": question.question_text,
+        "audio_keys": [audio_cache_key(question.question_text)],
+        "last_seq": None
+    }
+    await cache.aset(_cache_key(session_id), state, _timeout())
+    logger.info(f"已从数据库重建会话 {session_id} 的轮次状态")
+    return state
+
+
+async def set_current_question(session_id, question, audio_keys):
+    """记录会话的当前问题"""
+    state = await cache.aget(_cache_key(session_id)) or {"last_seq": None}
+    state.update(
+        question_id=question.id,
+        question_number=question.question_number,
+        question_text=question.question_text,
+        audio_keys=list(audio_keys)
+    )
+    await cache.aset(_cache_key(session_id), state, _timeout())
+
+
+async def acknowledge_sequence(session_id, seq):
+    """记录已处理完成的回答消息序号（只增不减）"""
+    state = await get_turn_state(session_id)
+    if state is None:
+        return
+    if state["last_seq"] is None or seq > state["last_seq"]:
+        state["last_seq"] = seq
+        await cache.aset(_cache_key(session_id), state, _timeout())
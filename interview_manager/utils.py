@@ -6,7 +6,7 @@ from .models import InterviewSession, InterviewQuestion
 from channels.layers import get_channel_layer
 
 logger = logging.getLogger(__name__)
-async def send_audio_and_text_to_client(session_id, audio_data, question_text):
+async def send_audio_and_text_to_client(session_id, audio_data, question_text, audio_streaming=False):
     try:
         channel_layer = get_channel_layer()
         # 确保audio_data是bytes类型
@@ -18,7 +18,8 @@ async def send_audio_and_text_to_client(session_id, audio_data, question_text):
             {
                 "type": "send_audio_and_text",
                 "audio_data": audio_data,  # 发送bytes数据
-                "question_text": question_text
+                "question_text": question_text,
+                "audio_streaming": audio_streaming  # 为True时音频随后以question_audio_chunk分段发送
             }
         )
         logger.info(f"已安排发送音频和文本到会话 {session_id}")
@@ -26,6 +27,58 @@ async def send_audio_and_text_to_client(session_id, audio_data, question_text):
         logger.error(f"安排发送音频和文本失败: {str(e)}", exc_info=True)
 
 
+async def send_audio_chunk_to_client(session_id, audio_chunk, index, is_last=False):
+    """发送流式合成的问题语音片段"""
+    channel_layer = get_channel_layer()
+    await channel_layer.group_send(
+        f"interview_session_{session_id}",
+        {
+            "type": "send_audio_chunk",
+            "audio_data": audio_chunk,
+            "index": index,
+            "is_last": is_last
+        }
+    )
+
+
+async def send_question_audio_start_to_client(session_id, question_text):
+    """流水线模式下问题文本尚未生成完，先于第一个语音片段发送的开始标记，携带已生成的问题文本"""
+    channel_layer = get_channel_layer()
+    await channel_layer.group_send(
+        f"interview_session_{session_id}",
+        {
+            "type": "send_question_audio_start",
+            "question_text": question_text
+        }
+    )
+
+
+async def send_question_delta_to_client(session_id, delta, index, reset=False):
+    """发送流式生成的问题文本片段，reset为True时客户端应清空已显示的片段"""
+    channel_layer = get_channel_layer()
+    await channel_layer.group_send(
+        f"interview_session_{session_id}",
+        {
+            "type": "send_question_delta",
+            "delta": delta,
+            "index": index,
+            "reset": reset
+        }
+    )
+
+
+async def send_evaluation_ready_to_client(session_id, evaluation):
+    """推送后台完成的回答评估结果"""
+    channel_layer = get_channel_layer()
+    await channel_layer.group_send(
+        f"interview_session_{session_id}",
+        {
+            "type": "send_evaluation_ready",
+            "evaluation": evaluation
+        }
+    )
+
+
 async def send_audio_to_client(session_id, audio_data):
     channel_layer = get_channel_layer()
     group_name = f"interview_session_{session_id}"
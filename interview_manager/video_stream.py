@@ -0,0 +1,254 @@
+# interview_manager/video_stream.py
+"""
+会话视频流的增量解码
+
+浏览器 MediaRecorder 录制的视频按片段发送，只有第一个片段带有 webm 头，之后的片段单独无法解码。
+每个会话保持一个解复用/解码器（PyAV），片段直接在内存中送入解码线程，按媒体时间戳持续抽帧：
+- ChunkReader：阻塞式的类文件对象，事件循环写入片段，解码线程读取，读过的片段即释放；
+- StreamingFrameDecoder：在线程中解码，只把选中的帧转换为 BGR 图像（首帧和最后一帧总会选中）；
+- VideoStream：事件循环一侧的封装，把选中的帧交给分析协程；客户端重新开始录制
+  （片段以 EBML 头开始）时自动切换到新的解码器。
+不经过文件系统，内存占用与录制时长无关。
+
+背压：未读取的片段字节数、等待分析的帧数都有上限，同时解码的线程数由进程共享的信号量限制；
+解码线程只在有片段可读、正在解码时占用名额，等待客户端发送片段时释放，空闲的会话不占用名额。
+没有空闲名额时片段留在缓冲中，缓冲已满时 feed() 拒绝片段（返回False，由调用方回复繁忙），帧队列已满时丢弃新选中的帧。
+"""
+import asyncio
+import logging
+import threading
+from collections import deque
+
+import av
+
+from .frame_sampler import SampledFrame
+
+logger = logging.getLogger(__name__)
+
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"  # webm(Matroska)文件头
+
+_END = object()  # 解码线程结束标记
+
+
+class ChunkReader:
+    """
+    事件循环写入、解码线程阻塞读取的片段缓冲
+    slot 为进程共享的解码名额（信号量），读取线程等待片段时释放，读到片段后重新占用
+    """
+
+    def __init__(self, max_bytes=None, slot=None):
+        self.max_bytes = max_bytes  # 未读取字节数上限，None表示不限制
+        self.slot = slot
+        self._holding_slot = False
+        self._chunks = deque()
+        self._offset = 0  # 第一个片段已读取的字节数
+        self._finished = False
+        self._condition = threading.Condition()
+        self.buffered = 0  # 已写入未读取的字节数
+
+    def write(self, chunk):
+        """写入片段，超出缓冲上限时拒绝并返回False（缓冲为空时总是接受，避免单个大片段永远无法写入）"""
+        with self._condition:
+            if self._finished:
+                raise ValueError("视频流已结束")
+            if self.max_bytes is not None and self.buffered and self.buffered + len(chunk) > self.max_bytes:
+                return False
+            self._chunks.append(chunk)
+            self.buffered += len(chunk)
+            self._condition.notify()
+            return True
+
+    def finish(self):
+        """不再写入，读取方读完剩余数据后得到EOF"""
+        with self._condition:
+            self._finished = True
+            self._condition.notify()
+
+    def read(self, size=-1):
+        with self._condition:
+            if not self._chunks and not self._finished:
+                self.release_slot()  # 等待片段期间不占用解码名额
+            while not self._chunks and not self._finished:
+                self._condition.wait()
+        self._acquire_slot()  # 不持有锁等待名额，避免阻塞事件循环写入
+
+        with self._condition:
+            if not self._chunks:
+                return b""
+
+            chunk = self._chunks[0]
+            if size is None or size < 0:
+                size = len(chunk) - self._offset
+            data = chunk[self._offset:self._offset + size]
+            self._offset += len(data)
+            if self._offset >= len(chunk):
+                self._chunks.popleft()
+                self._offset = 0
+            self.buffered -= len(data)
+            return data
+
+    def release_slot(self):
+        """释放读取线程占用的解码名额（只在读取线程中调用）"""
+        if self._holding_slot:
+            self._holding_slot = False
+            self.slot.release()
+
+    def _acquire_slot(self):
+        if self.slot is not None and not self._holding_slot:
+            self.slot.acquire()
+            self._holding_slot = True
+
+
+class StreamingFrameDecoder:
+    """在线程中增量解码一段连续的webm视频流，按媒体时间戳抽帧"""
+
+    def __init__(self, on_frame, interval=10.0, name="video", previous=None, max_buffer=None, slot=None):
+        self.on_frame = on_frame  # 在解码线程中调用：选中的帧(SampledFrame)，结束时为 _END
+        self.interval = interval  # 抽帧间隔(单位:s)
+        self.previous = previous  # 上一段视频流的解码器，等它结束后再开始解码，保证帧的顺序
+        self.reader = ChunkReader(max_buffer, slot)  # slot: 进程共享的解码名额，只在解码时占用
+        self.stats = {"chunks": 0, "bytes": 0, "decoded": 0, "selected": 0, "refused": 0}
+        self._thread = threading.Thread(target=self._run, name=f"decode-{name}", daemon=True)
+
+    def feed(self, chunk):
+        """送入一个视频片段（不阻塞），缓冲已满时返回False"""
+        if not self.reader.write(chunk):
+            self.stats["refused"] += 1
+            return False
+        self.stats["chunks"] += 1
+        self.stats["bytes"] += len(chunk)
+        if self._thread.ident is None:
+            self._thread.start()
+        return True
+
+    def finish(self):
+        """视频流结束，解码线程处理完剩余数据后退出"""
+        self.reader.finish()
+        if self._thread.ident is None:
+            self._thread.start()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _run(self):
+        if self.previous is not None:
+            self.previous.join()
+            self.previous = None
+
+        next_timestamp = 0.0
+        last = None  # 最后解码的帧及是否已选中
+        try:
+            with av.open(self.reader, mode="r", format="webm") as container:
+                stream = container.streams.video[0]
+                for index, frame in enumerate(container.decode(stream)):
+                    self.stats["decoded"] += 1
+                    timestamp = frame.time if frame.time is not None else index / float(stream.average_rate or 30)
+                    selected = timestamp >= next_timestamp
+                    if selected:
+                        self._emit(index, timestamp, frame)
+                        next_timestamp = (int(timestamp // self.interval) + 1) * self.interval
+                    last = (index, timestamp, frame, selected)
+        except av.FFmpegError as e:
+            logger.warning(f"视频流解码中断: {str(e)}")
+        except Exception as e:
+            logger.error(f"视频流解码出错: {str(e)}", exc_info=True)
+        finally:
+            try:
+                if last is not None and not last[3]:
+                    self._emit(*last[:3])
+            finally:
+                logger.info(
+                    f"视频流 {self._thread.name} 解码结束: 接收 {self.stats['chunks']}个片段 {self.stats['bytes']} bytes，"
+                    f"拒绝 {self.stats['refused']}个片段，解码 {self.stats['decoded']}帧，选中 {self.stats['selected']}帧"
+                )
+                self.reader.release_slot()
+                self.on_frame(_END)
+
+    def _emit(self, index, timestamp, frame):
+        self.stats["selected"] += 1
+        self.on_frame(SampledFrame(index, timestamp, frame.to_ndarray(format="bgr24")))
+
+
+class VideoStream:
+    """
+    会话的视频流（需在事件循环中创建和调用）
+    analyze 为处理选中帧的协程函数，按帧的顺序逐个调用
+    max_buffer: 每个解码器未读取片段的字节数上限；max_frames: 等待分析的帧数上限；
+    decode_slots: 进程共享的解码名额信号量（threading.BoundedSemaphore），限制同时解码的线程数，None表示不限制
+    """
+
+    def __init__(self, analyze, interval=10.0, name="video", max_buffer=None, max_frames=None, decode_slots=None):
+        self.analyze = analyze
+        self.interval = interval
+        self.name = name
+        self.max_buffer = max_buffer
+        self.max_frames = max_frames
+        self.decode_slots = decode_slots
+        self.dropped_frames = 0
+        self._loop = asyncio.get_running_loop()
+        self._frames = asyncio.Queue()
+        self._decoder = None
+        self._decoders = 0  # 尚未结束的解码器数量
+        self._closed = False
+        self.task = self._loop.create_task(self._consume())
+
+    @property
+    def buffered(self):
+        """当前解码器未读取的字节数"""
+        return self._decoder.reader.buffered if self._decoder is not None else 0
+
+    def feed(self, chunk):
+        """送入客户端发来的视频片段，片段缓冲已满（解码跟不上或长时间没有空闲的解码名额）时拒绝并返回False"""
+        if self._closed:
+            raise ValueError("视频流已关闭")
+        restart = chunk.startswith(EBML_MAGIC) and self._decoder is not None
+        if self._decoder is None or restart:
+            previous = None
+            if restart:
+                # 客户端重新开始录制，之前的流到此结束
+                previous, self._decoder = self._decoder, None
+                previous.finish()
+            self._decoder = StreamingFrameDecoder(
+                self._deliver, self.interval, self.name, previous, self.max_buffer, self.decode_slots
+            )
+            self._decoders += 1
+        if not self._decoder.feed(chunk):
+            logger.warning(f"视频流 {self.name} 片段缓冲已满（{self._decoder.reader.buffered} bytes），拒绝片段")
+            return False
+        return True
+
+    def close(self):
+        """结束视频流，剩余的帧在后台继续分析"""
+        self._closed = True
+        if self._decoder is not None:
+            self._decoder.finish()
+            self._decoder = None
+        elif self._decoders == 0:
+            self._frames.put_nowait(_END)
+
+    def _deliver(self, item):
+        try:
+            self._loop.call_soon_threadsafe(self._put_frame, item)
+        except RuntimeError:
+            pass  # 事件循环已关闭（服务退出）
+
+    def _put_frame(self, item):
+        """在事件循环中入队，分析跟不上时丢弃新选中的帧（结束标记总是入队）"""
+        if item is not _END and self.max_frames is not None and self._frames.qsize() >= self.max_frames:
+            self.dropped_frames += 1
+            logger.warning(f"视频流 {self.name} 等待分析的帧已达上限（{self.max_frames}），丢弃第 {item.index} 帧")
+            return
+        self._frames.put_nowait(item)
+
+    async def _consume(self):
+        while True:
+            item = await self._frames.get()
+            if item is _END:
+                self._decoders -= 1
+                if self._closed and self._decoders <= 0:
+                    return
+                continue
+            try:
+                await self.analyze(item)
+            except Exception as e:
+                logger.error(f"分析视频帧失败: {str(e)}", exc_info=True)
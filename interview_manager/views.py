@@ -9,6 +9,7 @@ from rest_framework.permissions import IsAuthenticated
 from evaluation_system.models import ResponseMetadata, ResponseAnalysis, AnswerEvaluation, OverallInterviewEvaluation, \
     ResumeEvaluation
 from .models import InterviewScenario, InterviewSession, InterviewQuestion
+from .question_pool import schedule_first_question
 from .serializers import InterviewScenarioSerializer, InterviewSessionSerializer, InterviewQuestionSerializer
 from evaluation_system.serializers import ResponseMetadataSerializer, ResponseAnalysisSerializer, \
     AnswerEvaluationSerializer, OverallInterviewEvaluationSerializer, ResumeEvaluationSerializer
@@ -51,6 +52,9 @@ class InterviewSessionViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
 
+        # 在客户端准备摄像头/麦克风、建立WebSocket连接期间提前生成首问
+        schedule_first_question(serializer.instance.id, scenario.id)
+
         # 返回包含 session_id 的响应
         headers = self.get_success_headers(serializer.data)
         return Response(